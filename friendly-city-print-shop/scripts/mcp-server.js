@@ -3,11 +3,43 @@ const http = require('http');
 const url = require('url');
 
 const PORT = process.env.PORT || process.env.MCP_PORT || 39300;
+// An already-listening socket inherited from the parent (set by the test
+// harness so the port cannot be taken between choosing and binding it).
+const LISTEN_FD = process.env.LISTEN_FD;
 const clients = new Set();
 
 function sendSSE(res, event, data) {
-    res.write(`event: ${event}\n`);
-    res.write(`data: ${JSON.stringify(data)}\n\n`);
+    // One write per event: a batch (array) goes out as a single event too
+    res.write(`event: ${event}\ndata: ${JSON.stringify(data)}\n\n`);
+}
+
+// Echo a POSTed message, or a JSON-RPC batch (array) of them, to every SSE client.
+function broadcastPost(req, res, label) {
+    let body = '';
+    req.on('data', (chunk) => (body += chunk));
+    req.on('end', () => {
+        try {
+            const message = JSON.parse(body);
+            if (Array.isArray(message) && message.length === 0) {
+                throw new Error('empty batch');
+            }
+            // Send the raw message directly, not wrapped in a "message" object
+            for (const client of clients) {
+                sendSSE(client, 'message', message);
+            }
+            // Log the broadcasting event to stdout to help tests detect activity
+            console.log(label, {
+                payload: body,
+                clients: clients.size,
+                ...(Array.isArray(message) ? { batch: message.length } : {}),
+            });
+            res.writeHead(200, { 'Content-Type': 'application/json' });
+            res.end(JSON.stringify({ delivered: true, clients: clients.size }));
+        } catch (err) {
+            res.writeHead(400, { 'Content-Type': 'application/json' });
+            res.end(JSON.stringify({ error: 'invalid json', msg: err.message }));
+        }
+    });
 }
 
 const server = http.createServer((req, res) => {
@@ -26,7 +58,7 @@ const server = http.createServer((req, res) => {
         // their POST writer (matches mcp.client.sse expectations)
         sendSSE(res, 'endpoint', '/model_context_protocol/2024-11-05/message');
         sendSSE(res, 'connected', { id });
-        console.log('Client connected', { id, totalClients: clients.size });
+        console.log('Client connected', { id, totalClients: clients.size, ...(parsed.query.client ? { client: parsed.query.client } : {}) });
         req.on('close', () => {
             clients.delete(res);
             console.log('Client disconnected', { id, totalClients: clients.size });
@@ -35,52 +67,13 @@ const server = http.createServer((req, res) => {
     }
 
     if (req.method === 'POST' && parsed.pathname === '/model_context_protocol/2024-11-05/message') {
-        let body = '';
-        req.on('data', (chunk) => (body += chunk));
-        req.on('end', () => {
-            try {
-                const message = JSON.parse(body);
-                // Send the raw message directly, not wrapped in a "message" object
-                for (const client of clients) {
-                    sendSSE(client, 'message', message);
-                }
-                // Log the broadcasting event to stdout to help tests detect activity
-                console.log('Broadcasting response', {
-                    payload: body,
-                    clients: clients.size,
-                });
-                res.writeHead(200, { 'Content-Type': 'application/json' });
-                res.end(JSON.stringify({ delivered: true, clients: clients.size }));
-            } catch (err) {
-                res.writeHead(400, { 'Content-Type': 'application/json' });
-                res.end(JSON.stringify({ error: 'invalid json', msg: err.message }));
-            }
-        });
+        broadcastPost(req, res, 'Broadcasting response');
         return;
     }
 
     // Handle malformed URL from gateway (URL-encoded quotes issue)
     if (req.method === 'POST' && parsed.pathname === '/model_context_protocol/2024-11-05/%22/model_context_protocol/2024-11-05/message%22') {
-        let body = '';
-        req.on('data', (chunk) => (body += chunk));
-        req.on('end', () => {
-            try {
-                const message = JSON.parse(body);
-                // Send the raw message directly, not wrapped in a "message" object
-                for (const client of clients) {
-                    sendSSE(client, 'message', message);
-                }
-                console.log('Broadcasting response (malformed URL fix)', {
-                    payload: body,
-                    clients: clients.size,
-                });
-                res.writeHead(200, { 'Content-Type': 'application/json' });
-                res.end(JSON.stringify({ delivered: true, clients: clients.size }));
-            } catch (err) {
-                res.writeHead(400, { 'Content-Type': 'application/json' });
-                res.end(JSON.stringify({ error: 'invalid json', msg: err.message }));
-            }
-        });
+        broadcastPost(req, res, 'Broadcasting response (malformed URL fix)');
         return;
     }
 
@@ -94,7 +87,7 @@ const server = http.createServer((req, res) => {
     res.end(JSON.stringify({ error: 'not_found' }));
 });
 
-server.listen(PORT, () => {
+server.listen(LISTEN_FD ? { fd: Number(LISTEN_FD) } : PORT, () => {
     console.log(`MCP SSE mock server listening on http://localhost:${PORT}`);
     console.log('SSE endpoint: /model_context_protocol/2024-11-05/sse');
     console.log('POST messages at /model_context_protocol/2024-11-05/message');
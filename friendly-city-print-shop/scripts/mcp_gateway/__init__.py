@@ -0,0 +1 @@
+"""Helpers shared by `py-run-mcp-gateway.py`, the MCP test harness and the debug scripts."""
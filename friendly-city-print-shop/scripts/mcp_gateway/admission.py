@@ -0,0 +1,404 @@
+"""Admission control, priority lanes, backpressure and cancellation for the gateway wrapper.
+
+`AdmissionController.filter` sits between a transport's streams and the
+MCP server session (`install_admission_control` wraps `Server.run`, so
+stdio and every `--listen` client go through it).
+
+Requests are split into two lanes. The `control` lane holds session
+setup and listing (`CONTROL_METHODS`), and the `tools` lane holds
+everything else, mainly `tools/call`. A request:
+
+- runs straight away if it is allowed to and nothing eligible is queued
+  ahead of it in its lane;
+- otherwise waits in its lane for at most `queue_timeout` seconds, with
+  at most `max_queued` requests waiting over both lanes;
+- is answered at once with an `OVERLOADED` JSON-RPC error when the
+  queues are full, and with `REQUEST_TIMEOUT` when it waited too long.
+
+`tools` requests may run while fewer than `max_in_flight` requests (over
+all connections) are running, and no more than `tool_limits[name]` calls
+of a limited tool run at once. A call held back by its tool's limit does
+not hold up calls to other tools. `control` requests may also use
+`control_slots` extra slots, so they never wait behind slow tool calls
+holding every regular slot. When a slot frees up and both lanes have an
+eligible request, the lanes are served by smooth weighted round robin:
+`control_weight` control requests for each tool request. Neither lane
+can starve, and within a lane the order is first come, first served.
+
+A slot is released when the request's response is written. With a
+`request_timeout`, a request still running that long after it arrived is
+cancelled through the session (as if the client had sent
+`notifications/cancelled`) and answered with `REQUEST_TIMEOUT`.
+`notifications/cancelled` for a queued request removes it from the queue;
+for a running one it is passed on and the session cancels the handler.
+
+A handler cancelled while waiting on the upstream leaves the upstream
+request running unless it is told: `install_upstream_cancellation` makes
+`ClientSession.send_request` send `notifications/cancelled` upstream when
+it is cancelled. The id cancelled is the one of the request the session
+actually wrote, as seen on its write stream.
+"""
+import collections
+import contextvars
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Deque, Dict, Iterable, Optional, Set, Tuple
+
+import anyio
+import mcp.types as types
+from mcp.shared.message import SessionMessage
+
+# JSON-RPC server error codes. -32001 is the MCP SDKs' request timeout.
+OVERLOADED = -32029
+REQUEST_TIMEOUT = -32001
+
+CONTROL = 'control'
+TOOLS = 'tools'
+CONTROL_METHODS = frozenset({
+    'initialize', 'ping', 'tools/list', 'resources/list', 'resources/templates/list', 'prompts/list',
+    'logging/setLevel',
+})
+
+DEFAULT_MAX_IN_FLIGHT = 32
+DEFAULT_MAX_QUEUED = 128
+DEFAULT_QUEUE_TIMEOUT = 10.0
+DEFAULT_CONTROL_SLOTS = 4
+DEFAULT_CONTROL_WEIGHT = 4
+# How often queued and running requests are checked against their deadlines
+_REAP_INTERVAL = 0.05
+
+
+def parse_tool_limits(specs: Iterable[str]) -> Dict[str, int]:
+    """Parse `name=max_concurrent` CLI values into a limit dict."""
+    limits = {}
+    for spec in specs:
+        name, sep, limit = spec.partition('=')
+        if not sep or not name:
+            raise ValueError(f"expected TOOL=MAX_CONCURRENT, got {spec!r}")
+        limits[name] = int(limit)
+        if limits[name] < 1:
+            raise ValueError(f"limit for {name!r} must be >= 1")
+    return limits
+
+
+def _error(msg_id: Any, code: int, message: str) -> SessionMessage:
+    return SessionMessage(types.JSONRPCMessage(types.JSONRPCError(
+        jsonrpc='2.0', id=msg_id, error=types.ErrorData(code=code, message=message))))
+
+
+def _classify(root: types.JSONRPCRequest) -> Tuple[str, Optional[str]]:
+    """(lane, tool name or None) of a request."""
+    if root.method in CONTROL_METHODS:
+        return CONTROL, None
+    if root.method == 'tools/call' and isinstance(root.params, dict):
+        return TOOLS, root.params.get('name')
+    return TOOLS, None
+
+
+class _Queued:
+    __slots__ = ('connection', 'message', 'msg_id', 'lane', 'tool', 'arrived', 'deadline')
+
+    def __init__(self, connection: '_Connection', message: SessionMessage, msg_id: Any, lane: str,
+                 tool: Optional[str], arrived: float, deadline: Optional[float]):
+        self.connection = connection
+        self.message = message
+        self.msg_id = msg_id
+        self.lane = lane
+        self.tool = tool
+        self.arrived = arrived
+        self.deadline = deadline
+
+
+class _Connection:
+    """Admission state of one transport connection (its id space)."""
+
+    def __init__(self, write_stream):
+        self.write_stream = write_stream
+        self.to_session, self.session_reader = anyio.create_memory_object_stream(math.inf)
+        # Running request id -> (time it must finish by or None, tool name or None)
+        self.running: Dict[Any, Tuple[Optional[float], Optional[str]]] = {}
+        self.queued: Dict[Any, _Queued] = {}
+        # Cancelled for their deadline; the session's answer is rewritten
+        self.timed_out: Set[Any] = set()
+
+
+class AdmissionController:
+    """Cap requests in flight per lane and per tool, queue a bounded number, reject the rest."""
+
+    def __init__(
+        self,
+        max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+        max_queued: int = DEFAULT_MAX_QUEUED,
+        queue_timeout: Optional[float] = DEFAULT_QUEUE_TIMEOUT,
+        request_timeout: Optional[float] = None,
+        control_slots: int = DEFAULT_CONTROL_SLOTS,
+        control_weight: int = DEFAULT_CONTROL_WEIGHT,
+        tool_limits: Optional[Dict[str, int]] = None,
+    ):
+        if max_in_flight < 1:
+            raise ValueError('max_in_flight must be >= 1')
+        if control_weight < 1:
+            raise ValueError('control_weight must be >= 1')
+        self.max_in_flight = max_in_flight
+        self.max_queued = max(0, max_queued)
+        self.queue_timeout = queue_timeout or None
+        self.request_timeout = request_timeout or None
+        self.control_slots = max(0, control_slots)
+        self.tool_limits = dict(tool_limits or {})
+        self.in_flight = 0
+        self._lanes: Dict[str, Deque[_Queued]] = {CONTROL: collections.deque(), TOOLS: collections.deque()}
+        self._weights = {CONTROL: control_weight, TOOLS: 1}
+        self._credits = {CONTROL: 0, TOOLS: 0}
+        self._tools_in_flight: Dict[str, int] = collections.Counter()
+        self._counts = dict.fromkeys(
+            ('admitted', 'admitted_control', 'queued_total', 'rejected', 'expired', 'cancelled_queued', 'timed_out',
+             'upstream_cancelled'), 0)
+
+    def stats(self) -> dict:
+        return {
+            'in_flight': self.in_flight,
+            'queued': len(self._lanes[CONTROL]) + len(self._lanes[TOOLS]),
+            'queued_control': len(self._lanes[CONTROL]),
+            'queued_tools': len(self._lanes[TOOLS]),
+            **self._counts,
+            'limited_tools_in_flight': {name: self._tools_in_flight[name] for name in self.tool_limits},
+        }
+
+    def count_upstream_cancelled(self):
+        """Record that a cancelled request was also cancelled upstream."""
+        self._counts['upstream_cancelled'] += 1
+
+    @asynccontextmanager
+    async def filter(self, read_stream, write_stream):
+        """Yield `(read_stream, write_stream)` for the session, with admission applied."""
+        connection = _Connection(write_stream)
+        from_session, session_writes = anyio.create_memory_object_stream(0)
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(self._pump_in, connection, read_stream)
+            tg.start_soon(self._pump_out, connection, session_writes)
+            if self.queue_timeout or self.request_timeout:
+                tg.start_soon(self._reap, connection)
+            try:
+                yield connection.session_reader, from_session
+            finally:
+                tg.cancel_scope.cancel()
+                self._close(connection)
+
+    async def _pump_in(self, connection: _Connection, read_stream):
+        async with connection.to_session:
+            async for item in read_stream:
+                root = getattr(getattr(item, 'message', None), 'root', None)
+                if isinstance(root, types.JSONRPCRequest):
+                    await self._arrive(connection, item, root)
+                    continue
+                if isinstance(root, types.JSONRPCNotification) and root.method == 'notifications/cancelled':
+                    queued = connection.queued.pop((root.params or {}).get('requestId'), None)
+                    if queued is not None:
+                        # Never admitted, so there is nothing to cancel and no response is due
+                        self._lanes[queued.lane].remove(queued)
+                        self._counts['cancelled_queued'] += 1
+                        continue
+                await connection.to_session.send(item)
+
+    async def _arrive(self, connection: _Connection, message: SessionMessage, root: types.JSONRPCRequest):
+        now = time.monotonic()
+        lane, tool = _classify(root)
+        deadline = now + self.queue_timeout if self.queue_timeout else None
+        queued = _Queued(connection, message, root.id, lane, tool, now, deadline)
+        # Queue it and let the scheduler decide, so it cannot overtake eligible requests in its lane
+        self._lanes[lane].append(queued)
+        connection.queued[root.id] = queued
+        self._dispatch()
+        if connection.queued.get(root.id) is not queued:
+            return
+        waiting = len(self._lanes[CONTROL]) + len(self._lanes[TOOLS])
+        if waiting > self.max_queued:
+            del connection.queued[root.id]
+            self._lanes[lane].remove(queued)
+            self._counts['rejected'] += 1
+            await connection.write_stream.send(_error(
+                root.id, OVERLOADED,
+                f"Gateway overloaded: {self.in_flight} requests in flight and {waiting - 1} queued"))
+        else:
+            self._counts['queued_total'] += 1
+
+    def _eligible(self, queued: _Queued) -> bool:
+        if queued.lane == CONTROL:
+            return self.in_flight < self.max_in_flight + self.control_slots
+        if self.in_flight >= self.max_in_flight:
+            return False
+        limit = self.tool_limits.get(queued.tool)
+        return limit is None or self._tools_in_flight[queued.tool] < limit
+
+    def _dispatch(self):
+        """Admit queued requests while any may run, sharing slots between the lanes by weight."""
+        while True:
+            ready = {}
+            for lane, queue in self._lanes.items():
+                # The first eligible entry: a call held by its tool's limit does not block the others
+                queued = next((q for q in queue if self._eligible(q)), None)
+                if queued is not None:
+                    ready[lane] = queued
+            if not ready:
+                return
+            # Smooth weighted round robin over the lanes with work
+            for lane in ready:
+                self._credits[lane] += self._weights[lane]
+            lane = max(ready, key=self._credits.__getitem__)
+            self._credits[lane] -= sum(self._weights[name] for name in ready)
+            queued = ready[lane]
+            self._lanes[lane].remove(queued)
+            del queued.connection.queued[queued.msg_id]
+            self._admit(queued)
+
+    def _admit(self, queued: _Queued):
+        connection = queued.connection
+        try:
+            connection.to_session.send_nowait(queued.message)
+        except (anyio.ClosedResourceError, anyio.BrokenResourceError):
+            # The client hung up while this request was queued
+            return
+        self.in_flight += 1
+        self._counts['admitted'] += 1
+        if queued.lane == CONTROL:
+            self._counts['admitted_control'] += 1
+        if queued.tool is not None:
+            self._tools_in_flight[queued.tool] += 1
+        deadline = queued.arrived + self.request_timeout if self.request_timeout else None
+        connection.running[queued.msg_id] = (deadline, queued.tool)
+
+    def _release(self, tool: Optional[str]):
+        self.in_flight -= 1
+        if tool is not None:
+            self._tools_in_flight[tool] -= 1
+            if not self._tools_in_flight[tool]:
+                del self._tools_in_flight[tool]
+
+    async def _pump_out(self, connection: _Connection, session_writes):
+        # Closes the transport's write stream too, as the session would unfiltered
+        async with session_writes, connection.write_stream:
+            async for item in session_writes:
+                root = item.message.root
+                if isinstance(root, (types.JSONRPCResponse, types.JSONRPCError)) and root.id in connection.running:
+                    if root.id in connection.timed_out and isinstance(root, types.JSONRPCError):
+                        item = _error(root.id, REQUEST_TIMEOUT, f"Request exceeded the {self.request_timeout:g}s timeout")
+                    connection.timed_out.discard(root.id)
+                    _deadline, tool = connection.running.pop(root.id)
+                    self._release(tool)
+                    self._dispatch()
+                await connection.write_stream.send(item)
+
+    async def _reap(self, connection: _Connection):
+        while True:
+            await anyio.sleep(_REAP_INTERVAL)
+            now = time.monotonic()
+            for msg_id, queued in list(connection.queued.items()):
+                if queued.deadline is not None and queued.deadline <= now:
+                    del connection.queued[msg_id]
+                    self._lanes[queued.lane].remove(queued)
+                    self._counts['expired'] += 1
+                    await connection.write_stream.send(_error(
+                        msg_id, REQUEST_TIMEOUT, f"Request waited over {self.queue_timeout:g}s for a free slot"))
+            for msg_id, (deadline, _tool) in list(connection.running.items()):
+                if deadline is not None and deadline <= now and msg_id not in connection.timed_out:
+                    connection.timed_out.add(msg_id)
+                    self._counts['timed_out'] += 1
+                    # The session cancels the handler and answers; _pump_out rewrites the answer
+                    try:
+                        connection.to_session.send_nowait(SessionMessage(types.JSONRPCMessage(types.JSONRPCNotification(
+                            jsonrpc='2.0', method='notifications/cancelled',
+                            params={'requestId': msg_id, 'reason': 'request timeout'}))))
+                    except (anyio.ClosedResourceError, anyio.BrokenResourceError):
+                        return
+
+    def _close(self, connection: _Connection):
+        """Release the slots and queue entries of a connection that went away."""
+        for _deadline, tool in connection.running.values():
+            self._release(tool)
+        connection.running.clear()
+        for queued in connection.queued.values():
+            self._lanes[queued.lane].remove(queued)
+        connection.queued.clear()
+        self._dispatch()
+
+
+def install_admission_control(gateway, controller: AdmissionController):
+    """Run every session of `gateway.server` through `controller.filter`."""
+    server = gateway.server
+    run = server.run
+
+    async def admitted_run(read_stream, write_stream, *args, **kwargs):
+        async with controller.filter(read_stream, write_stream) as (session_read, session_write):
+            return await run(session_read, session_write, *args, **kwargs)
+
+    server.run = admitted_run
+
+
+# Ids of the requests written by the current `send_request` call
+_sent_request_ids: 'contextvars.ContextVar[Optional[list]]' = contextvars.ContextVar('sent_request_ids', default=None)
+
+
+class _RequestIdRecorder:
+    """A `ClientSession` write stream that notes the id of each request written.
+
+    `send_request` writes its request from its own task, so the id lands in
+    that call's `_sent_request_ids` list.
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    async def send(self, message: SessionMessage):
+        await self._stream.send(message)
+        sent = _sent_request_ids.get()
+        if sent is not None and isinstance(message.message.root, types.JSONRPCRequest):
+            sent.append(message.message.root.id)
+
+    async def __aenter__(self):
+        await self._stream.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return await self._stream.__aexit__(*exc_info)
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+def install_upstream_cancellation(controller: Optional[AdmissionController] = None):
+    """Tell the upstream when a request to it is cancelled (e.g. its client gave up)."""
+    from mcp import ClientSession
+
+    init = ClientSession.__init__
+    send_request = ClientSession.send_request
+
+    def recording_init(self, read_stream, write_stream, *args, **kwargs):
+        init(self, read_stream, _RequestIdRecorder(write_stream), *args, **kwargs)
+
+    async def cancelling_send_request(self, request, result_type, *args, **kwargs):
+        sent = []
+        token = _sent_request_ids.set(sent)
+        try:
+            return await send_request(self, request, result_type, *args, **kwargs)
+        except anyio.get_cancelled_exc_class():
+            # Nothing to cancel if the request was never written
+            if sent:
+                with anyio.CancelScope(shield=True):
+                    try:
+                        await self.send_notification(types.ClientNotification(types.CancelledNotification(
+                            method='notifications/cancelled',
+                            params=types.CancelledNotificationParams(
+                                requestId=sent[-1], reason='cancelled by the gateway client'),
+                        )))
+                        if controller is not None:
+                            controller.count_upstream_cancelled()
+                    except Exception:
+                        # The upstream session is already gone
+                        pass
+            raise
+        finally:
+            _sent_request_ids.reset(token)
+
+    ClientSession.__init__ = recording_init
+    ClientSession.send_request = cancelling_send_request
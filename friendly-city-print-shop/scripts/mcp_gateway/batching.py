@@ -0,0 +1,183 @@
+"""Post upstream messages as JSON-RPC batches.
+
+`mcp.client.sse.sse_client` POSTs every message on its own, and waits
+for each POST to be answered before it sends the next. `BatchingSseClient`
+is a drop-in replacement with the `sse_client(url, ...)` signature. When
+a POST finishes, its writer takes every message already waiting (up to
+`max_batch`) and posts them as one JSON array. Concurrent tool calls then
+share HTTP round trips. Nothing is held back to build a batch, and a
+lone message is still posted as a plain object.
+
+An upstream that answers a batch with a 4xx status does not take batches
+(MCP servers for protocol versions without batching reject arrays). Its
+rejected batch is re-posted one message at a time, and so is everything
+sent to that upstream afterwards.
+
+SSE `message` events that hold an array (a batch response, or the Node
+mock echoing a batch) are split into one message per element, so the
+`ClientSession` matches responses to requests by id as usual.
+
+`BatchingSseClient.__call__` follows `mcp.client.sse.sse_client` line for
+line, apart from the reading and posting. It is checked against the SDK
+release in `SDK_VERSION`, which `tests/mcp/requirements.txt` pins for CI.
+`SDK_SSE_CLIENT_SHA256` is the hash of that release's `sse_client`
+source. A test fails if the pinned release's source differs, and it is
+skipped under any other release, so a bump means re-syncing the copy.
+"""
+import inspect
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional, Set
+from urllib.parse import urljoin, urlparse
+
+import anyio
+import httpx
+import mcp.types as types
+from anyio.abc import TaskStatus
+from httpx_sse import aconnect_sse
+from mcp.client.sse import remove_request_params, sse_client
+from mcp.shared.message import SessionMessage
+from pydantic import TypeAdapter
+from pieces.settings import Settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BATCH = 64
+# The `mcp.client.sse.sse_client` that `BatchingSseClient.__call__` follows
+SDK_VERSION = '1.17.0'
+SDK_SSE_CLIENT_SHA256 = 'fbbc77119e5ad37cb34e8b135e2b9ca599ee3307f103bb168d6233c4a3dc0c8e'
+# The SDK's own default, without importing its private module
+_default_http_client_factory = inspect.signature(sse_client).parameters['httpx_client_factory'].default
+_BATCH = TypeAdapter(List[types.JSONRPCMessage])
+
+
+def parse_sse_messages(data: str) -> List[types.JSONRPCMessage]:
+    """The messages in one SSE `message` event: a single message or a batch."""
+    if data.lstrip().startswith('['):
+        return _BATCH.validate_json(data)
+    return [types.JSONRPCMessage.model_validate_json(data)]
+
+
+def _dump(session_message: SessionMessage) -> Dict[str, Any]:
+    return session_message.message.model_dump(by_alias=True, mode='json', exclude_none=True)
+
+
+class BatchingSseClient:
+    """Callable with the `sse_client(url)` signature that batches waiting POSTs."""
+
+    def __init__(self, max_batch: int = DEFAULT_MAX_BATCH):
+        if max_batch < 1:
+            raise ValueError('max_batch must be >= 1')
+        self.max_batch = max_batch
+        # Upstream URLs (without query) that rejected a batch
+        self._unbatched: Set[str] = set()
+        self.posts = 0
+        self.batches = 0
+        self.batched_messages = 0
+        self.rejected_batches = 0
+
+    def stats(self) -> dict:
+        return {
+            'posts': self.posts,
+            'batches': self.batches,
+            'batched_messages': self.batched_messages,
+            'rejected_batches': self.rejected_batches,
+            'unbatched_upstreams': len(self._unbatched),
+        }
+
+    async def _post(self, client: httpx.AsyncClient, endpoint_url: str, batch: List[SessionMessage]):
+        payloads = [_dump(message) for message in batch]
+        upstream = remove_request_params(endpoint_url)
+        if len(payloads) > 1 and upstream not in self._unbatched:
+            response = await client.post(endpoint_url, json=payloads)
+            self.posts += 1
+            if not 400 <= response.status_code < 500:
+                response.raise_for_status()
+                self.batches += 1
+                self.batched_messages += len(payloads)
+                return
+            self._unbatched.add(upstream)
+            self.rejected_batches += 1
+            Settings.logger.info(
+                f"Upstream {upstream} rejected a batch ({response.status_code}); posting messages singly")
+        for payload in payloads:
+            response = await client.post(endpoint_url, json=payload)
+            self.posts += 1
+            response.raise_for_status()
+
+    @asynccontextmanager
+    async def __call__(
+        self,
+        url: str,
+        headers: Optional[Dict[str, Any]] = None,
+        timeout: float = 5,
+        sse_read_timeout: float = 60 * 5,
+        httpx_client_factory=_default_http_client_factory,
+        auth: Optional[httpx.Auth] = None,
+    ):
+        # Follows mcp.client.sse.sse_client, with batch-aware reading and posting
+        read_stream_writer, read_stream = anyio.create_memory_object_stream(0)
+        write_stream, write_stream_reader = anyio.create_memory_object_stream(0)
+
+        async with anyio.create_task_group() as tg:
+            try:
+                async with httpx_client_factory(
+                    headers=headers, auth=auth, timeout=httpx.Timeout(timeout, read=sse_read_timeout)
+                ) as client:
+                    async with aconnect_sse(client, 'GET', url) as event_source:
+                        event_source.response.raise_for_status()
+
+                        async def sse_reader(task_status: TaskStatus[str] = anyio.TASK_STATUS_IGNORED):
+                            try:
+                                async for sse in event_source.aiter_sse():
+                                    if sse.event == 'endpoint':
+                                        endpoint_url = urljoin(url, sse.data)
+                                        url_parsed, endpoint_parsed = urlparse(url), urlparse(endpoint_url)
+                                        if (url_parsed.netloc, url_parsed.scheme) != (
+                                                endpoint_parsed.netloc, endpoint_parsed.scheme):
+                                            raise ValueError(
+                                                f"Endpoint origin does not match connection origin: {endpoint_url}")
+                                        task_status.started(endpoint_url)
+                                    elif sse.event == 'message':
+                                        try:
+                                            messages = parse_sse_messages(sse.data)
+                                        except Exception as exc:
+                                            logger.exception('Error parsing server message')
+                                            await read_stream_writer.send(exc)
+                                            continue
+                                        for message in messages:
+                                            await read_stream_writer.send(SessionMessage(message))
+                                    else:
+                                        logger.debug('Ignoring SSE event: %s', sse.event)
+                            except Exception as exc:
+                                logger.exception('Error in sse_reader')
+                                await read_stream_writer.send(exc)
+                            finally:
+                                await read_stream_writer.aclose()
+
+                        async def post_writer(endpoint_url: str):
+                            try:
+                                async with write_stream_reader:
+                                    async for session_message in write_stream_reader:
+                                        batch = [session_message]
+                                        # Whatever queued up during the last POST goes in this one
+                                        while len(batch) < self.max_batch:
+                                            try:
+                                                batch.append(write_stream_reader.receive_nowait())
+                                            except (anyio.WouldBlock, anyio.EndOfStream):
+                                                break
+                                        await self._post(client, endpoint_url, batch)
+                            except Exception:
+                                logger.exception('Error in post_writer')
+                            finally:
+                                await write_stream.aclose()
+
+                        endpoint_url = await tg.start(sse_reader)
+                        tg.start_soon(post_writer, endpoint_url)
+                        try:
+                            yield read_stream, write_stream
+                        finally:
+                            tg.cancel_scope.cancel()
+            finally:
+                await read_stream_writer.aclose()
+                await write_stream.aclose()
@@ -0,0 +1,114 @@
+"""Newline framing of byte streams over one reusable buffer.
+
+`LineFramer` owns a `bytearray`. Reads go straight into its free tail
+(`readinto(framer.writable())`, or `feed` for sources that hand out
+chunks), and `frames()` returns each complete line as a `memoryview`
+slice of the buffer, without the newline (and without a trailing `\\r`)
+unless it is built with `keep_ends=True`.
+A line is never copied while it is being assembled. The bytes of a
+partial line are moved to the front when room is needed, and the buffer
+doubles when one line outgrows it.
+
+A frame is released by the next `writable`, `feed`, `frames`, `flush`
+or `compact` call, so use it before reading more: decode it with
+`str(frame, 'utf-8')`, or take the one copy `json.loads` and pydantic
+need with `bytes(frame)`. The module has no MCP or asyncio dependency,
+so the gateway's stdio transport and the test clients share it.
+"""
+from typing import List, Optional
+
+DEFAULT_BUFFER_SIZE = 64 * 1024
+
+
+class LineFramer:
+    """Split a byte stream into lines with `memoryview` slices of one buffer."""
+
+    def __init__(self, size: int = DEFAULT_BUFFER_SIZE, keep_ends: bool = False):
+        self._keep_ends = keep_ends
+        self._buffer = bytearray(max(1, size))
+        self._view = memoryview(self._buffer)
+        # Unconsumed bytes are _buffer[_start:_end]; no newline in _buffer[_scan:_end]
+        self._start = 0
+        self._end = 0
+        self._scan = 0
+        self._issued: List[memoryview] = []
+
+    @property
+    def buffered(self) -> int:
+        """Bytes of the current partial line."""
+        return self._end - self._start
+
+    def _release_frames(self):
+        # Frames still referenced by a caller would block a resize
+        for frame in self._issued:
+            frame.release()
+        self._issued.clear()
+
+    def compact(self):
+        """Move the partial line to the front of the buffer."""
+        self._release_frames()
+        if self._start:
+            length = self._end - self._start
+            self._buffer[:length] = self._view[self._start:self._end]
+            self._scan -= self._start
+            self._start, self._end = 0, length
+
+    def writable(self, min_size: int = DEFAULT_BUFFER_SIZE) -> memoryview:
+        """Free space at the end of the buffer to read into; then call `commit`."""
+        self._release_frames()
+        if len(self._buffer) - self._end < min_size:
+            self.compact()
+        free = len(self._buffer) - self._end
+        if free < min_size:
+            # Doubles at least, so a long line is moved O(log n) times
+            self._view.release()
+            self._buffer.extend(bytes(max(min_size - free, len(self._buffer))))
+            self._view = memoryview(self._buffer)
+        target = self._view[self._end:]
+        self._issued.append(target)
+        return target
+
+    def commit(self, count: int):
+        """`count` bytes were read into the last `writable()` view."""
+        self._end += count
+
+    def feed(self, data) -> None:
+        """Append a chunk (bytes, bytearray, memoryview or str)."""
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        target = self.writable(len(data))
+        target[:len(data)] = data
+        self.commit(len(data))
+
+    def frames(self) -> List[memoryview]:
+        """Every complete line received so far, as slices of the buffer."""
+        self._release_frames()
+        frames = []
+        buffer = self._buffer
+        while True:
+            newline = buffer.find(b'\n', self._scan, self._end)
+            if newline < 0:
+                self._scan = self._end
+                break
+            if self._keep_ends:
+                end = newline + 1
+            elif newline > self._start and buffer[newline - 1] == 0x0D:
+                end = newline - 1
+            else:
+                end = newline
+            frames.append(self._view[self._start:end])
+            self._start = self._scan = newline + 1
+        if self._start == self._end:
+            self._start = self._end = self._scan = 0
+        self._issued.extend(frames)
+        return frames
+
+    def flush(self) -> Optional[memoryview]:
+        """At EOF: the trailing line that had no newline, if any."""
+        self._release_frames()
+        if self._start == self._end:
+            return None
+        frame = self._view[self._start:self._end]
+        self._start = self._end = self._scan = 0
+        self._issued.append(frame)
+        return frame
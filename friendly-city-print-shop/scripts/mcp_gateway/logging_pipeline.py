@@ -0,0 +1,189 @@
+"""Non-blocking log pipeline for the gateway wrapper.
+
+Loggers get a `DroppingQueueHandler`, so emitting a record on the event loop
+is a `put_nowait` on a bounded queue. A `BatchedJsonLinesListener` thread
+drains the queue, writes each batch as JSON lines with a single
+write/flush, and passes records on to any handlers the loggers had before
+(e.g. the pieces CLI file handler), so those also run off the loop.
+
+When the queue is full, records are dropped and counted rather than
+blocking the caller; the count is reported as a `log_records_dropped`
+record once the listener catches up, and again at shutdown.
+"""
+import json
+import logging
+import queue
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from typing import IO, Iterable, List, Optional
+
+DEFAULT_CAPACITY = 10000
+DEFAULT_BATCH_SIZE = 256
+
+
+class DroppingQueueHandler(QueueHandler):
+    """`QueueHandler` that never blocks: records that do not fit are counted."""
+
+    def __init__(self, q: queue.Queue):
+        super().__init__(q)
+        self.dropped = 0
+        self._lock_dropped = threading.Lock()
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock_dropped:
+                self.dropped += 1
+
+
+class BatchedJsonLinesListener(QueueListener):
+    """`QueueListener` that writes records to `stream` as JSON lines, in batches."""
+
+    def __init__(
+        self,
+        q: queue.Queue,
+        stream: IO[str],
+        *handlers: logging.Handler,
+        level: int = logging.NOTSET,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        drop_source: Optional[DroppingQueueHandler] = None,
+    ):
+        super().__init__(q, *handlers, respect_handler_level=True)
+        self.stream = stream
+        self.level = level
+        self.batch_size = batch_size
+        self.drop_source = drop_source
+        self._reported_dropped = 0
+
+    @staticmethod
+    def to_json(record: logging.LogRecord) -> str:
+        entry = {
+            'ts': round(record.created, 6),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        event = getattr(record, 'event', None)
+        if event is not None:
+            entry['event'] = event
+        return json.dumps(entry, default=str)
+
+    def enqueue_sentinel(self):
+        # The queue may be full; the listener is draining it, so block briefly.
+        self.queue.put(self._sentinel, timeout=5)
+
+    def _monitor(self):
+        q = self.queue
+        has_task_done = hasattr(q, 'task_done')
+        stopping = False
+        while not stopping:
+            batch: List[logging.LogRecord] = [self.dequeue(True)]
+            while len(batch) < self.batch_size and batch[-1] is not self._sentinel:
+                try:
+                    batch.append(self.dequeue(False))
+                except queue.Empty:
+                    break
+            if batch[-1] is self._sentinel:
+                stopping = True
+            records = [r for r in batch if r is not self._sentinel]
+            self._write_batch(records)
+            if has_task_done:
+                for _ in batch:
+                    q.task_done()
+
+    def _write_batch(self, records: List[logging.LogRecord]):
+        lines = []
+        for record in records:
+            for handler in self.handlers:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+            if record.levelno >= self.level:
+                lines.append(self.to_json(record))
+        dropped_line = self._dropped_line()
+        if dropped_line:
+            lines.append(dropped_line)
+        if not lines:
+            return
+        try:
+            self.stream.write('\n'.join(lines) + '\n')
+            self.stream.flush()
+        except (OSError, ValueError):
+            # The consumer went away; keep draining so producers never block.
+            pass
+
+    def _dropped_line(self) -> Optional[str]:
+        if self.drop_source is None:
+            return None
+        dropped = self.drop_source.dropped
+        if dropped == self._reported_dropped:
+            return None
+        self._reported_dropped = dropped
+        record = logging.LogRecord(
+            'mcp_gateway.logging', logging.WARNING, __file__, 0,
+            'Dropped %d log records (queue full)', (dropped,), None,
+        )
+        record.event = 'log_records_dropped'
+        return self.to_json(record)
+
+
+class LoggingPipeline:
+    """Route `loggers` through one bounded queue and a batching listener thread.
+
+    Each logger's existing handlers are detached and re-attached to the
+    listener, except those listed in `keep_inline` (e.g. a readiness probe
+    that must see records without queueing delay). Propagation is turned
+    off while the pipeline runs so ancestor handlers (typically a root
+    StreamHandler from `basicConfig`) do not write the same records inline.
+    """
+
+    def __init__(
+        self,
+        loggers: Iterable[logging.Logger],
+        stream: IO[str],
+        level: int = logging.INFO,
+        capacity: int = DEFAULT_CAPACITY,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        keep_inline: Iterable[logging.Handler] = (),
+    ):
+        self.loggers = list(loggers)
+        self.queue: queue.Queue = queue.Queue(maxsize=capacity)
+        self.handler = DroppingQueueHandler(self.queue)
+        keep_inline = set(keep_inline)
+        self._detached = []
+        self._propagate = [(logger, logger.propagate) for logger in self.loggers]
+        moved: List[logging.Handler] = []
+        for logger in self.loggers:
+            for handler in list(logger.handlers):
+                if handler in keep_inline:
+                    continue
+                logger.removeHandler(handler)
+                self._detached.append((logger, handler))
+                if handler not in moved:
+                    moved.append(handler)
+            logger.addHandler(self.handler)
+            logger.propagate = False
+        self.listener = BatchedJsonLinesListener(
+            self.queue, stream, *moved,
+            level=level, batch_size=batch_size, drop_source=self.handler,
+        )
+
+    @property
+    def dropped(self) -> int:
+        return self.handler.dropped
+
+    def start(self) -> 'LoggingPipeline':
+        self.listener.start()
+        return self
+
+    def stop(self):
+        """Flush queued records and restore the original handlers."""
+        for logger in self.loggers:
+            logger.removeHandler(self.handler)
+        if self.listener._thread is not None:
+            self.listener.stop()
+        for logger, handler in self._detached:
+            logger.addHandler(handler)
+        self._detached.clear()
+        for logger, propagate in self._propagate:
+            logger.propagate = propagate
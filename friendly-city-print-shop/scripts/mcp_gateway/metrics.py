@@ -0,0 +1,380 @@
+"""Request metrics for the gateway wrapper, in Prometheus text format.
+
+`install_request_metrics` wraps every registered request handler, and
+`ServerSession` for `initialize` (which never reaches a handler). For each
+method it records request and error counts, a latency histogram and an
+in-flight gauge. `tools/call` is further labelled by tool name, for the
+tools the upstream lists; any other name a client sends is counted as
+`other`, so clients cannot grow the number of series.
+`EventLoopLagMonitor` measures how late a periodic sleep wakes up.
+Collectors turn the existing `stats()` of the upstream, caches and log
+pipeline into samples at scrape time.
+
+`serve_metrics` answers `GET /metrics` on a local port. The same text is
+logged at shutdown. No client library is needed: the text format is
+simple enough to write here.
+"""
+import asyncio
+import math
+import os
+import time
+import tracemalloc
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qs
+
+import mcp.types as types
+
+# Seconds; roughly the Prometheus client defaults, with finer low buckets
+OTHER_TOOL = 'other'
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+Labels = Tuple[str, ...]
+# (name, type, help, [(labels, value)]) as produced by collectors
+Family = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Sequence[str]) -> Labels:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}")
+        return tuple(labels)
+
+    def _labels(self, key: Labels) -> Dict[str, str]:
+        return dict(zip(self.labelnames, key))
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self):
+        return [f"{self.name}{_format_labels(self._labels(k))} {_format_value(v)}" for k, v in self._values.items()]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, *labels: str, amount: float = 1.0):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels: str, value: float):
+        self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts..., +Inf count], sum
+        self._counts: Dict[Labels, List[int]] = {}
+        self._sums: Dict[Labels, float] = {}
+
+    def observe(self, *labels: str, value: float):
+        key = self._key(labels)
+        counts = self._counts.get(key)
+        if counts is None:
+            counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+            self._sums[key] = 0.0
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+        self._sums[key] += value
+
+    def count(self, *labels: str) -> int:
+        return sum(self._counts.get(self._key(labels), ()))
+
+    def _samples(self):
+        lines = []
+        for key, counts in self._counts.items():
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, n in zip(self.buckets + (math.inf,), counts):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': _format_value(bound)})} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(self._sums[key])}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Owned metrics plus collectors that are read at render time."""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], Iterable[Family]]] = []
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, labelnames=()) -> Gauge:
+        return self._register(Gauge(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def add_collector(self, collect: Callable[[], Iterable[Family]]):
+        self._collectors.append(collect)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collect in self._collectors:
+            for name, kind, help, samples in collect():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                lines.extend(f"{name}{_format_labels(labels)} {_format_value(value)}" for labels, value in samples)
+        return '\n'.join(lines) + '\n'
+
+
+class GatewayMetrics:
+    """The gateway's own metric families."""
+
+    def __init__(self, registry: Optional[MetricsRegistry] = None):
+        self.registry = registry or MetricsRegistry()
+        r = self.registry
+        self.requests = r.counter('mcp_gateway_requests_total', 'Requests handled, by method and tool.', ('method', 'tool'))
+        self.errors = r.counter(
+            'mcp_gateway_request_errors_total',
+            'Requests that raised or returned an error result, by method and tool.',
+            ('method', 'tool'),
+        )
+        self.latency = r.histogram(
+            'mcp_gateway_request_duration_seconds', 'Request handling time, by method and tool.', ('method', 'tool')
+        )
+        self.in_flight = r.gauge('mcp_gateway_requests_in_flight', 'Requests being handled, by method.', ('method',))
+        self.loop_lag = r.histogram(
+            'mcp_gateway_event_loop_lag_seconds', 'How late a periodic event-loop timer fired.'
+        )
+
+    def render(self) -> str:
+        return self.registry.render()
+
+    async def track(self, method: str, tool: str, handle: Callable[[], Awaitable[Any]]):
+        self.in_flight.inc(method)
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = await handle()
+            failed = bool(getattr(getattr(result, 'root', result), 'isError', False))
+            return result
+        finally:
+            self.latency.observe(method, tool, value=time.perf_counter() - started)
+            self.requests.inc(method, tool)
+            if failed:
+                self.errors.inc(method, tool)
+            self.in_flight.dec(method)
+
+
+class _ToolLabels:
+    """Map a requested tool name to its label: itself if the upstream lists it, else `other`."""
+
+    def __init__(self, gateway):
+        self._gateway = gateway
+        self._tools: Optional[list] = None
+        self._count = 0
+        self._names: frozenset = frozenset()
+
+    def __call__(self, name: str) -> str:
+        tools = getattr(getattr(self._gateway, 'upstream', None), 'discovered_tools', None) or []
+        # The list is replaced (or cleared) when the upstream tools are refreshed
+        if tools is not self._tools or len(tools) != self._count:
+            self._tools, self._count = tools, len(tools)
+            self._names = frozenset(tool.name for tool in tools)
+        return name if name in self._names else OTHER_TOOL
+
+
+def install_request_metrics(gateway, metrics: GatewayMetrics):
+    """Time every request handler of `gateway.server`, and `initialize`."""
+    import mcp.server.session as session_mod
+
+    tool_label = _ToolLabels(gateway)
+    handlers = gateway.server.request_handlers
+    for request_type, handler in list(handlers.items()):
+        def timed(req, handler=handler):
+            tool = tool_label(req.params.name) if isinstance(req, types.CallToolRequest) else ''
+            return metrics.track(req.method, tool, lambda: handler(req))
+
+        handlers[request_type] = timed
+
+    received_request = session_mod.ServerSession._received_request
+
+    async def timed_received_request(self, responder):
+        if isinstance(responder.request.root, types.InitializeRequest):
+            return await metrics.track('initialize', '', lambda: received_request(self, responder))
+        return await received_request(self, responder)
+
+    session_mod.ServerSession._received_request = timed_received_request
+
+
+def upstream_collector(upstream) -> Callable[[], Iterable[Family]]:
+    def collect():
+        stats = upstream.upstream_stats()
+        for key, kind, name, help in (
+            ('live', 'gauge', 'mcp_gateway_upstream_sessions_live', 'Live upstream sessions.'),
+            ('in_flight', 'gauge', 'mcp_gateway_upstream_in_flight', 'Tool calls in flight per upstream.'),
+            ('calls', 'counter', 'mcp_gateway_upstream_calls_total', 'Tool calls sent per upstream.'),
+            ('reconnects', 'counter', 'mcp_gateway_upstream_reconnects_total', 'Upstream reconnect attempts.'),
+            ('ejections', 'counter', 'mcp_gateway_upstream_ejections_total', 'Live upstream sessions lost.'),
+        ):
+            yield name, kind, help, [({'upstream': url}, entry[key]) for url, entry in stats.items()]
+    return collect
+
+
+def stats_collector(prefix: str, stats: Callable[[], dict], counters: Sequence[str] = ()) -> Callable[[], Iterable[Family]]:
+    """Expose the numeric fields of a `stats()` dict as `<prefix>_<field>`."""
+    def collect():
+        for key, value in stats().items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            kind = 'counter' if key in counters else 'gauge'
+            name = f"{prefix}_{key}_total" if kind == 'counter' else f"{prefix}_{key}"
+            yield name, kind, f"{prefix} {key}.", [({}, value)]
+    return collect
+
+
+def process_collector() -> Iterable[Family]:
+    yield 'mcp_gateway_asyncio_tasks', 'gauge', 'Tasks on the running event loop.', [({}, _task_count())]
+    try:
+        with open('/proc/self/statm') as f:
+            rss_pages = int(f.read().split()[1])
+        yield 'process_resident_memory_bytes', 'gauge', 'Resident memory size.', [({}, rss_pages * os.sysconf('SC_PAGE_SIZE'))]
+        yield 'process_open_fds', 'gauge', 'Open file descriptors.', [({}, len(os.listdir('/proc/self/fd')))]
+    except (OSError, ValueError, IndexError):
+        # Not Linux; the request metrics still work
+        pass
+    if tracemalloc.is_tracing():
+        current, _peak = tracemalloc.get_traced_memory()
+        yield 'python_tracemalloc_traced_bytes', 'gauge', 'Python heap traced by tracemalloc.', [({}, current)]
+
+
+def tracemalloc_top(limit: int = 10) -> str:
+    """Top allocation sites by size, one per line (`PYTHONTRACEMALLOC=1` to enable)."""
+    if not tracemalloc.is_tracing():
+        return ''
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    ))
+    return ''.join(f"{stat}\n" for stat in snapshot.statistics('lineno')[:limit])
+
+
+def _task_count() -> int:
+    try:
+        return len(asyncio.all_tasks())
+    except RuntimeError:
+        return 0
+
+
+class EventLoopLagMonitor:
+    """Sleep `interval` seconds in a loop and record how late each wake-up is."""
+
+    def __init__(self, metrics: GatewayMetrics, interval: float = 0.5):
+        self.metrics = metrics
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="mcp-gateway-loop-lag")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.metrics.loop_lag.observe(value=max(0.0, loop.time() - expected))
+
+
+async def serve_metrics(metrics: GatewayMetrics, host: str, port: int) -> asyncio.AbstractServer:
+    """Answer `GET /metrics` with the Prometheus text, and `GET
+    /debug/tracemalloc?limit=N` with the top allocation sites when
+    tracemalloc is tracing; anything else is a 404."""
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), 5)
+            # Headers are not needed; read them so the client is not reset
+            while (await asyncio.wait_for(reader.readline(), 5)) not in (b'\r\n', b'\n', b''):
+                pass
+            parts = request_line.decode('latin-1').split()
+            path, _, query = (parts[1] if len(parts) >= 2 and parts[0] == 'GET' else '').partition('?')
+            if path == '/metrics':
+                status, body, content_type = '200 OK', metrics.render().encode(), CONTENT_TYPE
+            elif path == '/debug/tracemalloc' and tracemalloc.is_tracing():
+                limit = int(parse_qs(query).get('limit', ['10'])[0])
+                # Snapshots of a large heap take a while; keep the loop serving
+                top = await asyncio.get_running_loop().run_in_executor(None, tracemalloc_top, limit)
+                status, body, content_type = '200 OK', top.encode(), 'text/plain; charset=utf-8'
+            else:
+                status, body, content_type = '404 Not Found', b'not found\n', 'text/plain'
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
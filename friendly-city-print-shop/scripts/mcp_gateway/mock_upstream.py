@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""
+Pure-Python asyncio mock of the upstream MCP SSE server.
+
+A stand-in for `scripts/mcp-server.js` that needs nothing beyond the
+standard library. The Node mock echoes every POST to every SSE client.
+This one gives each SSE client its own session: the `endpoint` event
+carries `?session_id=...`, and responses go only to the session that
+posted the request. Requests are answered (initialize, ping, tools/list,
+tools/call). Each tool can be given a latency distribution, error rates
+and a payload size, so the gateway can be measured against a slow or
+flaky backend.
+
+`notifications/cancelled` cancels the named request of that session; it
+is then never answered. `MockUpstream.cancelled` counts them.
+
+A POST may carry a JSON-RPC batch (an array). Its requests run
+concurrently, and their responses are sent as one array event once all
+of them are answered (cancelled ones are left out). `MockUpstream.batches`
+counts them.
+
+For compatibility, a POST without `session_id` is still echoed to every
+client and logged as `Broadcasting response`.
+
+Usage:
+  python scripts/mcp_gateway/mock_upstream.py --port 39300
+  MCP_MOCK_CONFIG='{"tools": {"echo": {"latency_ms": {"dist": "lognormal", "median": 20, "sigma": 0.8}}}}' \
+    python scripts/mcp_gateway/mock_upstream.py
+
+Config (JSON, from `--config PATH` or `MCP_MOCK_CONFIG` as JSON text or a
+path):
+  {"seed": 1,
+   "tools": {"<name>": {"description": "...",
+                        "latency_ms": {"dist": "fixed", "value": 5},
+                        "error_rate": 0.01,      # isError tool result
+                        "rpc_error_rate": 0.0,   # JSON-RPC error -32000
+                        "payload_bytes": 4096}}} # pad the result text
+Distributions: fixed {value}, uniform {min, max}, exponential {mean},
+lognormal {median, sigma}, pareto {scale, alpha}. Tools named in the
+config are added to, or override, the default `echo` and `ask_pieces_ltm`.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import socket
+import sys
+import uuid
+from typing import Any, Dict, Optional
+from urllib.parse import parse_qs, urlsplit
+
+SSE_PATH = '/model_context_protocol/2024-11-05/sse'
+MESSAGE_PATH = '/model_context_protocol/2024-11-05/message'
+PROTOCOL_VERSION = '2024-11-05'
+
+DEFAULT_TOOLS: Dict[str, Dict[str, Any]] = {
+    'echo': {
+        'description': 'Echo Tool: returns the text it was given',
+        'inputSchema': {'type': 'object', 'properties': {'text': {'type': 'string'}}},
+    },
+    'ask_pieces_ltm': {
+        'description': 'Mock Pieces long-term memory; a question containing FAIL returns an error',
+        'inputSchema': {'type': 'object', 'properties': {'question': {'type': 'string'}}},
+    },
+}
+
+
+def _log(message: str, fields: Optional[dict] = None):
+    # One line per event on stdout, like the Node mock; tests watch these lines
+    print(message if fields is None else f"{message} {json.dumps(fields)}", flush=True)
+
+
+def sample_latency_ms(spec: Optional[dict], rng: random.Random) -> float:
+    """Draw one latency (milliseconds) from a distribution spec."""
+    if not spec:
+        return 0.0
+    dist = spec.get('dist', 'fixed')
+    if dist == 'fixed':
+        value = spec.get('value', 0.0)
+    elif dist == 'uniform':
+        value = rng.uniform(spec['min'], spec['max'])
+    elif dist == 'exponential':
+        value = rng.expovariate(1.0 / spec['mean'])
+    elif dist == 'lognormal':
+        value = rng.lognormvariate(math.log(spec['median']), spec.get('sigma', 0.5))
+    elif dist == 'pareto':
+        value = spec['scale'] * rng.paretovariate(spec.get('alpha', 2.0))
+    else:
+        raise ValueError(f"unknown latency distribution {dist!r}")
+    return max(0.0, float(value))
+
+
+def load_config(path_or_json: Optional[str]) -> dict:
+    if not path_or_json:
+        return {}
+    text = path_or_json
+    if not path_or_json.lstrip().startswith('{'):
+        with open(path_or_json, encoding='utf-8') as f:
+            text = f.read()
+    return json.loads(text)
+
+
+class _Session:
+    def __init__(self, client: Optional[str]):
+        self.id = uuid.uuid4().hex
+        self.client = client
+        self.outbox: 'asyncio.Queue[dict]' = asyncio.Queue()
+        # Requests being answered, by JSON-RPC id, so they can be cancelled
+        self.running: Dict[Any, asyncio.Task] = {}
+
+
+class MockUpstream:
+    """SSE + POST MCP server with per-session routing and injected behaviour."""
+
+    def __init__(self, config: Optional[dict] = None):
+        config = config or {}
+        self.rng = random.Random(config.get('seed'))
+        self.tools: Dict[str, Dict[str, Any]] = {name: dict(spec) for name, spec in DEFAULT_TOOLS.items()}
+        for name, spec in (config.get('tools') or {}).items():
+            self.tools.setdefault(name, {}).update(spec)
+        self.sessions: Dict[str, _Session] = {}
+        self.calls: Dict[str, int] = {}
+        self.cancelled = 0
+        self.batches = 0
+        self._tasks = set()
+
+    # -- MCP ---------------------------------------------------------------
+
+    def _tool_list(self):
+        return [
+            {
+                'name': name,
+                'description': spec.get('description', name),
+                'inputSchema': spec.get('inputSchema', {'type': 'object'}),
+            }
+            for name, spec in self.tools.items()
+        ]
+
+    async def _call_tool(self, params: dict):
+        name = params.get('name')
+        arguments = params.get('arguments') or {}
+        spec = self.tools.get(name)
+        if spec is None:
+            return None, {'code': -32602, 'message': f"Unknown tool: {name}"}
+        self.calls[name] = self.calls.get(name, 0) + 1
+        delay = sample_latency_ms(spec.get('latency_ms'), self.rng)
+        if delay:
+            await asyncio.sleep(delay / 1000.0)
+        if self.rng.random() < spec.get('rpc_error_rate', 0.0):
+            return None, {'code': -32000, 'message': f"Simulated {name} failure"}
+        if name == 'ask_pieces_ltm' and 'FAIL' in str(arguments.get('question', '')):
+            return {'content': [{'type': 'text', 'text': 'Simulated LTM error'}], 'isError': True}, None
+        if self.rng.random() < spec.get('error_rate', 0.0):
+            return {'content': [{'type': 'text', 'text': f"Simulated {name} error"}], 'isError': True}, None
+        if name == 'ask_pieces_ltm':
+            text = f"Mock LTM response to: {arguments.get('question', '')}"
+        else:
+            text = str(arguments.get('text', json.dumps(arguments)))
+        padding = spec.get('payload_bytes', 0) - len(text)
+        if padding > 0:
+            text += ' ' + 'x' * (padding - 1)
+        return {'content': [{'type': 'text', 'text': text}]}, None
+
+    async def handle_message(self, session: _Session, message: dict):
+        response = await self.answer(message)
+        if response is not None:
+            await session.outbox.put(response)
+
+    async def answer(self, message: dict) -> Optional[dict]:
+        """The response to one message, or None if it needs none."""
+        method = message.get('method')
+        if method is None or 'id' not in message:
+            # A notification, or the client's answer to a server request
+            return None
+        result, error = None, None
+        if method == 'initialize':
+            result = {
+                'protocolVersion': PROTOCOL_VERSION,
+                'capabilities': {'tools': {'listChanged': True}},
+                'serverInfo': {'name': 'mcp-mock-upstream', 'version': '1.0.0'},
+            }
+        elif method == 'ping':
+            result = {}
+        elif method == 'tools/list':
+            result = {'tools': self._tool_list()}
+        elif method == 'tools/call':
+            result, error = await self._call_tool(message.get('params') or {})
+        else:
+            error = {'code': -32601, 'message': f"Method not found: {method}"}
+        response = {'jsonrpc': '2.0', 'id': message['id']}
+        if error is not None:
+            response['error'] = error
+        else:
+            response['result'] = result
+        return response
+
+    async def _answer_batch(self, session: _Session, tasks):
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        responses = [r for r in results if isinstance(r, dict)]
+        if responses:
+            await session.outbox.put(responses)
+
+    # -- HTTP --------------------------------------------------------------
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            # Keep-alive: httpx reuses one connection for many POSTs
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    return
+                method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    key, _, value = line.decode('latin-1').partition(':')
+                    headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0) or 0))
+                url = urlsplit(target)
+                query = parse_qs(url.query)
+                if method == 'GET' and url.path == SSE_PATH:
+                    await self._serve_sse(reader, writer, (query.get('client') or [None])[0])
+                    return
+                if method == 'POST' and url.path == MESSAGE_PATH:
+                    status, payload = await self._post_message(body, (query.get('session_id') or [None])[0])
+                elif method == 'GET' and url.path == '/':
+                    status, payload = '200 OK', 'Python MCP SSE mock server for local development.\n'
+                else:
+                    status, payload = '404 Not Found', {'error': 'not_found'}
+                self._respond(writer, status, payload)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _respond(writer: asyncio.StreamWriter, status: str, payload):
+        if isinstance(payload, str):
+            data, content_type = payload.encode(), 'text/plain'
+        else:
+            data, content_type = json.dumps(payload).encode(), 'application/json'
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {len(data)}\r\n\r\n".encode() + data
+        )
+
+    async def _post_message(self, body: bytes, session_id: Optional[str]):
+        try:
+            message = json.loads(body)
+        except ValueError as e:
+            return '400 Bad Request', {'error': 'invalid json', 'msg': str(e)}
+        if session_id is None:
+            for session in self.sessions.values():
+                await session.outbox.put(message)
+            _log('Broadcasting response', {'payload': body.decode('utf-8', 'replace'), 'clients': len(self.sessions)})
+            return '200 OK', {'delivered': True, 'clients': len(self.sessions)}
+        session = self.sessions.get(session_id)
+        if session is None:
+            return '404 Not Found', {'error': 'unknown session'}
+        if isinstance(message, list):
+            if not message or not all(isinstance(m, dict) for m in message):
+                return '400 Bad Request', {'error': 'invalid batch'}
+            self.batches += 1
+            tasks = [self._start(session, m, in_batch=True) for m in message]
+            self._track(asyncio.create_task(self._answer_batch(session, [t for t in tasks if t is not None])))
+        else:
+            self._start(session, message)
+        return '202 Accepted', {'accepted': True}
+
+    def _track(self, task: asyncio.Task) -> asyncio.Task:
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def _start(self, session: _Session, message: dict, in_batch: bool = False) -> Optional[asyncio.Task]:
+        """Start answering `message`; a batch's answers are sent by `_answer_batch`."""
+        if message.get('method') == 'notifications/cancelled':
+            # The request is abandoned without a response, as MCP specifies
+            task = session.running.pop((message.get('params') or {}).get('requestId'), None)
+            if task is not None:
+                task.cancel()
+                self.cancelled += 1
+            return None
+        # Answered on the SSE stream; calls run concurrently like a real server
+        work = self.answer(message) if in_batch else self.handle_message(session, message)
+        task = self._track(asyncio.create_task(work))
+        if 'id' in message and 'method' in message:
+            msg_id = message['id']
+            session.running[msg_id] = task
+            task.add_done_callback(lambda t: session.running.pop(msg_id, None) if session.running.get(msg_id) is t else None)
+        return task
+
+    async def _serve_sse(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, client: Optional[str]):
+        session = _Session(client)
+        # The client sends nothing more; EOF means it went away
+        streaming = asyncio.current_task()
+
+        def stop_streaming(_):
+            streaming.cancel()
+
+        hangup = asyncio.create_task(reader.read())
+        hangup.add_done_callback(stop_streaming)
+        self.sessions[session.id] = session
+        fields = {'id': session.id, 'totalClients': len(self.sessions)}
+        if client:
+            fields['client'] = client
+        _log('Client connected', fields)
+        try:
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream; charset=utf-8\r\n"
+                b"Cache-Control: no-cache\r\nConnection: close\r\n\r\n"
+            )
+            writer.write(f"event: endpoint\ndata: {MESSAGE_PATH}?session_id={session.id}\n\n".encode())
+            await writer.drain()
+            while True:
+                message = await session.outbox.get()
+                writer.write(f"event: message\ndata: {json.dumps(message)}\n\n".encode())
+                await writer.drain()
+        except asyncio.CancelledError:
+            if not hangup.done():
+                raise
+        finally:
+            hangup.remove_done_callback(stop_streaming)
+            hangup.cancel()
+            del self.sessions[session.id]
+            _log('Client disconnected', {'id': session.id, 'totalClients': len(self.sessions)})
+
+    async def serve(self, host: str, port: int, sock: Optional[socket.socket] = None) -> asyncio.AbstractServer:
+        if sock is not None:
+            return await asyncio.start_server(self.handle_connection, sock=sock)
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+
+async def _main(args):
+    upstream = MockUpstream(load_config(args.config or os.environ.get('MCP_MOCK_CONFIG')))
+    sock = socket.socket(fileno=args.fd) if args.fd is not None else None
+    server = await upstream.serve(args.host, args.port, sock)
+    port = server.sockets[0].getsockname()[1]
+    _log(f"MCP SSE mock server listening on http://localhost:{port}")
+    _log(f"SSE endpoint: {SSE_PATH}")
+    _log(f"POST messages at {MESSAGE_PATH}")
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT') or os.environ.get('MCP_PORT') or 39300))
+    parser.add_argument(
+        '--fd', type=int, default=int(os.environ['LISTEN_FD']) if os.environ.get('LISTEN_FD') else None,
+        help='Serve on this inherited, already-listening socket (default: $LISTEN_FD)',
+    )
+    parser.add_argument('--config', default=None, help='JSON config file (default: $MCP_MOCK_CONFIG)')
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(_main(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,217 @@
+"""Share one upstream SSE stream between many client sessions.
+
+Every upstream session normally opens its own SSE stream, and each
+`ClientSession` numbers its requests from 0. Two sessions on the same
+stream would therefore send colliding ids. On a broadcasting upstream
+(such as `scripts/mcp-server.js`) each session would also see every other
+session's traffic.
+
+`UpstreamMultiplexer` owns a single physical `sse_client` connection per
+upstream URL and hands out logical `(read_stream, write_stream)` pairs
+with the same shape that `sse_client` yields:
+
+- an outgoing request gets a gateway-unique id (`gw-<process>-<n>`) before
+  it is posted. The original id is remembered in a dict keyed by the new
+  one, so a response is routed back in O(1) with its original id restored;
+- `notifications/cancelled` is rewritten to the gateway id it refers to;
+- responses to ids this process did not send (another gateway's traffic)
+  are dropped;
+- requests carrying a gateway id are the broadcast echo of some gateway's
+  own request, and are dropped as well;
+- other server requests go to the oldest logical session, and
+  notifications go to every logical session.
+
+`MultiplexedSseClient` is a drop-in replacement for `sse_client(url)`.
+"""
+import asyncio
+import itertools
+import secrets
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import anyio
+import mcp.types as types
+from mcp.client.sse import sse_client
+from mcp.shared.message import SessionMessage
+from pieces.settings import Settings
+
+GATEWAY_ID_PREFIX = 'gw-'
+# Messages buffered per logical session before the shared reader waits
+SESSION_BUFFER = 32
+
+
+def _with_root(message: SessionMessage, root) -> SessionMessage:
+    return SessionMessage(message=types.JSONRPCMessage(root), metadata=message.metadata)
+
+
+class _Channel:
+    """One logical session on the shared stream."""
+
+    def __init__(self, to_session):
+        self.to_session = to_session
+        # Original request id -> gateway id, for requests still in flight
+        self.pending: Dict[types.RequestId, str] = {}
+
+
+class UpstreamMultiplexer:
+    """One physical SSE connection, shared by any number of logical sessions."""
+
+    def __init__(self, url: str, connect: Callable[..., Any] = sse_client, process_id: Optional[str] = None):
+        self.url = url
+        self._connect = connect
+        self._id_prefix = f"{GATEWAY_ID_PREFIX}{process_id or secrets.token_hex(4)}-"
+        self._ids = itertools.count(1)
+        # Gateway id -> (channel, original id)
+        self._in_flight: Dict[str, Tuple[_Channel, types.RequestId]] = {}
+        self._channels: List[_Channel] = []
+        self._upstream_write = None
+        self._reader: Optional[asyncio.Task] = None
+        self._ready: Optional[asyncio.Future] = None
+        self.remapped = 0
+        self.routed = 0
+        self.dropped = 0
+
+    def stats(self) -> dict:
+        return {
+            'sessions': len(self._channels),
+            'in_flight': len(self._in_flight),
+            'remapped': self.remapped,
+            'routed': self.routed,
+            'dropped': self.dropped,
+        }
+
+    @asynccontextmanager
+    async def open(self):
+        """Yield `(read_stream, write_stream)` for one logical session."""
+        await self._ensure_connected()
+        to_session, session_reads = anyio.create_memory_object_stream(SESSION_BUFFER)
+        session_writes, from_session = anyio.create_memory_object_stream(0)
+        channel = _Channel(to_session)
+        self._channels.append(channel)
+        forwarder = asyncio.create_task(self._forward(channel, from_session))
+        try:
+            async with session_reads, session_writes:
+                yield session_reads, session_writes
+        finally:
+            forwarder.cancel()
+            await asyncio.gather(forwarder, return_exceptions=True)
+            self._channels.remove(channel)
+            for gateway_id in channel.pending.values():
+                self._in_flight.pop(gateway_id, None)
+            await to_session.aclose()
+            if not self._channels and self._reader is not None:
+                self._reader.cancel()
+                await asyncio.gather(self._reader, return_exceptions=True)
+
+    async def _ensure_connected(self):
+        if self._reader is None or self._reader.done():
+            self._ready = asyncio.get_running_loop().create_future()
+            self._reader = asyncio.create_task(self._run(self._ready), name=f"mcp-upstream-mux {self.url}")
+        # Shielded: one opener giving up must not fail the others
+        await asyncio.shield(self._ready)
+
+    async def _run(self, ready: asyncio.Future):
+        error: Optional[BaseException] = None
+        try:
+            async with self._connect(self.url) as (read_stream, write_stream):
+                self._upstream_write = write_stream
+                ready.set_result(None)
+                Settings.logger.info(f"Shared upstream stream open ({self.url})")
+                async for item in read_stream:
+                    await self._dispatch(item)
+            error = ConnectionError("Shared upstream stream closed")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            error = e
+            Settings.logger.info(f"Shared upstream stream failed ({self.url}): {type(e).__name__}: {e}")
+        finally:
+            self._upstream_write = None
+            if not ready.done():
+                ready.set_exception(error or ConnectionError("Shared upstream stream cancelled"))
+            # Every logical session sees the failure and reconnects on its own
+            for channel in list(self._channels):
+                if error is not None:
+                    try:
+                        channel.to_session.send_nowait(error)
+                    except anyio.WouldBlock:
+                        pass
+                    except (anyio.ClosedResourceError, anyio.BrokenResourceError):
+                        continue
+                await channel.to_session.aclose()
+
+    async def _forward(self, channel: _Channel, from_session):
+        # Closing `from_session` on the way out fails the session's writes
+        # instead of leaving them blocked.
+        async with from_session:
+            async for message in from_session:
+                await self._send_upstream(channel, message)
+
+    async def _send_upstream(self, channel: _Channel, message: SessionMessage):
+        root = message.message.root
+        if isinstance(root, types.JSONRPCRequest):
+            gateway_id = f"{self._id_prefix}{next(self._ids)}"
+            self._in_flight[gateway_id] = (channel, root.id)
+            channel.pending[root.id] = gateway_id
+            self.remapped += 1
+            message = _with_root(message, root.model_copy(update={'id': gateway_id}))
+        elif isinstance(root, types.JSONRPCNotification) and root.method == 'notifications/cancelled':
+            params = dict(root.params or {})
+            gateway_id = channel.pending.get(params.get('requestId'))
+            if gateway_id is not None:
+                params['requestId'] = gateway_id
+                message = _with_root(message, root.model_copy(update={'params': params}))
+        write = self._upstream_write
+        if write is None:
+            raise ConnectionError("Shared upstream stream is not connected")
+        await write.send(message)
+
+    async def _dispatch(self, item):
+        if isinstance(item, Exception):
+            targets = list(self._channels)
+        else:
+            root = item.message.root
+            if isinstance(root, (types.JSONRPCResponse, types.JSONRPCError)):
+                entry = self._in_flight.pop(root.id, None)
+                if entry is None:
+                    self.dropped += 1
+                    return
+                channel, original_id = entry
+                channel.pending.pop(original_id, None)
+                item = _with_root(item, root.model_copy(update={'id': original_id}))
+                self.routed += 1
+                targets = [channel]
+            elif isinstance(root, types.JSONRPCRequest):
+                if isinstance(root.id, str) and root.id.startswith(GATEWAY_ID_PREFIX):
+                    self.dropped += 1
+                    return
+                targets = self._channels[:1]
+            else:
+                targets = list(self._channels)
+        for channel in targets:
+            try:
+                await channel.to_session.send(item)
+            except (anyio.ClosedResourceError, anyio.BrokenResourceError):
+                pass
+
+
+class MultiplexedSseClient:
+    """Callable with the `sse_client(url)` signature, one multiplexer per URL."""
+
+    def __init__(self, connect: Callable[..., Any] = sse_client):
+        self._connect = connect
+        self._process_id = secrets.token_hex(4)
+        self._multiplexers: Dict[str, UpstreamMultiplexer] = {}
+
+    def __call__(self, url: str, *args, **kwargs):
+        multiplexer = self._multiplexers.get(url)
+        if multiplexer is None:
+            # Transport options are fixed by the first session on each URL
+            def connect(url):
+                return self._connect(url, *args, **kwargs)
+
+            multiplexer = self._multiplexers[url] = UpstreamMultiplexer(url, connect, self._process_id)
+        return multiplexer.open()
+
+    def stats(self) -> Dict[str, dict]:
+        return {url: multiplexer.stats() for url, multiplexer in self._multiplexers.items()}
@@ -0,0 +1,153 @@
+"""Serve one gateway to many MCP clients over HTTP (`--listen`).
+
+In stdio mode every client needs its own gateway process, interpreter and
+upstream connection. Here a single asyncio process accepts any number of
+client sessions, either over the SSE transport (`GET /sse` plus
+`POST /messages/`) or over streamable HTTP (`/mcp`). All sessions share
+the gateway's upstream connection, tools/list cache and tool result memo.
+
+Each client still gets its own `ServerSession`, so request ids, initialize
+state and in-flight requests stay separate. Notifications that are not
+tied to a request (tools/list_changed) go to every client that has listed
+tools, and not only to whichever client happened to be mid-request.
+"""
+import contextlib
+import socket
+import weakref
+from typing import Callable, Optional, Tuple
+
+import mcp.types as types
+import uvicorn
+from mcp.server.lowlevel import NotificationOptions
+from mcp.server.models import InitializationOptions
+from mcp.server.sse import SseServerTransport
+from mcp.server.streamable_http_manager import StreamableHTTPSessionManager
+from pieces.settings import Settings
+from starlette.applications import Starlette
+from starlette.responses import Response
+from starlette.routing import Mount, Route
+
+TRANSPORTS = ('sse', 'streamable-http')
+# Same version string MCPGateway.run advertises over stdio
+SERVER_VERSION = "0.2.0"
+LISTENING_MESSAGE = "Listening for MCP clients on"
+
+
+def parse_listen(value: str) -> Tuple[str, int]:
+    """Parse `PORT` or `HOST:PORT`; the host defaults to loopback."""
+    host, sep, port = value.rpartition(':')
+    if not sep:
+        host = '127.0.0.1'
+    return host or '127.0.0.1', int(port)
+
+
+def initialization_options(gateway) -> InitializationOptions:
+    return InitializationOptions(
+        server_name=gateway.server.name,
+        server_version=SERVER_VERSION,
+        capabilities=gateway.server.get_capabilities(
+            notification_options=NotificationOptions(tools_changed=True),
+            experimental_capabilities={},
+        ),
+    )
+
+
+class ClientRegistry:
+    """Sessions that have listed tools, for broadcasting tools/list_changed."""
+
+    def __init__(self):
+        self._sessions = weakref.WeakSet()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def add(self, session):
+        self._sessions.add(session)
+
+    async def broadcast_tools_changed(self):
+        notification = types.ServerNotification(
+            root=types.ToolListChangedNotification(method="notifications/tools/list_changed")
+        )
+        for session in list(self._sessions):
+            try:
+                await session.send_notification(notification)
+            except Exception as e:
+                # Closed sessions drop out of the WeakSet on their own
+                Settings.logger.debug(f"Could not notify client session: {e}")
+        Settings.logger.info(f"Sent tools/list_changed notification to {len(self._sessions)} clients")
+
+
+def install_client_registry(gateway) -> ClientRegistry:
+    """Track listing sessions and route upstream tool changes to all of them."""
+    registry = ClientRegistry()
+    server = gateway.server
+    list_tools = server.request_handlers[types.ListToolsRequest]
+
+    async def registering_list_tools(req: types.ListToolsRequest):
+        registry.add(server.request_context.session)
+        return await list_tools(req)
+
+    server.request_handlers[types.ListToolsRequest] = registering_list_tools
+    gateway.upstream._tools_changed_callback = registry.broadcast_tools_changed
+    return registry
+
+
+def build_app(gateway, transport: str) -> Starlette:
+    """Starlette app serving `gateway.server` over `transport`."""
+    options = initialization_options(gateway)
+
+    if transport == 'sse':
+        sse = SseServerTransport('/messages/')
+
+        async def handle_sse(request):
+            async with sse.connect_sse(request.scope, request.receive, request._send) as (read_stream, write_stream):
+                await gateway.server.run(read_stream, write_stream, options)
+            # connect_sse already answered; Starlette still needs a response object
+            return Response()
+
+        return Starlette(routes=[
+            Route('/sse', endpoint=handle_sse, methods=['GET']),
+            Mount('/messages/', app=sse.handle_post_message),
+        ])
+
+    if transport == 'streamable-http':
+        # The session manager asks the server for its options itself
+        gateway.server.create_initialization_options = lambda *args, **kwargs: options
+        manager = StreamableHTTPSessionManager(app=gateway.server)
+
+        @contextlib.asynccontextmanager
+        async def lifespan(app):
+            async with manager.run():
+                yield
+
+        return Starlette(routes=[Mount('/mcp', app=manager.handle_request)], lifespan=lifespan)
+
+    raise ValueError(f"unknown transport {transport!r}")
+
+
+async def serve(gateway, host: str, port: int, transport: str = 'sse', on_listening: Optional[Callable[[str], None]] = None):
+    """Connect upstream, then serve clients until cancelled."""
+    if gateway.upstream.upstream_url:
+        try:
+            await gateway.upstream.connect(send_notification=False)
+        except Exception as e:
+            Settings.logger.error(f"Failed to connect to upstream server {e}")
+
+    install_client_registry(gateway)
+    app = build_app(gateway, transport)
+    # Bind before serving so the port is accepting (and known, for port 0)
+    # by the time readiness is reported.
+    sock = socket.create_server((host, port))
+    bound_host, bound_port = sock.getsockname()[:2]
+    path = '/sse' if transport == 'sse' else '/mcp'
+    url = f"http://{bound_host}:{bound_port}{path}"
+    config = uvicorn.Config(app, log_config=None, access_log=False, lifespan='on')
+    server = uvicorn.Server(config)
+    try:
+        if on_listening is not None:
+            on_listening(url)
+        Settings.logger.info(f"{LISTENING_MESSAGE} {url} ({transport})")
+        await server.serve(sockets=[sock])
+    finally:
+        sock.close()
+        await gateway.upstream.cleanup()
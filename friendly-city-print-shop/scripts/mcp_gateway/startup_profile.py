@@ -0,0 +1,103 @@
+"""Startup phase timing for `py-run-mcp-gateway.py --profile-startup`.
+
+Kept dependency-free so importing it does not skew the numbers it reports.
+"""
+import builtins
+import sys
+import time
+from typing import List, Optional, Tuple
+
+# Wall-clock reference for "since start"; close enough to interpreter start
+# because the wrapper imports this module before anything heavy.
+PROCESS_T0 = time.perf_counter()
+
+
+class ImportTimer:
+    """Record an `-X importtime`-style breakdown of imports done inside the block.
+
+    Wraps `builtins.__import__`, so only first-time imports are recorded;
+    modules already in `sys.modules` take the untouched fast path.
+    """
+
+    def __init__(self):
+        # (module, self_us, cumulative_us, depth) in completion order, like -X importtime
+        self.records: List[Tuple[str, int, int, int]] = []
+        self._stack: List[float] = []
+        self._original = None
+
+    def __enter__(self) -> 'ImportTimer':
+        self._original = builtins.__import__
+        builtins.__import__ = self._timed_import
+        return self
+
+    def __exit__(self, *exc):
+        builtins.__import__ = self._original
+        return False
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level == 0 and name in sys.modules:
+            return self._original(name, globals, locals, fromlist, level)
+        self._stack.append(0.0)
+        started = time.perf_counter()
+        try:
+            return self._original(name, globals, locals, fromlist, level)
+        finally:
+            total = time.perf_counter() - started
+            children = self._stack.pop()
+            if self._stack:
+                self._stack[-1] += total
+            self.records.append((name, int((total - children) * 1e6), int(total * 1e6), len(self._stack)))
+
+    def format(self, min_cumulative_us: int = 1000) -> List[str]:
+        lines = ['import time: self [us] | cumulative | imported package']
+        for name, self_us, cumulative_us, depth in self.records:
+            if cumulative_us >= min_cumulative_us:
+                lines.append(f"import time: {self_us:>9} | {cumulative_us:>10} | {'  ' * depth}{name}")
+        return lines
+
+
+class StartupProfiler:
+    """Print a timestamp to stderr for each startup phase when enabled.
+
+    Disabled profilers are no-ops, so call sites can mark phases
+    unconditionally.
+    """
+
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+        self.phases: List[Tuple[str, float]] = []
+        self.import_timer: Optional[ImportTimer] = ImportTimer() if enabled else None
+        self._last = PROCESS_T0
+        self._reported = False
+
+    def mark(self, phase: str):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.phases.append((phase, now))
+        _write_lines([
+            f'STARTUP_PROFILE phase={phase} since_start_ms={(now - PROCESS_T0) * 1000:.1f} '
+            f'delta_ms={(now - self._last) * 1000:.1f}'
+        ])
+        self._last = now
+
+    def report(self):
+        """Print the import breakdown and phase summary once.
+
+        Called after the last startup phase: `stdio_entered`, or `ready`
+        when the gateway listens on the network instead.
+        """
+        if not self.enabled or self._reported:
+            return
+        self._reported = True
+        lines = self.import_timer.format() if self.import_timer is not None else []
+        lines.append('STARTUP_PROFILE summary ' + ' '.join(
+            f'{phase}={(at - PROCESS_T0) * 1000:.1f}ms' for phase, at in self.phases
+        ))
+        _write_lines(lines)
+
+
+def _write_lines(lines: List[str]):
+    # One write per call, so the log thread cannot split a line on stderr
+    sys.stderr.write(''.join(line + '\n' for line in lines))
+    sys.stderr.flush()
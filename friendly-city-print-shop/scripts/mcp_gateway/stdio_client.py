@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+"""
+Pipelined asyncio JSON-RPC client for the stdio MCP gateway.
+
+Unlike the lock-step write/flush/readline loops in the debug scripts, this
+client keeps up to `window` requests in flight and matches responses to
+requests by `id`, so responses may complete out of order.
+
+Usage:
+  python scripts/mcp_gateway/stdio_client.py --upstream-url http://127.0.0.1:39300/model_context_protocol/2024-11-05/sse --requests 200 --window 16
+  python scripts/mcp_gateway/stdio_client.py --requests 200 --batch 20
+  python scripts/mcp_gateway/stdio_client.py --requests 200 --trace-dir traces && python scripts/mcp_gateway/trace_report.py traces
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import sys
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+try:
+    from .framing import LineFramer
+    from .tracing import SPAN_KIND_CLIENT, Tracer
+except ImportError:  # run as a script
+    from framing import LineFramer
+    from tracing import SPAN_KIND_CLIENT, Tracer
+
+# Bytes requested per stdout read; lines of any length are framed across reads.
+_READ_CHUNK = 256 * 1024
+
+
+class JsonRpcError(Exception):
+    """Raised by `request(..., raise_on_error=True)` for JSON-RPC error responses."""
+
+    def __init__(self, response: dict):
+        self.response = response
+        error = response.get('error') or {}
+        super().__init__(f"{error.get('code')}: {error.get('message')}")
+
+
+class PipelinedJsonRpcClient:
+    """Transport-agnostic JSON-RPC client with a bounded in-flight window.
+
+    `write_line` sends one serialized message. Responses are delivered either
+    by calling `dispatch`/`dispatch_line` (the client keeps its own id -> Future
+    map) or, when `expect` is given, by awaiting the concurrent Future that
+    `expect(msg_id)` returns (used to attach to a response router that is fed
+    from another thread).
+
+    `request_batch` sends several requests as one JSON-RPC batch line, and
+    batch responses (arrays) are dispatched element by element.
+
+    With a `tracer`, each request is a `client.request` span whose context
+    is sent in `params._meta.traceparent`, so the gateway's spans join
+    the same trace.
+    """
+
+    def __init__(
+        self,
+        write_line: Callable[[str], Awaitable[None]],
+        window: int = 32,
+        expect: Optional[Callable[[Any], Any]] = None,
+        first_id: int = 1,
+        tracer: Optional[Tracer] = None,
+    ):
+        if window < 1:
+            raise ValueError('window must be >= 1')
+        self.window = window
+        self.tracer = tracer
+        self._write_line = write_line
+        self._expect = expect
+        self._slots = asyncio.Semaphore(window)
+        self._ids = itertools.count(first_id)
+        self._pending: Dict[Any, asyncio.Future] = {}
+        self._in_flight = 0
+        self._closed_error: Optional[BaseException] = None
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def resize(self, window: int):
+        """Change the in-flight window; call while no requests are pending."""
+        if window < 1:
+            raise ValueError('window must be >= 1')
+        self.window = window
+        self._slots = asyncio.Semaphore(window)
+
+    def next_id(self) -> int:
+        return next(self._ids)
+
+    async def notify(self, method: str, params: Optional[dict] = None):
+        message = {'jsonrpc': '2.0', 'method': method}
+        if params is not None:
+            message['params'] = params
+        await self._write_line(json.dumps(message))
+
+    def _prepare(self, method: str, params: Optional[dict], msg_id: Any) -> tuple:
+        """(message, response waiter, client.request span or None) for one request."""
+        message = {'jsonrpc': '2.0', 'id': msg_id, 'method': method}
+        span = None
+        if self.tracer is not None:
+            attributes = {'rpc.method': method}
+            if method == 'tools/call' and params:
+                attributes['mcp.tool'] = params.get('name', '')
+            span = self.tracer.start_span('client.request', kind=SPAN_KIND_CLIENT, **attributes)
+            params = dict(params or {})
+            params['_meta'] = {**params.get('_meta', {}), 'traceparent': span.context.traceparent}
+        if params is not None:
+            message['params'] = params
+        if self._expect is not None:
+            waiter = asyncio.wrap_future(self._expect(msg_id))
+        else:
+            if self._closed_error is not None:
+                raise ConnectionError('client is closed') from self._closed_error
+            waiter = asyncio.get_running_loop().create_future()
+            self._pending[msg_id] = waiter
+        return message, waiter, span
+
+    def _finish(self, msg_id: Any, span, response: Optional[dict]):
+        self._in_flight -= 1
+        self._pending.pop(msg_id, None)
+        if span is not None:
+            self.tracer.end_span(span, error=response is None or 'error' in response)
+
+    async def request(
+        self,
+        method: str,
+        params: Optional[dict] = None,
+        *,
+        timeout: Optional[float] = None,
+        raise_on_error: bool = False,
+        msg_id: Any = None,
+    ) -> dict:
+        """Send one request once a window slot is free and await its response."""
+        async with self._slots:
+            if msg_id is None:
+                msg_id = self.next_id()
+            message, waiter, span = self._prepare(method, params, msg_id)
+            self._in_flight += 1
+            response = None
+            try:
+                await self._write_line(json.dumps(message))
+                response = await asyncio.wait_for(waiter, timeout)
+            finally:
+                self._finish(msg_id, span, response)
+        if raise_on_error and 'error' in response:
+            raise JsonRpcError(response)
+        return response
+
+    async def request_batch(self, calls: Iterable[tuple], *, timeout: Optional[float] = None) -> List[dict]:
+        """Send `(method, params)` calls as one JSON-RPC batch line; results keep call order.
+
+        The whole batch takes a single window slot, however many calls it holds.
+        """
+        async with self._slots:
+            prepared = []
+            responses: List[dict] = []
+            try:
+                for method, params in calls:
+                    msg_id = self.next_id()
+                    prepared.append((msg_id, *self._prepare(method, params, msg_id)))
+                    self._in_flight += 1
+                await self._write_line(json.dumps([message for _, message, _, _ in prepared]))
+                responses = await asyncio.gather(*(asyncio.wait_for(waiter, timeout) for _, _, waiter, _ in prepared))
+                return responses
+            finally:
+                for i, (msg_id, _, _, span) in enumerate(prepared):
+                    self._finish(msg_id, span, responses[i] if i < len(responses) else None)
+
+    async def request_many(self, calls: Iterable[tuple], **kwargs) -> List[dict]:
+        """Issue `(method, params)` calls concurrently; results keep call order."""
+        return await asyncio.gather(*(self.request(method, params, **kwargs) for method, params in calls))
+
+    def dispatch(self, payload: dict) -> bool:
+        """Resolve the pending request matching `payload['id']`."""
+        waiter = self._pending.get(payload.get('id'))
+        if waiter is None or waiter.done():
+            return False
+        waiter.set_result(payload)
+        return True
+
+    def dispatch_line(self, line) -> bool:
+        line = line.strip()
+        if not line:
+            return False
+        try:
+            payload = json.loads(line)
+        except ValueError:
+            return False
+        if isinstance(payload, list):
+            # A batch response: resolve each element
+            return any([self.dispatch(item) for item in payload if isinstance(item, dict) and 'method' not in item])
+        if not isinstance(payload, dict) or 'id' not in payload or 'method' in payload:
+            return False
+        return self.dispatch(payload)
+
+    def fail_pending(self, exc: BaseException):
+        """Fail every in-flight request, e.g. because the gateway exited."""
+        self._closed_error = exc
+        for waiter in list(self._pending.values()):
+            if not waiter.done():
+                waiter.set_exception(exc)
+        self._pending.clear()
+
+
+class StdioGatewayClient(PipelinedJsonRpcClient):
+    """`PipelinedJsonRpcClient` over the stdio pipes of a spawned gateway."""
+
+    def __init__(self, process: asyncio.subprocess.Process, window: int = 32, tracer: Optional[Tracer] = None,
+                 ready_fd: Optional[int] = None):
+        self.process = process
+        self.ready = asyncio.Event()
+        self.unparsed_lines: List[str] = []
+        self._ready_error: Optional[BaseException] = None
+        super().__init__(self._write, window=window, tracer=tracer)
+        self._reader_task = asyncio.ensure_future(self._read_stdout())
+        self._ready_task = asyncio.ensure_future(self._read_ready_fd(ready_fd)) if ready_fd is not None else None
+
+    @classmethod
+    async def spawn(cls, args: List[str], window: int = 32, stderr=None, tracer: Optional[Tracer] = None,
+                    **kwargs) -> 'StdioGatewayClient':
+        """Start the gateway `args` and return a client on its stdio.
+
+        On POSIX the gateway gets `--ready-fd`, so `wait_ready` works in
+        production mode too, where GATEWAY_READY is not written to stdout.
+        """
+        ready_r = ready_w = None
+        if os.name == 'posix':
+            ready_r, ready_w = os.pipe()
+            args = [*args, '--ready-fd', str(ready_w)]
+            kwargs['pass_fds'] = (*kwargs.get('pass_fds', ()), ready_w)
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *args,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=stderr if stderr is not None else asyncio.subprocess.DEVNULL,
+                **kwargs,
+            )
+        except BaseException:
+            if ready_r is not None:
+                os.close(ready_r)
+            raise
+        finally:
+            if ready_w is not None:
+                os.close(ready_w)
+        return cls(process, window=window, tracer=tracer, ready_fd=ready_r)
+
+    async def _write(self, line: str):
+        self.process.stdin.write(line.encode('utf-8') + b'\n')
+        await self.process.stdin.drain()
+
+    async def _read_stdout(self):
+        framer = LineFramer()
+        try:
+            while True:
+                chunk = await self.process.stdout.read(_READ_CHUNK)
+                if not chunk:
+                    break
+                framer.feed(chunk)
+                for frame in framer.frames():
+                    self._read_line(bytes(frame))
+            tail = framer.flush()
+            if tail is not None:
+                self._read_line(bytes(tail))
+        finally:
+            self.fail_pending(ConnectionError('gateway stdout closed'))
+
+    def _read_line(self, line: bytes):
+        if self.dispatch_line(line):
+            return
+        text = line.decode('utf-8', errors='replace')
+        if 'GATEWAY_READY' in text:
+            self.ready.set()
+        # Keep a short history of non-response output for debugging.
+        self.unparsed_lines.append(text)
+        del self.unparsed_lines[:-200]
+
+    async def _read_ready_fd(self, ready_fd: int):
+        # The gateway writes GATEWAY_READY and closes its end; EOF alone means it exited first
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader()
+        transport, _ = await loop.connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(reader), os.fdopen(ready_fd, 'rb', buffering=0))
+        try:
+            data = await reader.read()
+        finally:
+            transport.close()
+        if b'GATEWAY_READY' not in data and not self.ready.is_set():
+            self._ready_error = ConnectionError('gateway exited before it was ready')
+        self.ready.set()
+
+    async def wait_ready(self, timeout: float = 10.0):
+        """Wait for GATEWAY_READY on the ready pipe (see `spawn`) or stdout, or a successful `initialize`."""
+        await asyncio.wait_for(self.ready.wait(), timeout)
+        if self._ready_error is not None:
+            raise self._ready_error
+
+    async def initialize(self, client_name: str = 'pipelined-client', timeout: Optional[float] = 10.0) -> dict:
+        response = await self.request('initialize', {
+            'protocolVersion': '2024-11-05',
+            'capabilities': {},
+            'clientInfo': {'name': client_name, 'version': '1.0.0'},
+        }, timeout=timeout)
+        # An answered initialize means the gateway is serving, however it was started
+        self.ready.set()
+        await self.notify('notifications/initialized', {})
+        return response
+
+    async def close(self, timeout: float = 5.0, grace: float = 2.0):
+        if self.process.stdin and not self.process.stdin.is_closing():
+            self.process.stdin.close()
+        if self.process.returncode is None:
+            # The gateway exits on stdin EOF, after writing its logs and traces
+            try:
+                await asyncio.wait_for(self.process.wait(), grace)
+            except asyncio.TimeoutError:
+                pass
+        if self.process.returncode is None:
+            self.process.terminate()
+            try:
+                await asyncio.wait_for(self.process.wait(), timeout)
+            except asyncio.TimeoutError:
+                self.process.kill()
+                await self.process.wait()
+        self._reader_task.cancel()
+        if self._ready_task is not None:
+            self._ready_task.cancel()
+
+
+def gateway_command(upstream_url: str, *extra: str) -> List[str]:
+    script = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'py-run-mcp-gateway.py')
+    return [sys.executable, script, '--upstream-url', upstream_url, *extra]
+
+
+async def _run_cli(args):
+    extra: List[str] = []
+    tracer = None
+    if args.trace_dir:
+        # The client's and the gateway's spans go to separate files in one directory
+        os.makedirs(args.trace_dir, exist_ok=True)
+        tracer = Tracer(os.path.join(args.trace_dir, 'client.otlp.jsonl'), service_name='mcp-stdio-client')
+        extra = ['--trace-file', os.path.join(args.trace_dir, 'gateway.otlp.jsonl')]
+    client = await StdioGatewayClient.spawn(gateway_command(args.upstream_url, *extra), window=args.window, tracer=tracer)
+    try:
+        await client.wait_ready(args.ready_timeout)
+        await client.initialize()
+        calls = [('tools/call', {'name': 'echo', 'arguments': {'text': f'hello {i}'}}) for i in range(args.requests)]
+        started = time.perf_counter()
+        if args.batch > 1:
+            batches = [calls[i:i + args.batch] for i in range(0, len(calls), args.batch)]
+            results = await asyncio.gather(*(client.request_batch(batch, timeout=args.timeout) for batch in batches))
+            responses = [response for result in results for response in result]
+        else:
+            responses = await client.request_many(calls, timeout=args.timeout)
+        elapsed = time.perf_counter() - started
+        errors = sum(1 for r in responses if 'error' in r)
+        print(json.dumps({
+            'requests': len(responses),
+            'errors': errors,
+            'window': args.window,
+            'batch': args.batch,
+            'seconds': round(elapsed, 4),
+            'requests_per_second': round(len(responses) / elapsed, 2) if elapsed else None,
+        }))
+    finally:
+        await client.close()
+        if tracer is not None:
+            tracer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Drive py-run-mcp-gateway.py with pipelined requests')
+    parser.add_argument('--upstream-url', default='http://127.0.0.1:39300/model_context_protocol/2024-11-05/sse')
+    parser.add_argument('--requests', type=int, default=100, help='Number of echo tool calls to send')
+    parser.add_argument('--window', type=int, default=16, help='Maximum requests in flight')
+    parser.add_argument('--batch', type=int, default=1, help='Send calls as JSON-RPC batches of this size')
+    parser.add_argument('--timeout', type=float, default=30.0, help='Per-request timeout in seconds')
+    parser.add_argument('--ready-timeout', type=float, default=30.0)
+    parser.add_argument('--trace-dir', help='Trace client and gateway spans into this directory (see trace_report.py)')
+    asyncio.run(_run_cli(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+"""The gateway's stdio transport: `mcp.server.stdio.stdio_server` plus batches.
+
+Each stdin line is one JSON-RPC message or a batch (a JSON array of
+messages). The messages of a batch go to the session one by one, so they
+are handled concurrently like any others. Their responses are held back
+and written together as one array line once every request of the batch
+has been answered. A request the client cancels (`notifications/cancelled`)
+is no longer waited for, since it may never be answered (a queued request
+dropped by admission control is not), and a response that still comes
+for it is written on its own line. An element that is not a valid
+message gets an `Invalid Request` error in the batch response, with the
+element's id if it has a usable one and null otherwise. A batch of only
+notifications gets no response, and an empty batch gets a single
+`Invalid Request` error, as JSON-RPC 2.0 specifies. Messages the server
+sends on its own (notifications, requests) are written as single lines.
+
+stdin and stdout are handled as bytes. Reads go into one reusable
+`LineFramer` buffer (see `framing.py`), every line is copied once into
+`bytes` for pydantic to parse, and responses are serialised straight to
+`bytes`, so no payload passes through `str`. A caller-supplied `stdin`
+is an async iterable of chunks (`str` or `bytes`, usually lines), and a
+caller-supplied `stdout` is written `bytes`.
+
+`install_stdio_transport` makes it the stdio server `MCPGateway.run`
+uses. With a `Tracer`, the parse and response-write time of every
+request is recorded (see `tracing.py`).
+"""
+import json
+import sys
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+import anyio
+import anyio.lowlevel
+import anyio.to_thread
+import mcp.types as types
+from mcp.shared.message import SessionMessage
+from pydantic import TypeAdapter, ValidationError
+
+from .framing import LineFramer
+
+INVALID_REQUEST = -32600
+_MESSAGE = TypeAdapter(types.JSONRPCMessage)
+
+
+def _invalid_request(msg_id: Any = None) -> bytes:
+    return json.dumps(
+        {'jsonrpc': '2.0', 'id': msg_id, 'error': {'code': INVALID_REQUEST, 'message': 'Invalid Request'}}).encode()
+
+
+def _element_id(item: Any) -> Any:
+    """The id of an invalid batch element, if it has one a client could match."""
+    msg_id = item.get('id') if isinstance(item, dict) else None
+    return msg_id if isinstance(msg_id, (str, int)) and not isinstance(msg_id, bool) else None
+
+
+class _Batch:
+    """Responses of one client batch, written once every request is answered."""
+
+    __slots__ = ('pending', 'lines', 'roots')
+
+    def __init__(self):
+        self.pending = set()
+        self.lines: List[bytes] = []
+        self.roots: List[Any] = []
+
+
+def stdio_server_factory(tracer=None, on_entered: Optional[Callable[[], None]] = None):
+    """Return a `stdio_server(stdin=None, stdout=None)` that understands batches.
+
+    `on_entered` is called once the server is reading and writing.
+    """
+
+    @asynccontextmanager
+    async def stdio_server(stdin=None, stdout=None):
+        framer = LineFramer()
+        if not stdin:
+            reader = sys.stdin.buffer
+            # At most one read per call, so a line is handled as soon as it arrives
+            readinto = getattr(reader, 'readinto1', reader.readinto)
+
+            async def receive() -> bool:
+                count = await anyio.to_thread.run_sync(readinto, framer.writable())
+                framer.commit(count or 0)
+                return bool(count)
+        else:
+            chunks = stdin.__aiter__()
+
+            async def receive() -> bool:
+                try:
+                    chunk = await chunks.__anext__()
+                except StopAsyncIteration:
+                    return False
+                framer.feed(chunk)
+                return True
+        if not stdout:
+            writer = sys.stdout.buffer
+
+            def write_and_flush(data: bytes) -> int:
+                # Taken in the worker thread as the line is handed to the OS. After
+                # the write it could run late: the thread first has to get the GIL
+                # back, by which time the client may already have read the line.
+                handed_ns = time.time_ns()
+                writer.write(data)
+                writer.flush()
+                return handed_ns
+
+            async def emit(data: bytes) -> int:
+                return await anyio.to_thread.run_sync(write_and_flush, data)
+        else:
+            async def emit(data: bytes) -> int:
+                handed_ns = time.time_ns()
+                await stdout.write(data)
+                await stdout.flush()
+                return handed_ns
+
+        read_stream_writer, read_stream = anyio.create_memory_object_stream(0)
+        write_stream, write_stream_reader = anyio.create_memory_object_stream(0)
+        # Request id -> the batch it arrived in, until it is answered
+        batches: Dict[Any, _Batch] = {}
+        write_lock = anyio.Lock()
+
+        async def write_line(line: bytes) -> int:
+            """Write and flush one line; return when it was handed over (ns)."""
+            async with write_lock:
+                return await emit(line + b'\n')
+
+        async def write_batch(batch: _Batch):
+            written_ns = await write_line(b'[' + b','.join(batch.lines) + b']') if batch.lines else time.time_ns()
+            if tracer is not None:
+                for answered in batch.roots:
+                    tracer.response_written(answered, written_ns)
+
+        async def forward(message: types.JSONRPCMessage):
+            await read_stream_writer.send(SessionMessage(message))
+            root = message.root
+            if isinstance(root, types.JSONRPCNotification) and root.method == 'notifications/cancelled':
+                # Stop holding the batch for a request that may never be answered
+                request_id = (root.params or {}).get('requestId')
+                batch = batches.pop(request_id, None)
+                if batch is not None:
+                    batch.pending.discard(request_id)
+                    if not batch.pending:
+                        await write_batch(batch)
+
+        async def read_batch(line: bytes, started_ns: int) -> Optional[List[types.JSONRPCMessage]]:
+            try:
+                items = json.loads(line)
+            except ValueError as exc:
+                await read_stream_writer.send(exc)
+                return None
+            if not items:
+                await write_line(_invalid_request())
+                return None
+            batch = _Batch()
+            messages = []
+            for item in items:
+                try:
+                    message = types.JSONRPCMessage.model_validate(item)
+                except ValidationError:
+                    batch.lines.append(_invalid_request(_element_id(item)))
+                    continue
+                if isinstance(message.root, types.JSONRPCRequest):
+                    batch.pending.add(message.root.id)
+                    batches[message.root.id] = batch
+                messages.append(message)
+            if not batch.pending:
+                await write_batch(batch)
+            if tracer is not None:
+                parsed_ns = time.time_ns()
+                for message in messages:
+                    tracer.request_received(message.root, started_ns, parsed_ns)
+            return messages
+
+        async def read_line(line: bytes):
+            started_ns = time.time_ns()
+            if line.lstrip().startswith(b'['):
+                for message in await read_batch(line, started_ns) or ():
+                    await forward(message)
+                return
+            try:
+                message = types.JSONRPCMessage.model_validate_json(line)
+            except Exception as exc:
+                await read_stream_writer.send(exc)
+                return
+            if tracer is not None:
+                tracer.request_received(message.root, started_ns, time.time_ns())
+            await forward(message)
+
+        async def stdin_reader():
+            try:
+                async with read_stream_writer:
+                    while await receive():
+                        # pydantic cannot parse a memoryview: one copy per line
+                        for line in [bytes(frame) for frame in framer.frames()]:
+                            await read_line(line)
+                    tail = framer.flush()
+                    if tail is not None:
+                        await read_line(bytes(tail))
+            except anyio.ClosedResourceError:
+                await anyio.lowlevel.checkpoint()
+
+        async def stdout_writer():
+            try:
+                async with write_stream_reader:
+                    async for session_message in write_stream_reader:
+                        root = session_message.message.root
+                        line = _MESSAGE.dump_json(session_message.message, by_alias=True, exclude_none=True)
+                        batch = None
+                        if isinstance(root, (types.JSONRPCResponse, types.JSONRPCError)):
+                            batch = batches.pop(root.id, None)
+                        if batch is None:
+                            written_ns = await write_line(line)
+                            if tracer is not None:
+                                tracer.response_written(root, written_ns)
+                            continue
+                        batch.pending.discard(root.id)
+                        batch.lines.append(line)
+                        batch.roots.append(root)
+                        if not batch.pending:
+                            await write_batch(batch)
+            except anyio.ClosedResourceError:
+                await anyio.lowlevel.checkpoint()
+
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(stdin_reader)
+            tg.start_soon(stdout_writer)
+            if on_entered is not None:
+                on_entered()
+            yield read_stream, write_stream
+
+    return stdio_server
+
+
+def install_stdio_transport(tracer=None, on_entered: Optional[Callable[[], None]] = None):
+    """Serve the gateway's stdio with `stdio_server_factory(tracer, on_entered)`."""
+    import mcp.server.stdio as stdio_mod
+
+    stdio_mod.stdio_server = stdio_server_factory(tracer, on_entered)
@@ -0,0 +1,108 @@
+"""Opt-in memoization of deterministic tool calls.
+
+Only tools given a TTL (`--memoize-tool echo=60`) are cached. Entries are
+keyed by tool name plus canonical JSON of the arguments, and are evicted
+least-recently-used first when either `max_entries` or `max_bytes` (the
+serialized size of the cached results) would be exceeded.
+
+Only successful upstream results are stored: results flagged `isError`
+are skipped, and JSON-RPC errors (e.g. the ask_pieces_ltm "FAIL" path)
+surface as exceptions and never reach the cache.
+"""
+import json
+import math
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Optional
+
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+
+
+def parse_memoize_specs(specs: Iterable[str]) -> Dict[str, float]:
+    """Parse `name=ttl_seconds` CLI values into a policy dict."""
+    policies = {}
+    for spec in specs:
+        name, sep, ttl = spec.partition('=')
+        if not sep or not name:
+            raise ValueError(f"expected TOOL=TTL_SECONDS, got {spec!r}")
+        policies[name] = float(ttl)
+        if not math.isfinite(policies[name]) or policies[name] <= 0:
+            raise ValueError(f"TTL for {name!r} must be a finite number of seconds > 0")
+    return policies
+
+
+def cache_key(name: str, arguments: Optional[dict]) -> str:
+    return name + '\0' + json.dumps(arguments or {}, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+
+
+class ToolResultCache:
+    """LRU cache of `CallToolResult`s bounded by entry count and bytes."""
+
+    def __init__(
+        self,
+        policies: Dict[str, float],
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.policies = {name: ttl for name, ttl in policies.items() if ttl > 0}
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes_held = 0
+        self._clock = clock
+        # key -> (result, size_bytes, expires_at); most recently used last
+        self._entries: 'OrderedDict[str, tuple]' = OrderedDict()
+
+    def enabled_for(self, name: str) -> bool:
+        return name in self.policies
+
+    def get(self, name: str, arguments: Optional[dict]):
+        if name not in self.policies:
+            return None
+        key = cache_key(name, arguments)
+        entry = self._entries.get(key)
+        if entry is not None and self._clock() < entry[2]:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+        if entry is not None:
+            self._remove(key)
+        self.misses += 1
+        return None
+
+    def put(self, name: str, arguments: Optional[dict], result) -> bool:
+        """Store `result` if its tool is memoized and it is not an error."""
+        ttl = self.policies.get(name)
+        if ttl is None or getattr(result, 'isError', False):
+            return False
+        size = len(result.model_dump_json(by_alias=True, exclude_none=True))
+        if size > self.max_bytes:
+            return False
+        key = cache_key(name, arguments)
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (result, size, self._clock() + ttl)
+        self.bytes_held += size
+        while len(self._entries) > self.max_entries or self.bytes_held > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+        return True
+
+    def _remove(self, key: str):
+        _, size, _ = self._entries.pop(key)
+        self.bytes_held -= size
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+            'entries': len(self._entries),
+            'bytes_held': self.bytes_held,
+            'evictions': self.evictions,
+        }
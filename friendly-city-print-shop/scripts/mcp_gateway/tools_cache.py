@@ -0,0 +1,103 @@
+"""In-memory `tools/list` cache for the gateway wrapper.
+
+The stock handler checks PiecesOS status and the upstream connection on
+every `tools/list`, then rebuilds the same `ListToolsResult`. The catalog
+almost never changes, so `install_tools_list_cache` puts a cache in front
+of that handler: hits return the previously built `ServerResult` as-is.
+
+Entries expire after `ttl` seconds, and are dropped whenever the upstream
+connection refreshes its tool list (on connect/reconnect and on an upstream
+`notifications/tools/list_changed`). A fill that was in flight when the
+entry was dropped is returned to its callers but not cached.
+"""
+import asyncio
+import time
+from typing import Callable, Dict, Optional
+
+import mcp.types as types
+
+
+class ToolsListCache:
+    """Single-entry TTL cache with hit/miss counters."""
+
+    def __init__(self, ttl: float, clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._clock = clock
+        self._value = None
+        self._expires_at = 0.0
+        # Bumped by invalidate(), so a fill started before it is not cached
+        self._generation = 0
+        self._fill_lock = asyncio.Lock()
+
+    def get(self):
+        if self._value is not None and self._clock() < self._expires_at:
+            self.hits += 1
+            return self._value
+        return None
+
+    def put(self, value):
+        self._value = value
+        self._expires_at = self._clock() + self.ttl
+
+    def invalidate(self):
+        if self._value is not None:
+            self.invalidations += 1
+        self._value = None
+        self._generation += 1
+
+    async def get_or_fill(self, fill):
+        """Return the cached value, or await `fill()` once for all concurrent callers."""
+        value = self.get()
+        if value is not None:
+            return value
+        async with self._fill_lock:
+            value = self.get()
+            if value is not None:
+                return value
+            self.misses += 1
+            generation = self._generation
+            value = await fill()
+            if generation == self._generation:
+                self.put(value)
+            return value
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'ttl_seconds': self.ttl,
+        }
+
+
+def install_tools_list_cache(gateway, ttl: float) -> Optional[ToolsListCache]:
+    """Serve `gateway`'s `tools/list` from a `ToolsListCache`; `ttl <= 0` disables it.
+
+    Call after `gateway.upstream` is final: the cache hooks its
+    `update_tools` to invalidate on catalog refreshes.
+    """
+    if ttl <= 0:
+        return None
+    cache = ToolsListCache(ttl)
+    server = gateway.server
+    uncached = server.request_handlers[types.ListToolsRequest]
+
+    async def cached_list_tools(req: types.ListToolsRequest):
+        return await cache.get_or_fill(lambda: uncached(req))
+
+    server.request_handlers[types.ListToolsRequest] = cached_list_tools
+
+    upstream = gateway.upstream
+    update_tools = upstream.update_tools
+
+    async def update_tools_and_invalidate(*args, **kwargs):
+        try:
+            return await update_tools(*args, **kwargs)
+        finally:
+            cache.invalidate()
+
+    upstream.update_tools = update_tools_and_invalidate
+    return cache
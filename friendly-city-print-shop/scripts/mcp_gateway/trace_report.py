@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Per-phase latency breakdown of traced gateway requests.
+
+Reads OTLP JSON-lines files written by `py-run-mcp-gateway.py --trace-file`
+and by traced clients (`stdio_client.py --trace-dir`, or the benchmark
+with `MCP_BENCH_TRACE_DIR`), joins spans by trace id and reports, per
+request kind (method, plus tool for `tools/call`), every phase's count,
+mean, p50, p95 and p99 and its mean as a share of the end-to-end time.
+End to end is the trace's root span: `client.request` when the client
+traced, otherwise `gateway.request` (stdio) or `gateway.handler`.
+
+Besides the spans themselves (see `tracing.py`) two phases are derived:
+  client.pipe            client.request minus gateway.request: the stdio
+                         pipes and the client's own overhead
+  gateway.handler.local  gateway.handler minus its upstream.request spans:
+                         caches, PiecesOS validation, result conversion
+
+Usage:
+  python scripts/mcp_gateway/trace_report.py traces/
+  python scripts/mcp_gateway/trace_report.py gateway.otlp.jsonl client.otlp.jsonl --json
+"""
+import argparse
+import json
+import os
+import sys
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+
+PHASES = (
+    'client.request',
+    'client.pipe',
+    'gateway.request',
+    'gateway.stdio.parse',
+    'gateway.dispatch',
+    'gateway.handler',
+    'gateway.handler.local',
+    'upstream.request',
+    'upstream.post',
+    'upstream.sse_wait',
+    'gateway.stdio.write',
+)
+
+
+def _attributes(span: dict) -> Dict[str, str]:
+    return {a['key']: next(iter(a['value'].values()), '') for a in span.get('attributes', ())}
+
+
+def load_spans(paths: Iterable[str]) -> List[dict]:
+    """Flatten the spans of every OTLP export in `paths` (files or directories)."""
+    files: List[str] = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith('.jsonl'))
+        else:
+            files.append(path)
+    spans = []
+    for name in files:
+        with open(name, encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                for resource in json.loads(line).get('resourceSpans', ()):
+                    for scope in resource.get('scopeSpans', ()):
+                        for span in scope.get('spans', ()):
+                            spans.append({
+                                'trace': span['traceId'],
+                                'id': span['spanId'],
+                                'parent': span.get('parentSpanId'),
+                                'name': span['name'],
+                                'seconds': (int(span['endTimeUnixNano']) - int(span['startTimeUnixNano'])) / 1e9,
+                                'attributes': _attributes(span),
+                            })
+    return spans
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    # Nearest rank, as in the gateway benchmark
+    rank = max(1, int(round(pct / 100.0 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def _trace_phases(spans: List[dict]) -> Optional[tuple]:
+    """(kind, root seconds, {phase: seconds}) for the spans of one trace."""
+    ids = {s['id'] for s in spans}
+    roots = [s for s in spans if s['parent'] not in ids]
+    if len(roots) != 1:
+        # Incomplete (e.g. the run was cut short) or unrelated spans
+        return None
+    root = roots[0]
+    method = root['attributes'].get('rpc.method', '?')
+    tool = root['attributes'].get('mcp.tool')
+    kind = f'{method}:{tool}' if tool else method
+    phases: Dict[str, float] = defaultdict(float)
+    for span in spans:
+        phases[span['name']] += span['seconds']
+    if 'client.request' in phases and 'gateway.request' in phases:
+        phases['client.pipe'] = phases['client.request'] - phases['gateway.request']
+    if 'gateway.handler' in phases:
+        phases['gateway.handler.local'] = phases['gateway.handler'] - phases.get('upstream.request', 0.0)
+    return kind, root['seconds'], phases
+
+
+def summarize(spans: List[dict]) -> Dict[str, dict]:
+    """`{kind: {'requests': n, 'phases': {phase: stats}}}`, times in milliseconds."""
+    by_trace: Dict[str, List[dict]] = defaultdict(list)
+    for span in spans:
+        by_trace[span['trace']].append(span)
+    totals: Dict[str, List[float]] = defaultdict(list)
+    samples: Dict[str, Dict[str, List[float]]] = defaultdict(lambda: defaultdict(list))
+    for trace_spans in by_trace.values():
+        result = _trace_phases(trace_spans)
+        if result is None:
+            continue
+        kind, total, phases = result
+        totals[kind].append(total)
+        for phase, seconds in phases.items():
+            samples[kind][phase].append(seconds)
+
+    summary = {}
+    for kind in sorted(samples):
+        mean_total = sum(totals[kind]) / len(totals[kind])
+        phases = {}
+        order = [p for p in PHASES if p in samples[kind]] + sorted(set(samples[kind]) - set(PHASES))
+        for phase in order:
+            values = sorted(samples[kind][phase])
+            mean = sum(values) / len(values)
+            phases[phase] = {
+                'count': len(values),
+                'mean_ms': mean * 1000,
+                'p50_ms': _percentile(values, 50) * 1000,
+                'p95_ms': _percentile(values, 95) * 1000,
+                'p99_ms': _percentile(values, 99) * 1000,
+                'share': mean / mean_total if mean_total else 0.0,
+            }
+        summary[kind] = {'requests': len(totals[kind]), 'phases': phases}
+    return summary
+
+
+def format_summary(summary: Dict[str, dict]) -> str:
+    lines = []
+    for kind, entry in summary.items():
+        lines.append(f"{kind} ({entry['requests']} requests)")
+        lines.append(f"  {'phase':<24}{'count':>7}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'share':>8}")
+        for phase, s in entry['phases'].items():
+            lines.append(
+                f"  {phase:<24}{s['count']:>7}{s['mean_ms']:>10.3f}{s['p50_ms']:>10.3f}"
+                f"{s['p95_ms']:>10.3f}{s['p99_ms']:>10.3f}{s['share']:>7.1%}"
+            )
+        lines.append('')
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-phase latency breakdown of traced gateway requests')
+    parser.add_argument('paths', nargs='+', help='OTLP JSON-lines files, or directories of *.jsonl files')
+    parser.add_argument('--json', action='store_true', help='Print the summary as JSON')
+    args = parser.parse_args()
+    summary = summarize(load_spans(args.paths))
+    if not summary:
+        print('no complete traces found', file=sys.stderr)
+        sys.exit(1)
+    print(json.dumps(summary, indent=2) if args.json else format_summary(summary))
+
+
+if __name__ == '__main__':
+    main()
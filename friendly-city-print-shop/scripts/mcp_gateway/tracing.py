@@ -0,0 +1,345 @@
+"""Request tracing for the gateway wrapper, written as OTLP/JSON.
+
+Every request gets a W3C trace context. A client may send one in
+`params._meta.traceparent`; otherwise the gateway starts a trace. The
+gateway records these spans for each request:
+
+  gateway.request      stdin line read -> response line handed to stdout (stdio only)
+  gateway.stdio.parse  JSON-RPC validation of the stdin line
+  gateway.dispatch     parsed -> handler started (ServerSession, task spawn)
+  gateway.handler      the request handler, caches and validation included
+  upstream.request     ClientSession.send_request to the upstream
+  upstream.post        HTTP POST of the request to the upstream /message URL
+  upstream.sse_wait    POST answered -> reply delivered from the SSE stream
+  gateway.stdio.write  handler returned -> response line handed to stdout
+
+The upstream request carries the context on, in `_meta.traceparent` and
+as the POST's `traceparent` header, so the POST span can be attributed
+even when it is sent from the SSE transport's own task (or through the
+stream multiplexer, which rewrites ids but not `_meta`).
+
+`Tracer` batches finished spans and a writer thread appends them to a
+file, one OTLP `ExportTraceServiceRequest` JSON object per line (the
+format of the OpenTelemetry collector's file exporter). The core has no
+MCP dependency, so clients such as `stdio_client` use it too.
+`trace_report.py` turns such files into per-phase latency breakdowns.
+"""
+import json
+import os
+import re
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, IO, List, NamedTuple, Optional
+
+DEFAULT_FLUSH_INTERVAL = 1.0
+DEFAULT_BATCH_SIZE = 512
+# Requests parsed from stdin whose response has not been written yet (and
+# POST completions not yet claimed); bounded so that requests which never
+# complete cannot grow them without limit.
+MAX_OPEN_REQUESTS = 10000
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+_TRACEPARENT = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$')
+
+
+class SpanContext(NamedTuple):
+    trace_id: str
+    span_id: str
+
+    @property
+    def traceparent(self) -> str:
+        return f'00-{self.trace_id}-{self.span_id}-01'
+
+
+def parse_traceparent(value: Any) -> Optional[SpanContext]:
+    if not isinstance(value, str):
+        return None
+    match = _TRACEPARENT.match(value.strip().lower())
+    if match is None:
+        return None
+    return SpanContext(match.group(1), match.group(2))
+
+
+def _meta_traceparent(params: Any) -> Optional[SpanContext]:
+    """The context in a raw `params` dict's `_meta`, if any."""
+    if not isinstance(params, dict):
+        return None
+    meta = params.get('_meta')
+    return parse_traceparent(meta.get('traceparent')) if isinstance(meta, dict) else None
+
+
+# Span of the code that is running, for children started further down
+current_span: ContextVar[Optional[SpanContext]] = ContextVar('mcp_gateway_current_span', default=None)
+
+
+class Span:
+    __slots__ = ('name', 'context', 'parent_id', 'kind', 'start_ns', 'end_ns', 'attributes', 'error')
+
+    def __init__(self, name: str, parent: Optional[SpanContext] = None, start_ns: Optional[int] = None,
+                 kind: int = SPAN_KIND_INTERNAL, attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.context = SpanContext(parent.trace_id if parent else os.urandom(16).hex(), os.urandom(8).hex())
+        self.parent_id = parent.span_id if parent else None
+        self.kind = kind
+        self.start_ns = start_ns if start_ns is not None else time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes or {}
+        self.error = False
+
+    def to_otlp(self) -> dict:
+        span = {
+            'traceId': self.context.trace_id,
+            'spanId': self.context.span_id,
+            'name': self.name,
+            'kind': self.kind,
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.end_ns),
+            'attributes': [{'key': k, 'value': _otlp_value(v)} for k, v in self.attributes.items()],
+            'status': {'code': STATUS_ERROR if self.error else STATUS_OK},
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        return span
+
+
+def _otlp_value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+class _InboundRequest:
+    """A stdin request between parsing and its response being written."""
+    __slots__ = ('span', 'parsed_ns', 'handled_ns')
+
+    def __init__(self, span: Span, parsed_ns: int):
+        self.span = span
+        self.parsed_ns = parsed_ns
+        self.handled_ns: Optional[int] = None
+
+
+class Tracer:
+    """Collect finished spans and append them to `path` from a writer thread."""
+
+    def __init__(self, path: str, service_name: str = 'mcp-gateway',
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL, batch_size: int = DEFAULT_BATCH_SIZE):
+        self.path = path
+        self.service_name = service_name
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.exported = 0
+        self._pending: List[Span] = []
+        self._cond = threading.Condition()
+        self._closed = False
+        self._stream: IO[str] = open(path, 'a', encoding='utf-8')
+        # Keyed by JSON-RPC id (stdio) and by upstream.request span id (POSTs)
+        self._inbound: Dict[Any, _InboundRequest] = {}
+        self._posted: Dict[str, int] = {}
+        self._thread = threading.Thread(target=self._run, name='mcp-trace-writer', daemon=True)
+        self._thread.start()
+
+    def start_span(self, name: str, parent: Optional[SpanContext] = None, start_ns: Optional[int] = None,
+                   kind: int = SPAN_KIND_INTERNAL, **attributes) -> Span:
+        return Span(name, parent, start_ns, kind, attributes)
+
+    def end_span(self, span: Span, end_ns: Optional[int] = None, error: bool = False):
+        span.end_ns = end_ns if end_ns is not None else time.time_ns()
+        span.error = span.error or error
+        with self._cond:
+            self._pending.append(span)
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify()
+
+    def record(self, name: str, parent: Optional[SpanContext], start_ns: int, end_ns: int, **attributes):
+        """Export a span whose start and end are already known."""
+        self.end_span(Span(name, parent, start_ns, SPAN_KIND_INTERNAL, attributes), end_ns)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {'exported': self.exported, 'pending': len(self._pending), 'open_requests': len(self._inbound)}
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._closed and len(self._pending) < self.batch_size:
+                    self._cond.wait(self.flush_interval)
+                batch, self._pending = self._pending, []
+                closed = self._closed
+            if batch:
+                self._write(batch)
+            if closed:
+                return
+
+    def _write(self, batch: List[Span]):
+        payload = {'resourceSpans': [{
+            'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': self.service_name}}]},
+            'scopeSpans': [{'scope': {'name': 'mcp_gateway.tracing'}, 'spans': [s.to_otlp() for s in batch]}],
+        }]}
+        try:
+            self._stream.write(json.dumps(payload, separators=(',', ':')) + '\n')
+            self._stream.flush()
+            self.exported += len(batch)
+        except (OSError, ValueError):
+            pass
+
+    def close(self):
+        """Write the remaining spans and close the file."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout=10)
+        self._stream.close()
+
+    # stdio transport hooks
+
+    def request_received(self, message: Any, started_ns: int, parsed_ns: int):
+        """A JSON-RPC request was parsed from stdin; start its root span."""
+        msg_id = getattr(message, 'id', None)
+        method = getattr(message, 'method', None)
+        if msg_id is None or method is None:
+            return
+        params = message.params
+        attributes = {'rpc.system': 'jsonrpc', 'rpc.method': method, 'rpc.jsonrpc.request_id': str(msg_id)}
+        if method == 'tools/call' and isinstance(params, dict):
+            attributes['mcp.tool'] = str(params.get('name', ''))
+        root = Span('gateway.request', _meta_traceparent(params), started_ns, SPAN_KIND_SERVER, attributes)
+        self.record('gateway.stdio.parse', root.context, started_ns, parsed_ns)
+        if len(self._inbound) >= MAX_OPEN_REQUESTS:
+            self._inbound.pop(next(iter(self._inbound)))
+        self._inbound[msg_id] = _InboundRequest(root, parsed_ns)
+
+    def response_written(self, message: Any, written_ns: int):
+        """A response line was handed to stdout at `written_ns`; close its request's spans."""
+        inbound = self._inbound.pop(getattr(message, 'id', None), None)
+        if inbound is None:
+            return
+        if inbound.handled_ns is not None:
+            self.record('gateway.stdio.write', inbound.span.context, inbound.handled_ns, written_ns)
+        self.end_span(inbound.span, written_ns, error=hasattr(message, 'error'))
+
+    # upstream HTTP hooks
+
+    def httpx_client_factory(self, headers=None, timeout=None, auth=None):
+        """`sse_client(httpx_client_factory=...)` that traces request POSTs."""
+        from mcp.shared._httpx_utils import create_mcp_http_client
+
+        client = create_mcp_http_client(headers=headers, timeout=timeout, auth=auth)
+        client.event_hooks['request'].append(self._on_http_request)
+        client.event_hooks['response'].append(self._on_http_response)
+        return client
+
+    async def _on_http_request(self, request):
+        if request.method != 'POST' or b'traceparent' not in request.content:
+            return
+        try:
+            payload = json.loads(request.content)
+        except ValueError:
+            return
+        # A batch POST carries several requests, each with its own context
+        messages = payload if isinstance(payload, list) else [payload]
+        parents = [
+            parent for parent in (_meta_traceparent(m.get('params')) for m in messages if isinstance(m, dict))
+            if parent is not None
+        ]
+        if parents:
+            # The header holds one context; for a batch, its first request's
+            request.headers['traceparent'] = parents[0].traceparent
+            request.extensions['mcp_trace'] = (parents, time.time_ns())
+
+    async def _on_http_response(self, response):
+        traced = response.request.extensions.get('mcp_trace')
+        if traced is None:
+            return
+        parents, started_ns = traced
+        now = time.time_ns()
+        for parent in parents:
+            self.record('upstream.post', parent, started_ns, now, **{'http.status_code': response.status_code})
+            # Popped by the upstream.request span, unless the reply beat the POST response
+            if len(self._posted) >= MAX_OPEN_REQUESTS:
+                self._posted.pop(next(iter(self._posted)))
+            self._posted[parent.span_id] = now
+
+
+def install_request_tracing(gateway, tracer: Tracer):
+    """Trace `gateway`'s stdio transport, request handlers and upstream calls."""
+    import functools
+
+    import mcp.types as types
+    from mcp import ClientSession
+    from mcp.server.lowlevel.server import request_ctx
+    from pieces.mcp import gateway as pieces_gateway
+
+    from .stdio_transport import install_stdio_transport
+
+    install_stdio_transport(tracer)
+    # Upstream sessions look `sse_client` up on this module at connect time
+    pieces_gateway.sse_client = functools.partial(pieces_gateway.sse_client, httpx_client_factory=tracer.httpx_client_factory)
+
+    handlers = gateway.server.request_handlers
+    for request_type, handler in list(handlers.items()):
+        async def traced(req, handler=handler):
+            ctx = request_ctx.get()
+            started_ns = time.time_ns()
+            inbound = tracer._inbound.get(ctx.request_id)
+            if inbound is not None:
+                parent = inbound.span.context
+                tracer.record('gateway.dispatch', parent, inbound.parsed_ns, started_ns)
+            else:
+                # Not stdio (--listen): the handler span is the gateway's root
+                meta = ctx.meta.model_dump() if ctx.meta is not None else {}
+                parent = parse_traceparent(meta.get('traceparent'))
+            attributes = {'rpc.method': req.method}
+            if isinstance(req, types.CallToolRequest):
+                attributes['mcp.tool'] = req.params.name
+            span = tracer.start_span('gateway.handler', parent, started_ns, **attributes)
+            token = current_span.set(span.context)
+            error = True
+            try:
+                result = await handler(req)
+                # Handlers report tool failures as results rather than raising
+                error = bool(getattr(getattr(result, 'root', None), 'isError', False))
+                return result
+            finally:
+                current_span.reset(token)
+                tracer.end_span(span, error=error)
+                if inbound is not None:
+                    inbound.handled_ns = span.end_ns
+
+        handlers[request_type] = traced
+
+    send_request = ClientSession.send_request
+
+    async def traced_send_request(self, request, result_type, *args, **kwargs):
+        parent = current_span.get()
+        if parent is None:
+            # Health pings and background tool refreshes
+            return await send_request(self, request, result_type, *args, **kwargs)
+        root = request.root
+        span = tracer.start_span('upstream.request', parent, kind=SPAN_KIND_CLIENT, **{'rpc.method': root.method})
+        params = getattr(root, 'params', None)
+        if params is not None:
+            meta = params.meta or types.RequestParams.Meta()
+            meta.traceparent = span.context.traceparent
+            params.meta = meta
+        error = True
+        try:
+            result = await send_request(self, request, result_type, *args, **kwargs)
+            error = False
+            return result
+        finally:
+            tracer.end_span(span, error=error)
+            posted_ns = tracer._posted.pop(span.context.span_id, None)
+            if posted_ns is not None:
+                tracer.record('upstream.sse_wait', span.context, posted_ns, span.end_ns)
+
+    ClientSession.send_request = traced_send_request
@@ -0,0 +1,349 @@
+"""Managed upstream connections for the gateway wrapper.
+
+`PosMcpConnection` connects lazily to one upstream, pings the session on
+every `connect()` (so each tool call pays an upstream round trip) and
+gives up after one failed attempt. `ManagedPosMcpConnection` instead keeps
+SSE sessions to one or more upstreams open in background tasks:
+
+- each session is health-checked with a ping every `health_interval` seconds;
+- a failed session (ping, or a transport error during a call) is ejected
+  from rotation and reopened with jittered exponential backoff, so an
+  unhealthy upstream stops receiving calls until it reconnects;
+- `connect()` returns a live session without a ping and fails fast while
+  every session is backing off, instead of making callers wait for a cold
+  connect;
+- tool calls are spread over the live sessions of all upstreams
+  (`pool_size` per upstream), either to the one with the fewest calls in
+  flight (`least-outstanding`) or in turn (`round-robin`).
+
+One live session at a time is the primary: it discovers tools and listens
+for list_changed notifications. If it fails, another live session takes
+over. Successful results of memoized tools are served from `tool_results`
+(see `tool_memo`). `on_connected` is called once, when the first session
+is established.
+"""
+import asyncio
+import itertools
+import random
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence
+
+import mcp.types as types
+from mcp import ClientSession
+from mcp.shared.exceptions import McpError
+from pieces.mcp import gateway as pieces_gateway
+from pieces.mcp.gateway import PosMcpConnection
+from pieces.settings import Settings
+
+BALANCE_LEAST_OUTSTANDING = 'least-outstanding'
+BALANCE_ROUND_ROBIN = 'round-robin'
+BALANCE_POLICIES = (BALANCE_LEAST_OUTSTANDING, BALANCE_ROUND_ROBIN)
+
+
+def backoff_delay(attempt: int, initial: float, maximum: float, rng: Callable[[], float] = random.random) -> float:
+    """Exponential backoff with "equal jitter": half fixed, half random."""
+    cap = min(maximum, initial * (2 ** attempt))
+    return cap / 2 + rng() * cap / 2
+
+
+class _UpstreamSlot:
+    """One supervised SSE session, reopened with backoff whenever it fails."""
+
+    def __init__(self, owner: 'ManagedPosMcpConnection', index: int, url: Optional[str]):
+        self.owner = owner
+        self.index = index
+        # None: follow owner.upstream_url, which may be discovered late
+        self._url = url
+        self.session: Optional[ClientSession] = None
+        self.in_flight = 0
+        self.calls = 0
+        self.ejections = 0
+        self.reconnects = 0
+        self.connecting = False
+        self.attempt = 0
+        self.retry_at = 0.0
+        self._failed = asyncio.Event()
+
+    @property
+    def url(self) -> str:
+        return self._url or self.owner.upstream_url
+
+    def mark_failed(self):
+        """Ask the supervisor to drop this session and reconnect."""
+        self._failed.set()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self.connecting = True
+            self._failed.clear()
+            if self.attempt or self.ejections:
+                self.reconnects += 1
+            try:
+                # Looked up at call time so a patched `sse_client` is honoured.
+                async with pieces_gateway.sse_client(self.url) as (read_stream, write_stream):
+                    async with ClientSession(read_stream, write_stream) as session:
+                        if self.owner._claim_primary(self):
+                            await self.owner._prepare_primary(session)
+                        self.session = session
+                        self.connecting = False
+                        self.attempt = 0
+                        self.owner._state_changed()
+                        self.owner._first_connected()
+                        Settings.logger.info(f"Upstream session {self.index} established ({self.url})")
+                        await self._monitor(session)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                Settings.logger.info(f"Upstream session {self.index} failed ({self.url}): {type(e).__name__}: {e}")
+            finally:
+                if self.session is not None:
+                    self.ejections += 1
+                self.session = None
+                self.connecting = False
+                self.owner._session_lost(self)
+
+            delay = backoff_delay(self.attempt, self.owner.backoff_initial, self.owner.backoff_max)
+            self.attempt += 1
+            self.retry_at = loop.time() + delay
+            self.owner._state_changed()
+            Settings.logger.debug(f"Upstream session {self.index} reconnecting in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+    async def _monitor(self, session: ClientSession):
+        """Return once the session fails a health ping or is marked failed."""
+        while True:
+            try:
+                await asyncio.wait_for(self._failed.wait(), self.owner.health_interval)
+                return
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await asyncio.wait_for(session.send_ping(), self.owner.ping_timeout)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                Settings.logger.info(f"Upstream session {self.index} failed health check: {type(e).__name__}: {e}")
+                return
+
+
+class ManagedPosMcpConnection(PosMcpConnection):
+    """`PosMcpConnection` whose sessions are kept open by background supervisors."""
+
+    def __init__(
+        self,
+        upstream_url: str,
+        tools_changed_callback: Callable[[], Awaitable[None]],
+        pool_size: int = 1,
+        health_interval: float = 15.0,
+        ping_timeout: float = 5.0,
+        backoff_initial: float = 0.5,
+        backoff_max: float = 30.0,
+        connect_timeout: float = 10.0,
+        tool_results=None,
+        upstream_urls: Optional[Sequence[str]] = None,
+        balance: str = BALANCE_LEAST_OUTSTANDING,
+        on_connected: Optional[Callable[[], None]] = None,
+    ):
+        urls = list(upstream_urls or [upstream_url])
+        super().__init__(urls[0], tools_changed_callback)
+        if balance not in BALANCE_POLICIES:
+            raise ValueError(f"unknown balance policy {balance!r}")
+        self.health_interval = health_interval
+        self.ping_timeout = ping_timeout
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.connect_timeout = connect_timeout
+        self.balance = balance
+        # Optional `tool_memo.ToolResultCache`
+        self.tool_results = tool_results
+        per_upstream = max(1, pool_size)
+        self._slots: List[_UpstreamSlot] = [
+            _UpstreamSlot(self, i, url if upstream_urls else None)
+            for i, url in enumerate(url for url in urls for _ in range(per_upstream))
+        ]
+        self._tasks: List[asyncio.Task] = []
+        self._background = set()
+        self._changed = asyncio.Event()
+        self._primary: Optional[_UpstreamSlot] = None
+        self._primary_ready_once = False
+        self._turn = itertools.count()
+        self._on_connected = on_connected
+
+    @property
+    def pool_size(self) -> int:
+        return len(self._slots)
+
+    def _state_changed(self):
+        # Wake everyone waiting in connect(); they re-check the slots.
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _first_connected(self):
+        callback, self._on_connected = self._on_connected, None
+        if callback is not None:
+            callback()
+
+    def _claim_primary(self, slot: _UpstreamSlot) -> bool:
+        if self._primary is not None:
+            return False
+        self._primary = slot
+        return True
+
+    async def _prepare_primary(self, session: ClientSession):
+        # Notify the client about tool changes on reconnects, not on first start.
+        await self.update_tools(session, send_notification=self._primary_ready_once)
+        await self.setup_notification_handler(session)
+        self._primary_ready_once = True
+        self.session = session
+
+    def _session_lost(self, slot: _UpstreamSlot):
+        if self._primary is not slot:
+            return
+        self._primary = None
+        self.session = None
+        # Hand tool discovery to a session that is still up, if any.
+        successor = self._pick_slot()
+        if successor is not None:
+            task = asyncio.create_task(self._promote(successor))
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
+
+    async def _promote(self, slot: _UpstreamSlot):
+        session = slot.session
+        if session is None or not self._claim_primary(slot):
+            return
+        try:
+            await self._prepare_primary(session)
+            Settings.logger.info(f"Upstream session {slot.index} is now primary ({slot.url})")
+        except Exception as e:
+            Settings.logger.info(f"Upstream session {slot.index} could not take over as primary: {e}")
+            if self._primary is slot:
+                self._primary = None
+            slot.mark_failed()
+
+    def start(self):
+        """Start the session supervisors (idempotent)."""
+        if self._tasks:
+            return
+        if not self._try_get_upstream_url():
+            raise ValueError("Cannot get MCP upstream URL - PiecesOS may not be running")
+        for slot in self._slots:
+            # Counts as an attempt in progress before the task first runs
+            slot.connecting = True
+        self._tasks = [
+            asyncio.create_task(slot.run(), name=f"mcp-upstream-{slot.index}")
+            for slot in self._slots
+        ]
+
+    def _pick_slot(self) -> Optional[_UpstreamSlot]:
+        live = [slot for slot in self._slots if slot.session is not None]
+        if not live:
+            return None
+        if self.balance == BALANCE_ROUND_ROBIN:
+            return live[next(self._turn) % len(live)]
+        return min(live, key=lambda slot: slot.in_flight)
+
+    async def connect(self, send_notification: bool = True):
+        """Return a live upstream session, starting the supervisors on first use.
+
+        Waits (up to `connect_timeout`) only while a connection attempt is in
+        progress; while every session is backing off it raises immediately.
+        """
+        return (await self._wait_for_slot()).session
+
+    async def _wait_for_slot(self) -> _UpstreamSlot:
+        self.start()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.connect_timeout
+        while True:
+            slot = self._pick_slot()
+            if slot is not None:
+                return slot
+            if not any(s.connecting for s in self._slots):
+                retry_in = max(0.0, min(s.retry_at for s in self._slots) - loop.time())
+                raise ConnectionError(f"Upstream unavailable; next reconnect attempt in {retry_in:.1f}s")
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise TimeoutError(f"Connection establishment timed out after {self.connect_timeout:g} seconds")
+            try:
+                await asyncio.wait_for(self._changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+    @asynccontextmanager
+    async def lease(self):
+        """Borrow a live session, chosen by the balance policy, for one call."""
+        slot = await self._wait_for_slot()
+        session = slot.session
+        slot.in_flight += 1
+        slot.calls += 1
+        try:
+            yield session
+        except McpError:
+            # An error response: the session itself is fine.
+            raise
+        except Exception:
+            slot.mark_failed()
+            raise
+        finally:
+            slot.in_flight -= 1
+
+    def upstream_stats(self) -> Dict[str, dict]:
+        """Per-upstream session counts and call totals."""
+        stats: Dict[str, dict] = {}
+        for slot in self._slots:
+            entry = stats.setdefault(slot.url, {
+                'sessions': 0, 'live': 0, 'in_flight': 0, 'calls': 0, 'ejections': 0, 'reconnects': 0,
+            })
+            entry['sessions'] += 1
+            entry['live'] += slot.session is not None
+            entry['in_flight'] += slot.in_flight
+            entry['calls'] += slot.calls
+            entry['ejections'] += slot.ejections
+            entry['reconnects'] += slot.reconnects
+        return stats
+
+    async def call_tool(self, name, arguments):
+        """Calls a tool on the POS MCP server over a pooled session."""
+        Settings.logger.debug(f"Calling tool: {name}")
+
+        is_valid, error_message = self._validate_system_status(name)
+        if not is_valid:
+            Settings.logger.debug(f"Tool validation failed for {name}: {error_message}")
+            return types.CallToolResult(
+                content=[types.TextContent(type="text", text=error_message)]
+            )
+
+        if self.tool_results is not None:
+            cached = self.tool_results.get(name, arguments)
+            if cached is not None:
+                Settings.logger.debug(f"Memoized result for tool: {name}")
+                return cached
+
+        try:
+            async with self.lease() as session:
+                result = await session.call_tool(name, arguments)
+            Settings.logger.debug(f"Successfully called tool: {name}")
+            if self.tool_results is not None:
+                self.tool_results.put(name, arguments, result)
+            return result
+        except Exception as e:
+            Settings.logger.error(f"Error calling POS MCP {name}: {e}", exc_info=True)
+            return types.CallToolResult(
+                content=[types.TextContent(type="text", text=self._get_error_message_for_tool(name))]
+            )
+
+    def _schedule_cleanup(self):
+        # Called via request_cleanup() after transport errors: reconnect
+        # every session rather than tearing the connection down for good.
+        for slot in self._slots:
+            slot.mark_failed()
+
+    async def cleanup(self):
+        """Stop the supervisors and close every session."""
+        tasks, self._tasks = self._tasks + list(self._background), []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await super().cleanup()
@@ -8,24 +8,159 @@ mock MCP SSE server at `http://localhost:39300/model_context_protocol/2024-11-05
 
 Usage:
   python py-run-mcp-gateway.py --upstream-url "http://localhost:39300/model_context_protocol/2024-11-05/sse"
+  python py-run-mcp-gateway.py --mode production --ready-fd 3 --upstream-url ...
+  python py-run-mcp-gateway.py --upstream-url URL_A --upstream-url URL_B --balance round-robin
+  python py-run-mcp-gateway.py --listen 127.0.0.1:8765 --transport sse
 
 Notes:
   - Requires `pieces-cli` to be installed (pip install pieces-cli) or the
     local repository to be installed as an editable package.
   - This runs the gateway in stdio mode; you can connect a client that speaks
     the MCP stdio protocol to the gateway's stdio streams.
+  - `--mode debug` (default) logs lifecycle and per-request markers at
+    DEBUG. `--mode production` installs no per-request
+    wrappers, logs at INFO and keeps stdout for protocol traffic only; the
+    readiness marker goes to `--ready-fd` if given, otherwise to stderr.
+  - Log records (the wrapper's own and the pieces logger's) are queued and
+    written off the event loop as batched JSON lines to stderr, or to
+    `--log-file`. Only the readiness marker is ever printed to stdout.
+  - Upstream SSE sessions (`--upstream-pool-size`, default 1) are opened
+    in the background, pinged every `--upstream-health-interval` seconds
+    and reopened with jittered exponential backoff when they fail.
+  - Repeating `--upstream-url` spreads tool calls across several upstreams
+    (`--balance least-outstanding|round-robin`); a session that fails is
+    left out of rotation until it reconnects.
+  - `--share-upstream-stream` carries every upstream session over a
+    single SSE stream per upstream, with request ids remapped into a
+    gateway-unique space and responses routed back to their session.
+  - A stdin line may hold a JSON-RPC batch (an array); its responses are
+    written back as one array line. With `--upstream-batch`, upstream
+    messages that queue up while a POST is in flight are posted together
+    as one batch, unless the upstream rejects batches.
+  - `--listen [HOST:]PORT` serves MCP over HTTP (`--transport sse` at
+    `/sse`, or `streamable-http` at `/mcp`) to any number of clients from
+    this one process, sharing the upstream sessions and caches. The URL is
+    printed as `GATEWAY_LISTENING <url>` just before `GATEWAY_READY`.
+  - Request counts, errors and latency histograms (per method, and per tool
+    for `tools/call`), in-flight gauges, upstream reconnects and event-loop
+    lag are kept in Prometheus text format in debug mode or with
+    `--metrics-port PORT`, which serves them on loopback (announced as
+    `GATEWAY_METRICS <url>`). They are logged as a `metrics` record at
+    shutdown.
+  - `tools/list` is answered from memory for `--tools-cache-ttl` seconds,
+    and re-fetched early when the upstream tool list is refreshed.
+  - `--trace-file PATH` gives every request a W3C trace context (taken
+    from `params._meta.traceparent` when the client sends one) and appends
+    spans for stdio parsing, dispatch, the handler, the upstream POST and
+    the SSE reply wait to PATH as OTLP JSON lines; summarise them with
+    `scripts/mcp_gateway/trace_report.py`.
+  - At most `--max-in-flight` requests run at once; up to `--max-queued`
+    more wait (for `--queue-timeout` seconds) and the rest are refused at
+    once with a JSON-RPC "overloaded" error (-32029). Initialize, ping and
+    list requests have their own lane with `--control-slots` extra slots
+    and `--control-weight` priority, so they never wait behind slow tool
+    calls; `--tool-limit ask_pieces_ltm=4` caps one tool's concurrency.
+    `--request-timeout`
+    cancels requests that run too long (-32001), and a request cancelled
+    by its client (`notifications/cancelled`) or by a timeout is cancelled
+    upstream too.
+  - `--memoize-tool echo=60` caches successful `echo` results per
+    argument set for 60 seconds (LRU, bounded by entries and bytes).
 """
 import argparse
 import asyncio
+import logging
+import os
 import sys
 
+from mcp_gateway.logging_pipeline import DEFAULT_CAPACITY, LoggingPipeline
+from mcp_gateway.metrics import (
+    EventLoopLagMonitor, GatewayMetrics, install_request_metrics, process_collector, serve_metrics,
+    stats_collector, upstream_collector,
+)
+from mcp_gateway.startup_profile import StartupProfiler
+from mcp_gateway.tool_memo import DEFAULT_MAX_BYTES, DEFAULT_MAX_ENTRIES, ToolResultCache, parse_memoize_specs
+
+log = logging.getLogger('mcp_gateway.wrapper')
+
+DEFAULT_UPSTREAM_URL = "http://localhost:39300/model_context_protocol/2024-11-05/sse"
+
+def _announce(stream, line):
+    """Write a marker line in one call.
+
+    `print` writes the text and the newline separately, and the log
+    listener thread may write to the same stream in between.
+    """
+    stream.write(line + "\n")
+    stream.flush()
+
+
+def _install_debug_patches():
+    """Monkey-patch stdio server and ServerSession to log lifecycle events.
+
+    The imports live here so a start that skips debug patching never pays
+    for them.
+    """
+    from contextlib import asynccontextmanager
+    import mcp.server.stdio as stdio_mod
+    import mcp.server.session as session_mod
+
+    original_stdio_server = stdio_mod.stdio_server
+
+    @asynccontextmanager
+    async def debug_stdio_server(*a, **kw):
+        async with original_stdio_server(*a, **kw) as (read_stream, write_stream):
+            log.info('GATEWAY_STDIO_ENTERED', extra={'event': 'stdio_entered'})
+            yield read_stream, write_stream
+
+    stdio_mod.stdio_server = debug_stdio_server
+
+    orig_received = session_mod.ServerSession._received_request
+
+    async def patched_received_request(self, responder):
+        try:
+            # responder.request.root is a Pydantic model (types.ClientRequest)
+            root = getattr(responder, 'request', None)
+            r = getattr(root, 'root', None)
+            name = type(r).__name__ if r is not None else 'Unknown'
+            log.debug('GATEWAY_RECEIVED_REQUEST: %s', name, extra={'event': 'request_received'})
+        except Exception as e:
+            log.debug('GATEWAY_RECEIVED_REQUEST_ERROR: %s', e)
+        return await orig_received(self, responder)
+
+    session_mod.ServerSession._received_request = patched_received_request
+
+
 def main():
     parser = argparse.ArgumentParser(description="Run Pieces MCP Gateway wrapper")
     parser.add_argument(
         "--upstream-url",
-        dest="upstream_url",
-        default="http://localhost:39300/model_context_protocol/2024-11-05/sse",
-        help="Upstream SSE MCP endpoint (default: local mock server)",
+        dest="upstream_urls",
+        action="append",
+        default=None,
+        metavar="URL",
+        help="Upstream SSE MCP endpoint; repeat to balance across several (default: local mock server)",
+    )
+    parser.add_argument(
+        "--balance",
+        dest="balance",
+        choices=("least-outstanding", "round-robin"),
+        default="least-outstanding",
+        help="How tool calls are spread over upstream sessions (default: least-outstanding)",
+    )
+    parser.add_argument(
+        "--listen",
+        dest="listen",
+        default=None,
+        metavar="[HOST:]PORT",
+        help="Serve MCP over HTTP on this address instead of stdio (port 0 picks a free port)",
+    )
+    parser.add_argument(
+        "--transport",
+        dest="transport",
+        choices=("sse", "streamable-http"),
+        default="sse",
+        help="HTTP transport used with --listen (default: sse)",
     )
     parser.add_argument(
         "--server-name",
@@ -33,120 +168,428 @@ def main():
         default="pieces-stdio-mcp-local",
         help="Server name for the local MCP gateway",
     )
+    parser.add_argument(
+        "--ready-fd",
+        dest="ready_fd",
+        type=int,
+        default=None,
+        help="Inherited pipe FD; 'GATEWAY_READY' is written to it (then closed) once stdio is starting",
+    )
+    parser.add_argument(
+        "--mode",
+        dest="mode",
+        choices=("debug", "production"),
+        default="debug",
+        help="debug: lifecycle markers and DEBUG logs (default); production: no per-request hooks, INFO logs",
+    )
+    parser.add_argument(
+        "--profile-startup",
+        dest="profile_startup",
+        action="store_true",
+        help="Print per-phase startup timestamps and an import-time breakdown to stderr",
+    )
+    parser.add_argument(
+        "--upstream-pool-size",
+        dest="upstream_pool_size",
+        type=int,
+        default=1,
+        help="Number of upstream SSE sessions to keep open for tool calls (default 1)",
+    )
+    parser.add_argument(
+        "--share-upstream-stream",
+        dest="share_upstream_stream",
+        action="store_true",
+        help="Carry all sessions to an upstream over one SSE stream, remapping request ids",
+    )
+    parser.add_argument(
+        "--upstream-batch",
+        dest="upstream_batch",
+        action="store_true",
+        help="Post upstream messages that queue up together as one JSON-RPC batch",
+    )
+    parser.add_argument(
+        "--upstream-health-interval",
+        dest="upstream_health_interval",
+        type=float,
+        default=15.0,
+        help="Seconds between health pings on each upstream session",
+    )
+    parser.add_argument(
+        "--tools-cache-ttl",
+        dest="tools_cache_ttl",
+        type=float,
+        default=300.0,
+        help="Seconds to serve tools/list from memory (0 disables the cache)",
+    )
+    parser.add_argument(
+        "--memoize-tool",
+        dest="memoize_tool",
+        action="append",
+        default=[],
+        metavar="TOOL=TTL",
+        help="Cache successful results of a deterministic tool for TTL seconds (repeatable)",
+    )
+    parser.add_argument(
+        "--memoize-max-entries",
+        dest="memoize_max_entries",
+        type=int,
+        default=DEFAULT_MAX_ENTRIES,
+        help="Most memoized tool results kept (LRU)",
+    )
+    parser.add_argument(
+        "--memoize-max-bytes",
+        dest="memoize_max_bytes",
+        type=int,
+        default=DEFAULT_MAX_BYTES,
+        help="Most serialized bytes of memoized tool results kept (LRU)",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        dest="metrics_port",
+        type=int,
+        default=None,
+        help="Serve Prometheus metrics at http://127.0.0.1:PORT/metrics (0 picks a free port)",
+    )
+    parser.add_argument(
+        "--trace-file",
+        dest="trace_file",
+        default=None,
+        help="Append request spans (stdio, dispatch, handler, upstream POST and SSE wait) to this file as OTLP JSON lines",
+    )
+    parser.add_argument(
+        "--max-in-flight",
+        dest="max_in_flight",
+        type=int,
+        default=32,
+        help="Most requests handled at once, over all clients (default 32)",
+    )
+    parser.add_argument(
+        "--max-queued",
+        dest="max_queued",
+        type=int,
+        default=128,
+        help="Most requests waiting for a slot; more are refused with an overloaded error (default 128)",
+    )
+    parser.add_argument(
+        "--queue-timeout",
+        dest="queue_timeout",
+        type=float,
+        default=10.0,
+        help="Seconds a request may wait for a slot (0: no limit)",
+    )
+    parser.add_argument(
+        "--request-timeout",
+        dest="request_timeout",
+        type=float,
+        default=0.0,
+        help="Seconds after which a running request is cancelled (0: no limit)",
+    )
+    parser.add_argument(
+        "--control-slots",
+        dest="control_slots",
+        type=int,
+        default=4,
+        help="Extra slots only initialize, ping and list requests may use (default 4)",
+    )
+    parser.add_argument(
+        "--control-weight",
+        dest="control_weight",
+        type=int,
+        default=4,
+        help="Control requests admitted per tool call when both are waiting (default 4)",
+    )
+    parser.add_argument(
+        "--tool-limit",
+        dest="tool_limit",
+        action="append",
+        default=[],
+        metavar="TOOL=N",
+        help="Run at most N calls of TOOL at once (repeatable)",
+    )
+    parser.add_argument(
+        "--log-file",
+        dest="log_file",
+        default=None,
+        help="Append JSON-lines log records to this file instead of stderr",
+    )
+    parser.add_argument(
+        "--log-queue-size",
+        dest="log_queue_size",
+        type=int,
+        default=DEFAULT_CAPACITY,
+        help="Log records buffered before new ones are dropped (and counted)",
+    )
     args = parser.parse_args()
+    args.upstream_urls = args.upstream_urls or [DEFAULT_UPSTREAM_URL]
+    if args.max_in_flight < 1:
+        parser.error("--max-in-flight must be at least 1")
+    if args.control_weight < 1:
+        parser.error("--control-weight must be at least 1")
+    try:
+        memoize_policies = parse_memoize_specs(args.memoize_tool)
+    except ValueError as e:
+        parser.error(f"--memoize-tool: {e}")
+    profiler = StartupProfiler(args.profile_startup)
+    debug = args.mode == "debug"
 
     try:
-        from pieces.mcp.gateway import MCPGateway
-        from pieces.settings import Settings
-        import logging
-        # Enable debug logging for troubleshooting during tests
-        try:
-            Settings.logger.logger.setLevel(logging.DEBUG)
-        except Exception:
-            pass
+        from contextlib import nullcontext
+        with profiler.import_timer or nullcontext():
+            from pieces.mcp.gateway import MCPGateway
+            from pieces.settings import Settings
+            from mcp_gateway.admission import (
+                AdmissionController, install_admission_control, install_upstream_cancellation, parse_tool_limits,
+            )
+            from mcp_gateway.stdio_transport import install_stdio_transport
+            from mcp_gateway.tools_cache import install_tools_list_cache
+            from mcp_gateway.upstream import ManagedPosMcpConnection
+        profiler.mark('import')
     except Exception as e:
         print("Failed to import pieces. Is 'pieces-cli' installed?", file=sys.stderr)
         raise
+    try:
+        tool_limits = parse_tool_limits(args.tool_limit)
+    except ValueError as e:
+        parser.error(f"--tool-limit: {e}")
 
-    # For debugging, use a subclass that prints lifecycle markers to stdout/stderr
+    # For debugging, use a subclass that logs lifecycle markers
     class DebugMCPGateway(MCPGateway):
         async def run(self):
             try:
-                print('DBG: Gateway.run started', file=sys.stderr, flush=True)
+                log.debug('DBG: Gateway.run started')
                 if self.upstream.upstream_url:
                     try:
                         await self.upstream.connect(send_notification=False)
                     except Exception as e:
-                        print(f'DBG: upstream connect failed: {e}', file=sys.stderr, flush=True)
-                print('DBG: entering stdio server', file=sys.stderr, flush=True)
+                        log.debug('DBG: upstream connect failed: %s', e)
+                log.debug('DBG: entering stdio server')
                 await super().run()
             finally:
-                print('DBG: Gateway.run finished', file=sys.stderr, flush=True)
+                log.debug('DBG: Gateway.run finished')
 
-    gateway = DebugMCPGateway(server_name=args.server_name, upstream_url=args.upstream_url)
-    print(f'Gateway starting with upstream: {args.upstream_url}', file=sys.stderr, flush=True)
-    # Debugging: monkey-patch stdio server and ServerSession to print lifecycle events
-    try:
-        from contextlib import asynccontextmanager
-        import mcp.server.stdio as stdio_mod
-        import mcp.server.session as session_mod
-
-        original_stdio_server = stdio_mod.stdio_server
+    gateway_cls = DebugMCPGateway if debug else MCPGateway
+    gateway = gateway_cls(server_name=args.server_name, upstream_url=args.upstream_urls[0])
+    tool_results = None
+    if memoize_policies:
+        tool_results = ToolResultCache(
+            memoize_policies,
+            max_entries=args.memoize_max_entries,
+            max_bytes=args.memoize_max_bytes,
+        )
+    # Upstream sessions look `sse_client` up on this module at connect time
+    import pieces.mcp.gateway as pieces_gateway
+    upstream_batching = None
+    if args.upstream_batch:
+        from mcp_gateway.batching import BatchingSseClient
+        upstream_batching = BatchingSseClient()
+        pieces_gateway.sse_client = upstream_batching
+    upstream_mux = None
+    if args.share_upstream_stream:
+        from mcp_gateway.multiplex import MultiplexedSseClient
+        upstream_mux = MultiplexedSseClient(pieces_gateway.sse_client)
+        pieces_gateway.sse_client = upstream_mux
+    # Keep upstream sessions open, health-checked and reconnected in the background
+    gateway.upstream = ManagedPosMcpConnection(
+        args.upstream_urls[0],
+        gateway.send_tools_changed_notification,
+        pool_size=args.upstream_pool_size,
+        health_interval=args.upstream_health_interval,
+        tool_results=tool_results,
+        upstream_urls=args.upstream_urls,
+        balance=args.balance,
+        on_connected=lambda: profiler.mark('upstream_connect'),
+    )
+    tools_cache = install_tools_list_cache(gateway, args.tools_cache_ttl)
+    admission = AdmissionController(
+        max_in_flight=args.max_in_flight,
+        max_queued=args.max_queued,
+        queue_timeout=args.queue_timeout,
+        request_timeout=args.request_timeout,
+        control_slots=args.control_slots,
+        control_weight=args.control_weight,
+        tool_limits=tool_limits,
+    )
+    install_admission_control(gateway, admission)
+    install_upstream_cancellation(admission)
+    tracer = None
+    if args.trace_file:
+        from mcp_gateway.tracing import Tracer, install_request_tracing
+        tracer = Tracer(args.trace_file)
+        install_request_tracing(gateway, tracer)
 
-        @asynccontextmanager
-        async def debug_stdio_server(*a, **kw):
-            async with original_stdio_server(*a, **kw) as (read_stream, write_stream):
-                print('GATEWAY_STDIO_ENTERED', flush=True)
-                yield read_stream, write_stream
+    def _stdio_entered():
+        # The last startup phase over stdio, so the summary covers it
+        profiler.mark('stdio_entered')
+        profiler.report()
 
-        stdio_mod.stdio_server = debug_stdio_server
+    # Accepts JSON-RPC batches on stdin (traced with --trace-file). Installed
+    # before the debug patches, which wrap it.
+    install_stdio_transport(tracer, on_entered=_stdio_entered)
+    if debug:
+        # Debugging: monkey-patch stdio server and ServerSession to print lifecycle events
+        try:
+            _install_debug_patches()
+        except Exception:
+            # If debug patching fails, don't stop gateway from starting
+            pass
 
-        orig_received = session_mod.ServerSession._received_request
+    # Collectors only run when metrics are rendered. The per-request timing
+    # and the lag monitor are left out of production unless --metrics-port
+    # asks for them, so production still adds no per-request hooks.
+    request_metrics = debug or args.metrics_port is not None
+    metrics = GatewayMetrics()
+    if request_metrics:
+        # Installed last so the timing covers the cache and debug wrappers too
+        install_request_metrics(gateway, metrics)
+    metrics.registry.add_collector(upstream_collector(gateway.upstream))
+    if tools_cache is not None:
+        metrics.registry.add_collector(stats_collector(
+            'mcp_gateway_tools_cache', tools_cache.stats, counters=('hits', 'misses', 'invalidations')))
+    if tool_results is not None:
+        metrics.registry.add_collector(stats_collector(
+            'mcp_gateway_tool_memo', tool_results.stats, counters=('hits', 'misses', 'evictions')))
+    metrics.registry.add_collector(stats_collector(
+        'mcp_gateway_admission', admission.stats,
+        counters=('admitted', 'admitted_control', 'queued_total', 'rejected', 'expired', 'cancelled_queued', 'timed_out',
+                  'upstream_cancelled')))
+    if upstream_batching is not None:
+        metrics.registry.add_collector(stats_collector(
+            'mcp_gateway_upstream_batching', upstream_batching.stats,
+            counters=('posts', 'batches', 'batched_messages', 'rejected_batches')))
+    if tracer is not None:
+        metrics.registry.add_collector(stats_collector('mcp_gateway_trace_spans', tracer.stats, counters=('exported',)))
+    metrics.registry.add_collector(process_collector)
 
-        async def patched_received_request(self, responder):
-            try:
-                # responder.request.root is a Pydantic model (types.ClientRequest)
-                root = getattr(responder, 'request', None)
-                r = getattr(root, 'root', None)
-                name = type(r).__name__ if r is not None else 'Unknown'
-                print(f'GATEWAY_RECEIVED_REQUEST: {name}', flush=True)
-            except Exception as e:
-                print(f'GATEWAY_RECEIVED_REQUEST_ERROR: {e}', flush=True)
-            return await orig_received(self, responder)
-
-        session_mod.ServerSession._received_request = patched_received_request
-    except Exception:
-        # If debug patching fails, don't stop gateway from starting
-        pass
+    network = None
+    ready_message = "Starting stdio server for"
+    if args.listen:
+        from mcp_gateway import network
+        ready_message = network.LISTENING_MESSAGE
 
     # Add a temporary logging handler that prints a readiness marker when the
-    # gateway starts its stdio server. This ensures tests don't race by seeing
-    # the process is alive before stdio is accepting connections.
-    import logging
-    import threading
-
+    # gateway starts its stdio server (or starts listening, with --listen).
+    # This ensures tests don't race by seeing the process is alive before it
+    # is accepting connections.
     class _ReadyHandler(logging.Handler):
-        def __init__(self):
+        def __init__(self, ready_fd=None, stream=None):
             super().__init__()
             self._printed = False
+            self._ready_fd = ready_fd
+            self._stream = stream
 
         def emit(self, record):
+            if self._printed:
+                return
             try:
-                msg = self.format(record)
-                if "Starting stdio server for" in msg and not self._printed:
-                    # Print readiness to stdout (captured by tests)
-                    print("GATEWAY_READY", flush=True)
+                if ready_message in record.getMessage():
                     self._printed = True
+                    if self._stream is not None:
+                        # Print readiness to stdout (captured by tests) or stderr
+                        _announce(self._stream, "GATEWAY_READY")
+                    self._signal_ready_fd()
+                    profiler.mark('ready')
+                    if args.listen:
+                        # No stdio phase follows; over stdio it reports at stdio_entered
+                        profiler.report()
             except Exception:
                 pass
 
+        def _signal_ready_fd(self):
+            # Wake a waiting parent immediately instead of making it poll logs.
+            if self._ready_fd is None:
+                return
+            fd, self._ready_fd = self._ready_fd, None
+            try:
+                os.write(fd, b"GATEWAY_READY\n")
+            finally:
+                os.close(fd)
+
+    if debug:
+        ready_stream = sys.stdout
+    else:
+        # stdout carries only protocol traffic; with a ready FD that is enough.
+        ready_stream = None if args.ready_fd is not None else sys.stderr
+    log_level = logging.DEBUG if debug else logging.INFO
+    ready_handler = None
     try:
-        # Ensure the logger will emit info-level messages and add our handlers
-        Settings.logger.logger.setLevel(logging.DEBUG)
-        ready_handler = _ReadyHandler()
+        # The readiness marker is an INFO record, so INFO is the floor in both modes
+        Settings.logger.logger.setLevel(log_level)
+        ready_handler = _ReadyHandler(args.ready_fd, ready_stream)
         Settings.logger.logger.addHandler(ready_handler)
-        # Also mirror internal debug logs to stderr for easier debugging
-        log_stream_handler = logging.StreamHandler(sys.stderr)
-        log_stream_handler.setLevel(logging.DEBUG)
-        Settings.logger.logger.addHandler(log_stream_handler)
     except Exception:
-        ready_handler = None
-        log_stream_handler = None
+        pass
+
+    # Everything else (including the pieces file handler) is written by a
+    # listener thread, so a slow log consumer cannot stall the event loop.
+    log.setLevel(log_level)
+    log.propagate = False
+    log_stream = open(args.log_file, 'a', encoding='utf-8') if args.log_file else sys.stderr
+    log_pipeline = LoggingPipeline(
+        [Settings.logger.logger, log],
+        log_stream,
+        level=log_level,
+        capacity=args.log_queue_size,
+        keep_inline=[ready_handler] if ready_handler is not None else [],
+    ).start()
+    metrics.registry.add_collector(stats_collector(
+        'mcp_gateway_log_records', lambda: {'dropped': log_pipeline.dropped}, counters=('dropped',)))
+    log.info('Gateway starting (%s mode) with upstream: %s', args.mode, ', '.join(args.upstream_urls))
+    profiler.mark('patching')
+
+    def _print_listening(url):
+        _announce(ready_stream or sys.stderr, f"GATEWAY_LISTENING {url}")
+
+    async def _run_with_metrics(serving):
+        lag_monitor = EventLoopLagMonitor(metrics) if request_metrics else None
+        if lag_monitor is not None:
+            lag_monitor.start()
+        metrics_server = None
+        if args.metrics_port is not None:
+            metrics_server = await serve_metrics(metrics, '127.0.0.1', args.metrics_port)
+            port = metrics_server.sockets[0].getsockname()[1]
+            _announce(ready_stream or sys.stderr, f"GATEWAY_METRICS http://127.0.0.1:{port}/metrics")
+        try:
+            await serving
+        finally:
+            if metrics_server is not None:
+                metrics_server.close()
+            if lag_monitor is not None:
+                await lag_monitor.stop()
 
     try:
-        asyncio.run(gateway.run())
+        if network is not None:
+            host, port = network.parse_listen(args.listen)
+            asyncio.run(_run_with_metrics(
+                network.serve(gateway, host, port, args.transport, on_listening=_print_listening)))
+        else:
+            asyncio.run(_run_with_metrics(gateway.run()))
     except KeyboardInterrupt:
-        print("MCP Gateway interrupted, shutting down")
+        log.info("MCP Gateway interrupted, shutting down")
     except Exception:
         raise
     finally:
         try:
             if ready_handler is not None:
                 Settings.logger.logger.removeHandler(ready_handler)
-            if log_stream_handler is not None:
-                Settings.logger.logger.removeHandler(log_stream_handler)
         except Exception:
             pass
+        if tools_cache is not None:
+            log.info('tools/list cache: %s', tools_cache.stats(), extra={'event': 'tools_cache_stats'})
+        log.info('upstreams: %s', gateway.upstream.upstream_stats(), extra={'event': 'upstream_stats'})
+        if upstream_batching is not None:
+            log.info('upstream batching: %s', upstream_batching.stats(), extra={'event': 'upstream_batch_stats'})
+        if upstream_mux is not None:
+            log.info('shared upstream streams: %s', upstream_mux.stats(), extra={'event': 'upstream_mux_stats'})
+        log.info('admission: %s', admission.stats(), extra={'event': 'admission_stats'})
+        if tool_results is not None:
+            log.info('tool result memo: %s', tool_results.stats(), extra={'event': 'tool_memo_stats'})
+        if tracer is not None:
+            tracer.close()
+            log.info('trace spans: %s', tracer.stats(), extra={'event': 'trace_stats'})
+        log.info('metrics:\n%s', metrics.render(), extra={'event': 'metrics'})
+        log_pipeline.stop()
+        if log_stream is not sys.stderr:
+            log_stream.close()
 
 if __name__ == "__main__":
     main()
@@ -7,10 +7,24 @@ import pytest
 import sys
 from pathlib import Path
 import threading
-from typing import Dict
+import uuid
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Sequence, Set, Tuple
+
+from tests.mcp.log_utils import LogCapture, drain_to_capture
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'integration: needs the mock MCP server and the gateway wrapper')
+    config.addinivalue_line('markers', 'benchmark: gateway throughput/latency benchmarks (set MCP_BENCHMARK=1)')
+    config.addinivalue_line('markers', 'soak: long-running gateway leak checks (set MCP_SOAK=1)')
+    config.addinivalue_line('markers', 'load: gateway lane-fairness load tests (set MCP_LOAD=1)')
 
 
 def find_free_port():
+    # Racy: the port is free now, but anything may take it before it is
+    # used. Prefer `reserve_listen_socket` for servers started by tests.
     s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     s.bind(("127.0.0.1", 0))
     port = s.getsockname()[1]
@@ -18,25 +32,46 @@ def find_free_port():
     return port
 
 
+def reserve_listen_socket() -> socket.socket:
+    """Bind and listen on a free loopback port, for a child process to inherit.
+
+    The port is never released between choosing it and serving on it, so
+    parallel workers cannot race for it. Pass `sock.fileno()` to the child
+    (`pass_fds`) and close the parent's copy once it has started.
+    """
+    sock = socket.create_server(("127.0.0.1", 0))
+    sock.set_inheritable(True)
+    return sock
+
+
+def worker_id() -> str:
+    """pytest-xdist worker name (`gw0`, ...), or `main` without xdist."""
+    return os.environ.get('PYTEST_XDIST_WORKER', 'main')
+
+
 def _node_available():
     from shutil import which
     return which('node') is not None
 
 
-def _drain_stream_to_file(proc, stream, path):
+def _mock_upstream_kind() -> str:
+    """`MCP_MOCK_UPSTREAM` (node|python); defaults to node when it is installed."""
+    kind = os.environ.get('MCP_MOCK_UPSTREAM', '').strip().lower()
+    if kind in ('node', 'python'):
+        return kind
+    return 'node' if _node_available() else 'python'
+
+
+def _wait_for_ready_fd(ready_r: int, state: Dict[str, str], ready: threading.Event):
+    """Block on the gateway's readiness pipe; EOF means the gateway exited first."""
     try:
-        with open(path, 'a', encoding='utf-8') as f:
-            while True:
-                line = stream.readline()
-                if not line:
-                    if proc.poll() is not None:
-                        break
-                    time.sleep(0.01)
-                    continue
-                f.write(line)
-                f.flush()
-    except Exception:
-        pass
+        data = os.read(ready_r, 64)
+    except OSError:
+        data = b''
+    finally:
+        os.close(ready_r)
+    state.setdefault('via', 'ready-fd' if b'GATEWAY_READY' in data else 'exited')
+    ready.set()
 
 
 # Historically we used a wrapper to expose `gateway_process['proc']` mapping.
@@ -48,16 +83,22 @@ def _drain_stream_to_file(proc, stream, path):
 class GatewayProcessWrapper:
     """Wrapper that holds a proc and log dict while delegating attributes to
     the underlying `subprocess.Popen` instance.
+
+    `capture` maps 'stdout'/'stderr' to the `LogCapture` of each stream;
+    prefer it over reading the `log` files, which are written in batches.
     """
-    def __init__(self, proc: subprocess.Popen, log: Dict[str, str]):
+    def __init__(self, proc: subprocess.Popen, log: Dict[str, str], capture: Optional[Dict[str, LogCapture]] = None):
         self.proc = proc
         self.log = log
+        self.capture = capture or {}
 
     def __getitem__(self, key):
         if key == 'proc':
             return self.proc
         if key == 'log':
             return self.log
+        if key == 'capture':
+            return self.capture
         raise KeyError(key)
 
     def __getattr__(self, name):
@@ -80,19 +121,26 @@ class GatewayProcessWrapper:
         return f"<GatewayProcessWrapper pid={getattr(self.proc, 'pid', None)} log={self.log}>"
 
 
-@pytest.fixture(scope='module')
+@pytest.fixture(scope='session')
 def mock_mcp_server(tmp_path_factory):
     """Start the repository's MCP mock server in a subprocess for tests.
 
     Returns the base URL (e.g. http://127.0.0.1:39300) and ensures the process
-    is terminated on fixture teardown.
+    is terminated on fixture teardown. `MCP_MOCK_UPSTREAM=python` runs the
+    asyncio mock (`scripts/mcp_gateway/mock_upstream.py`, per-session
+    routing, configured via `MCP_MOCK_CONFIG`) instead of the Node one; it
+    is also used when `node` is not installed.
     """
-    if not _node_available():
+    kind = _mock_upstream_kind()
+    if kind == 'node' and not _node_available():
         pytest.skip("node not found in PATH; skipping mock server tests")
 
-    port = find_free_port()
+    # Under pytest-xdist each worker runs its own session, and so its own mock
+    sock = reserve_listen_socket()
+    port = sock.getsockname()[1]
     env = os.environ.copy()
     env['PORT'] = str(port)
+    env['LISTEN_FD'] = str(sock.fileno())
 
     # Discover the repository root by walking parents until we find a 'scripts/mcp-server.js'
     repo_path = Path(__file__).resolve().parent
@@ -113,22 +161,30 @@ def mock_mcp_server(tmp_path_factory):
                 break
         script = os.path.abspath(os.path.join(repo_root, 'friendly-city-print-shop', 'scripts', 'mcp-server.js'))
         cwd = os.path.abspath(os.path.join(repo_root, 'friendly-city-print-shop'))
+    if kind == 'python':
+        script = os.path.join(cwd, 'scripts', 'mcp_gateway', 'mock_upstream.py')
+        command = [sys.executable, script]
+    else:
+        command = ['node', script]
     print(f'Launching mock server: script={script} cwd={cwd}', file=sys.stderr)
 
-    # Start Node server in the friendly-city-print-shop directory to ensure paths remain consistent
+    # Start the server in the friendly-city-print-shop directory to ensure paths remain consistent
     # Launch the server (capturing stdout/stderr)
-    proc = subprocess.Popen(['node', script], env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, cwd=cwd)
+    try:
+        proc = subprocess.Popen(command, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=0, cwd=cwd,
+                                pass_fds=(sock.fileno(),))
+    finally:
+        sock.close()
 
     # Create a log directory to persist server logs for debugging and test synchronization
-    log_dir = tmp_path_factory.mktemp('mcp-server-logs')
+    log_dir = tmp_path_factory.mktemp(f'mcp-server-logs-{worker_id()}')
     stdout_log = str((log_dir / 'stdout.log').resolve())
     stderr_log = str((log_dir / 'stderr.log').resolve())
 
-    # Start background threads to flush stdout/stderr to log files
-    t_out = threading.Thread(target=_drain_stream_to_file, args=(proc, proc.stdout, stdout_log), daemon=True)
-    t_err = threading.Thread(target=_drain_stream_to_file, args=(proc, proc.stderr, stderr_log), daemon=True)
-    t_out.start()
-    t_err.start()
+    # Background threads capture stdout/stderr in memory and batch them to the log files
+    capture = {'stdout': LogCapture(stdout_log), 'stderr': LogCapture(stderr_log)}
+    for name in ('stdout', 'stderr'):
+        threading.Thread(target=drain_to_capture, args=(getattr(proc, name), capture[name]), daemon=True).start()
 
     # Wait for an HTTP 200 on root with small timeout and collect initial logs
     url = f'http://127.0.0.1:{port}/'
@@ -141,37 +197,14 @@ def mock_mcp_server(tmp_path_factory):
         except Exception:
             time.sleep(0.1)
     else:
-        # Try read some logs to help debugging
-        # Collect a small amount of logs for debugging without blocking
-        out = ''
-        err = ''
-        try:
-            if proc.stdout:
-                while True:
-                    line = proc.stdout.readline()
-                    if not line:
-                        break
-                    out += line
-                    if len(out) > 10000:
-                        break
-        except Exception:
-            pass
-        try:
-            if proc.stderr:
-                while True:
-                    line = proc.stderr.readline()
-                    if not line:
-                        break
-                    err += line
-                    if len(err) > 10000:
-                        break
-        except Exception:
-            # ignore errors while reading stderr
-            pass
+        # The drain threads already hold whatever the server printed
         proc.kill()
+        out = capture['stdout'].text()[-10000:]
+        err = capture['stderr'].text()[-10000:]
         pytest.skip(f'Mock server failed to start; stdout:\n{out}\n stderr:\n{err}')
 
-    yield {'url': f'http://127.0.0.1:{port}', 'proc': proc, 'log': {'stdout': stdout_log, 'stderr': stderr_log}}
+    yield {'url': f'http://127.0.0.1:{port}', 'kind': kind, 'proc': proc, 'log': {'stdout': stdout_log, 'stderr': stderr_log},
+           'capture': capture, 'watcher': capture['stdout']}
 
     # Teardown
     proc.terminate()
@@ -181,106 +214,117 @@ def mock_mcp_server(tmp_path_factory):
         proc.kill()
 
 
-@pytest.fixture(scope='function')
-def gateway_process(mock_mcp_server, tmp_path_factory):
-    """Start the local MCP gateway wrapper (py-run-mcp-gateway.py) in a subprocess.
-
-    This uses the venv Python from sys.executable to ensure the installed `pieces` package
-    is available.
-
-    The fixture yields a `GatewayProcessWrapper` object which behaves like the
-    original `subprocess.Popen` via attribute access (e.g., `gateway_process.stdin`)
-    while also exposing a mapping-style interface to access the underlying
-    process and logs (e.g., `gateway_process` and
-    `gateway_process['log']['stdout']`).
-    """
-    # mock_mcp_server is a dict: { 'url': ..., 'proc': proc }
-    upstream_url = mock_mcp_server['url'] + '/model_context_protocol/2024-11-05/sse'
-    mock_proc = mock_mcp_server['proc']
-
+def _find_gateway_script() -> Tuple[str, str]:
+    """Return (gateway_script, cwd_root) for py-run-mcp-gateway.py."""
     # Compute gateway script path by walking parents to find the 'scripts/py-run-mcp-gateway.py' file
     repo_path = Path(__file__).resolve().parent
-    gateway_script = None
-    cwd_root = None
     for parent in repo_path.parents:
         candidate = parent
         if (candidate / 'scripts' / 'py-run-mcp-gateway.py').exists():
-            gateway_script = str((candidate / 'scripts' / 'py-run-mcp-gateway.py').resolve())
-            cwd_root = str(candidate.resolve())
+            return str((candidate / 'scripts' / 'py-run-mcp-gateway.py').resolve()), str(candidate.resolve())
+    # fallback: assume script is under friendly-city-print-shop/scripts
+    repo_root = Path(__file__).resolve()
+    for p in repo_root.parents:
+        if (p / 'friendly-city-print-shop').exists():
+            repo_root = str(p)
             break
-    if gateway_script is None:
-        # fallback: assume script is under friendly-city-print-shop/scripts
-        repo_root = Path(__file__).resolve()
-        for p in repo_root.parents:
-            if (p / 'friendly-city-print-shop').exists():
-                repo_root = str(p)
-                break
-        gateway_script = os.path.join(repo_root, 'friendly-city-print-shop', 'scripts', 'py-run-mcp-gateway.py')
-        cwd_root = os.path.join(repo_root, 'friendly-city-print-shop')
+    gateway_script = os.path.join(repo_root, 'friendly-city-print-shop', 'scripts', 'py-run-mcp-gateway.py')
+    return gateway_script, os.path.join(repo_root, 'friendly-city-print-shop')
+
+
+class _GatewayStartSkipped(Exception):
+    """The gateway did not become ready in time; the test should be skipped."""
+
+
+def _default_ready_timeout(base: float = 10.0) -> float:
+    """`base` seconds, stretched when xdist runs more workers than there are CPUs."""
+    workers = int(os.environ.get('PYTEST_XDIST_WORKER_COUNT', '1'))
+    return base * max(1.0, workers / (os.cpu_count() or 1))
+
+
+def _launch_gateway(mock_mcp_server, tmp_path_factory, ready_timeout: Optional[float] = None, on_spawn: Optional[Callable[[subprocess.Popen], None]] = None,
+                    extra_args: Sequence[str] = (), env: Optional[Dict[str, str]] = None) -> GatewayProcessWrapper:
+    """Start py-run-mcp-gateway.py and block until it is ready.
+
+    `extra_args` are appended to the wrapper's command line and `env`
+    entries are added to the inherited environment.
+
+    Raises `_GatewayStartSkipped` on timeout and RuntimeError if the gateway
+    exits during startup.
+    """
+    # Tag the upstream connection so the mock's 'Client connected' line can be
+    # attributed to this gateway even while other (pooled) gateways connect.
+    client_tag = f'gw-{uuid.uuid4().hex[:12]}'
+    # mock_mcp_server is a dict: { 'url': ..., 'proc': proc }
+    upstream_url = mock_mcp_server['url'] + f'/model_context_protocol/2024-11-05/sse?client={client_tag}'
+    gateway_script, cwd_root = _find_gateway_script()
 
-    env = os.environ.copy()
     # Launch using the current Python executable (venv)
-    args = [sys.executable, gateway_script, '--upstream-url', upstream_url]
+    args = [sys.executable, gateway_script, '--upstream-url', upstream_url, *extra_args]
+
+    # Readiness is pushed to us rather than polled: the wrapper writes to an
+    # inherited pipe (POSIX) and prints GATEWAY_READY, and the mock server
+    # logs 'Client connected' for this gateway's upstream connection.
+    # Whichever comes first wakes us; pipe EOF means the gateway died.
+    ready = threading.Event()
+    ready_state: Dict[str, str] = {}
+    pass_fds: Tuple[int, ...] = ()
+    ready_r = ready_w = None
+    if os.name == 'posix':
+        ready_r, ready_w = os.pipe()
+        args += ['--ready-fd', str(ready_w)]
+        pass_fds = (ready_w,)
+
+    def _mark_ready(via: str):
+        ready_state.setdefault('via', via)
+        ready.set()
+
+    mock_watcher: Optional[LogCapture] = mock_mcp_server.get('watcher')
+    unwatch_mock = mock_watcher.watch(client_tag, lambda _line: _mark_ready('mock-connected')) if mock_watcher else None
 
-    proc = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, bufsize=1, cwd=cwd_root)
+    try:
+        proc = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=0, cwd=cwd_root, pass_fds=pass_fds,
+                                env={**os.environ, **env} if env else None)
+    finally:
+        if ready_w is not None:
+            os.close(ready_w)
+    if on_spawn is not None:
+        on_spawn(proc)
+    if ready_r is not None:
+        threading.Thread(target=_wait_for_ready_fd, args=(ready_r, ready_state, ready), daemon=True).start()
 
     # Create a log directory to persist gateway logs for debugging and test synchronization
-    gw_log_dir = tmp_path_factory.mktemp('mcp-gateway-logs')
+    gw_log_dir = tmp_path_factory.mktemp(f'mcp-gateway-logs-{worker_id()}')
     gw_stdout_log = str((gw_log_dir / 'stdout.log').resolve())
     gw_stderr_log = str((gw_log_dir / 'stderr.log').resolve())
-    t_out_gw = threading.Thread(target=_drain_stream_to_file, args=(proc, proc.stdout, gw_stdout_log), daemon=True)
-    t_err_gw = threading.Thread(target=_drain_stream_to_file, args=(proc, proc.stderr, gw_stderr_log), daemon=True)
-    t_out_gw.start()
-    t_err_gw.start()
-
-    # Wait until the mock server indicates a connected client (gateway) or timeout by checking the server log file
-    log_paths: Dict[str, str] = mock_mcp_server.get('log', {})
-    stdout_log = log_paths.get('stdout')
-    stderr_log = log_paths.get('stderr')
-    deadline = time.time() + 10
-    connected = False
-    while time.time() < deadline:
-        if proc.poll() is not None:
-            stderr = ''
-            try:
-                if stderr_log and Path(stderr_log).exists():
-                    stderr = Path(stderr_log).read_text(errors='ignore')
-                elif proc.stderr:
-                    stderr = proc.stderr.read()
-            except Exception:
-                stderr = ''
-            raise RuntimeError(f'Gateway process exited early. Stderr:\n{stderr}')
-        # If gateway printed a readiness message, exit early
-        try:
-            if gw_stdout_log and Path(gw_stdout_log).exists():
-                gw_logs = Path(gw_stdout_log).read_text(errors='ignore')
-                if 'GATEWAY_READY' in gw_logs:
-                    connected = True
-                    break
-        except Exception:
-            pass
-        # Otherwise, read server stdout log for 'Client connected'
+    gw_capture = {'stdout': LogCapture(gw_stdout_log), 'stderr': LogCapture(gw_stderr_log)}
+    gw_capture['stdout'].watch('GATEWAY_READY', lambda _line: _mark_ready('stdout'))
+    threading.Thread(target=drain_to_capture, args=(proc.stdout, gw_capture['stdout'], lambda: _mark_ready('exited')), daemon=True).start()
+    threading.Thread(target=drain_to_capture, args=(proc.stderr, gw_capture['stderr']), daemon=True).start()
+
+    connected = ready.wait(timeout=ready_timeout or _default_ready_timeout())
+    if unwatch_mock is not None:
+        unwatch_mock()
+    if ready_state.get('via') == 'exited' or (proc.poll() is not None):
         try:
-            if stdout_log and Path(stdout_log).exists():
-                logs = Path(stdout_log).read_text(errors='ignore')
-                if 'Client connected' in logs:
-                    connected = True
-                    break
+            proc.wait(timeout=5)
         except Exception:
             pass
-        time.sleep(0.1)
+        # Wait for the stderr capture to see EOF so the message is complete
+        gw_capture['stderr'].wait_closed(timeout=2)
+        raise RuntimeError(f"Gateway process exited early. Stderr:\n{gw_capture['stderr'].text()}")
     if not connected:
         proc.kill()
-        pytest.skip('Gateway failed to start')
+        raise _GatewayStartSkipped('Gateway failed to start')
 
     # Attach log paths to the underlying Popen and return a wrapper that
     # supports both mapping-style access and attribute delegation.
     proc_log = {'stdout': gw_stdout_log, 'stderr': gw_stderr_log}
     setattr(proc, 'log', proc_log)
-    wrapper = GatewayProcessWrapper(proc, proc_log)
-    yield wrapper
+    return GatewayProcessWrapper(proc, proc_log, gw_capture)
 
-    # Teardown
+
+def _stop_gateway(wrapper: GatewayProcessWrapper):
     try:
         wrapper.proc.terminate()
     except Exception:
@@ -289,3 +333,99 @@ def gateway_process(mock_mcp_server, tmp_path_factory):
         wrapper.proc.wait(timeout=5)
     except Exception:
         wrapper.proc.kill()
+
+
+class _GatewayPool:
+    """Session-wide pool of pre-started gateways.
+
+    A gateway is never handed to a second test: its stdio MCP session and
+    stdin belong to the test that used it. Instead, "reset" means
+    replacement. Every acquire immediately queues the launch of a
+    replacement on a background thread, so interpreter start, the `pieces`
+    import, the wrapper's patching and the upstream connect overlap with the
+    running test instead of adding to it.
+    """
+
+    def __init__(self, launch: Callable[..., GatewayProcessWrapper], size: int):
+        self._launch_fn = launch
+        self._size = max(0, size)
+        # One worker per spare plus one for an on-demand launch, so they overlap.
+        self._executor = ThreadPoolExecutor(max_workers=self._size + 1, thread_name_prefix='mcp-gateway-pool')
+        self._spares: 'deque[Future]' = deque()
+        self._lock = threading.Lock()
+        # Processes started by the pool but not yet handed to a test.
+        self._unclaimed: Set[subprocess.Popen] = set()
+
+    def _launch(self) -> GatewayProcessWrapper:
+        def register(proc):
+            with self._lock:
+                self._unclaimed.add(proc)
+        return self._launch_fn(on_spawn=register)
+
+    def _refill(self):
+        while len(self._spares) < self._size:
+            self._spares.append(self._executor.submit(self._launch))
+
+    def acquire(self) -> GatewayProcessWrapper:
+        with self._lock:
+            future = self._spares.popleft() if self._spares else self._executor.submit(self._launch)
+            self._refill()
+        wrapper = future.result()
+        if wrapper.poll() is not None:
+            # The spare died while waiting (e.g. the upstream went away); start a fresh one.
+            wrapper = self._launch()
+        with self._lock:
+            self._unclaimed.discard(wrapper.proc)
+        return wrapper
+
+    def close(self):
+        with self._lock:
+            spares, self._spares = list(self._spares), deque()
+            unclaimed, self._unclaimed = list(self._unclaimed), set()
+        for future in spares:
+            future.cancel()
+        # Killing a spare that is still starting wakes its launch (ready pipe EOF).
+        for proc in unclaimed:
+            try:
+                proc.kill()
+                proc.wait(timeout=5)
+            except Exception:
+                pass
+        self._executor.shutdown(wait=True)
+
+
+@pytest.fixture(scope='session')
+def gateway_pool(mock_mcp_server, tmp_path_factory):
+    """Pre-warmed gateways for `gateway_process`.
+
+    `MCP_GATEWAY_POOL_SIZE` (default 1) is the number of gateways kept
+    starting in the background; 0 launches each gateway on demand.
+    """
+    size = int(os.environ.get('MCP_GATEWAY_POOL_SIZE', '1'))
+    pool = _GatewayPool(lambda **kw: _launch_gateway(mock_mcp_server, tmp_path_factory, **kw), size)
+    yield pool
+    pool.close()
+
+
+@pytest.fixture(scope='function')
+def gateway_process(gateway_pool):
+    """Start the local MCP gateway wrapper (py-run-mcp-gateway.py) in a subprocess.
+
+    This uses the venv Python from sys.executable to ensure the installed `pieces` package
+    is available. Gateways come pre-started from the session `gateway_pool`;
+    each test still gets its own fresh process.
+
+    The fixture yields a `GatewayProcessWrapper` object which behaves like the
+    original `subprocess.Popen` via attribute access (e.g., `gateway_process.stdin`)
+    while also exposing a mapping-style interface to access the underlying
+    process and logs (e.g., `gateway_process` and
+    `gateway_process['log']['stdout']`).
+    """
+    try:
+        wrapper = gateway_pool.acquire()
+    except _GatewayStartSkipped as e:
+        pytest.skip(str(e))
+    yield wrapper
+
+    # Teardown
+    _stop_gateway(wrapper)
@@ -1,76 +1,828 @@
+import json
+import os
 import queue
-import time
+import selectors
+import socket
+import struct
+import sys
 import threading
+import time
+from concurrent.futures import Future, InvalidStateError, TimeoutError as FutureTimeoutError
 from subprocess import Popen
-from typing import Tuple, Union
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple, Union
 
+from scripts.mcp_gateway.framing import LineFramer
 
-def start_log_reader(proc_or_path: Union[Popen, str]) -> Tuple[queue.Queue, threading.Event]:
-    """Start a background reader for a process stdout stream or a log file path.
 
-    Returns a tuple of (queue.Queue, threading.Event) where the queue will be
-    populated with new lines read from the stream/file and the Event can be
-    set to stop the reader thread.
+# How often the shared I/O thread re-checks tailed files on platforms without
+# inotify. Only used as a fallback; on Linux the thread sleeps until the
+# kernel reports a modification.
+_FALLBACK_POLL_INTERVAL = 0.05
+_READ_CHUNK = 65536
+
+
+class _ReaderStopEvent(threading.Event):
+    """`threading.Event` returned by `start_log_reader`.
+
+    Behaves exactly like a normal Event, but setting it also notifies the
+    shared I/O thread so the reader is detached immediately instead of on the
+    next poll.
     """
-    q: queue.Queue = queue.Queue()
-    stopped = threading.Event()
 
-    def reader_stream(proc: Popen):
-        stdout = getattr(proc, 'stdout', None)
-        if stdout is None:
+    def __init__(self):
+        super().__init__()
+        self._callbacks: List[Callable[[], None]] = []
+        self._callbacks_lock = threading.Lock()
+
+    def add_callback(self, callback: Callable[[], None]):
+        with self._callbacks_lock:
+            if not self.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def set(self):
+        super().set()
+        with self._callbacks_lock:
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+
+class _LineSplitter:
+    """Split a byte stream into complete lines and push them onto a queue.
+
+    Sources read straight into the framer's buffer (`readinto`), and each
+    line is copied out once, as the `str` or `bytes` put on the queue.
+    """
+
+    def __init__(self, q: queue.Queue, decode: bool):
+        self._q = q
+        self._decode = decode
+        self.framer = LineFramer(_READ_CHUNK, keep_ends=True)
+
+    def commit(self, count: int):
+        self.framer.commit(count)
+        for frame in self.framer.frames():
+            self._put(frame)
+
+    def flush(self):
+        # Called on EOF: a trailing line without a newline is still a line.
+        tail = self.framer.flush()
+        if tail is not None:
+            self._put(tail)
+
+    def _put(self, line: memoryview):
+        self._q.put(str(line, 'utf-8', 'replace') if self._decode else bytes(line))
+
+
+class _Inotify:
+    """Minimal ctypes binding for Linux inotify (IN_MODIFY only)."""
+
+    IN_MODIFY = 0x00000002
+    _IN_CLOEXEC = 0o2000000
+    _EVENT_HEADER = struct.Struct('iIII')
+
+    def __init__(self, libc, fd: int):
+        self._libc = libc
+        self.fd = fd
+
+    @classmethod
+    def open(cls) -> Optional['_Inotify']:
+        if not sys.platform.startswith('linux'):
+            return None
+        try:
+            import ctypes
+            libc = ctypes.CDLL(None, use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | cls._IN_CLOEXEC)
+        except Exception:
+            return None
+        if fd < 0:
+            return None
+        return cls(libc, fd)
+
+    def add_watch(self, path: str) -> int:
+        return self._libc.inotify_add_watch(self.fd, os.fsencode(path), self.IN_MODIFY)
+
+    def rm_watch(self, wd: int):
+        self._libc.inotify_rm_watch(self.fd, wd)
+
+    def read_watch_descriptors(self) -> Set[int]:
+        wds: Set[int] = set()
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return wds
+            if not data:
+                return wds
+            offset = 0
+            while offset + self._EVENT_HEADER.size <= len(data):
+                wd, _mask, _cookie, name_len = self._EVENT_HEADER.unpack_from(data, offset)
+                wds.add(wd)
+                offset += self._EVENT_HEADER.size + name_len
+
+
+class _FileTail:
+    def __init__(self, path: str, q: queue.Queue, stopped: threading.Event):
+        self.path = path
+        self.stopped = stopped
+        self.wd: Optional[int] = None
+        self._splitter = _LineSplitter(q, decode=True)
+        # Open and seek synchronously so that nothing written after
+        # `start_log_reader` returns can be missed.
+        self._f = open(path, 'rb')
+        self._f.seek(0, 2)
+
+    def read_available(self):
+        while True:
+            count = self._f.readinto(self._splitter.framer.writable(_READ_CHUNK))
+            if not count:
+                return
+            self._splitter.commit(count)
+
+    def close(self):
+        try:
+            self._f.close()
+        except Exception:
+            pass
+
+
+class _StreamSource:
+    def __init__(self, stream, q: queue.Queue, stopped: threading.Event):
+        self.fd = stream.fileno()
+        self.stopped = stopped
+        self._splitter = _LineSplitter(q, decode=hasattr(stream, 'encoding'))
+
+    def read_available(self) -> bool:
+        """Read what is ready; returns False once the stream hit EOF."""
+        try:
+            count = os.readv(self.fd, [self._splitter.framer.writable(_READ_CHUNK)])
+        except (BlockingIOError, InterruptedError):
+            return True
+        except OSError:
+            count = 0
+        if not count:
+            self._splitter.flush()
+            return False
+        self._splitter.commit(count)
+        return True
+
+
+class _LogIOHub:
+    """One daemon thread multiplexing every tailed file and process stream.
+
+    Process pipes are watched with `selectors`; files are watched with a
+    single inotify descriptor on Linux, so the thread only wakes up when
+    there is something to read. Registration happens on the hub thread via a
+    socketpair wakeup, which also works with `select()` on Windows.
+    """
+
+    def __init__(self):
+        self._selector = selectors.DefaultSelector()
+        self._lock = threading.Lock()
+        self._calls: List[Callable[[], None]] = []
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self._selector.register(self._wake_r, selectors.EVENT_READ, self._drain_wakeups)
+        self._inotify = _Inotify.open()
+        if self._inotify is not None:
+            self._selector.register(self._inotify.fd, selectors.EVENT_READ, self._on_inotify)
+        self._tails_by_wd: Dict[int, Set[_FileTail]] = {}
+        self._polled_tails: Set[_FileTail] = set()
+        self._thread = threading.Thread(target=self._run, name='mcp-log-io', daemon=True)
+        self._thread.start()
+
+    def call_soon(self, fn: Callable[[], None]):
+        with self._lock:
+            self._calls.append(fn)
+        try:
+            self._wake_w.send(b'\0')
+        except (BlockingIOError, OSError):
+            # The wakeup buffer is full, so the hub is already due to run.
+            pass
+
+    def add_file(self, tail: _FileTail):
+        if self._inotify is not None:
+            wd = self._inotify.add_watch(tail.path)
+            if wd >= 0:
+                tail.wd = wd
+                self._tails_by_wd.setdefault(wd, set()).add(tail)
+                # Catch anything written between open() and add_watch().
+                tail.read_available()
+                return
+        self._polled_tails.add(tail)
+
+    def remove_file(self, tail: _FileTail):
+        self._polled_tails.discard(tail)
+        if tail.wd is not None:
+            tails = self._tails_by_wd.get(tail.wd)
+            if tails is not None:
+                tails.discard(tail)
+                if not tails:
+                    del self._tails_by_wd[tail.wd]
+                    try:
+                        self._inotify.rm_watch(tail.wd)
+                    except Exception:
+                        pass
+        tail.close()
+
+    def add_stream(self, source: _StreamSource):
+        try:
+            self._selector.register(source.fd, selectors.EVENT_READ, lambda: self._on_stream(source))
+        except (KeyError, ValueError, OSError):
+            pass
+
+    def remove_stream(self, source: _StreamSource):
+        try:
+            self._selector.unregister(source.fd)
+        except (KeyError, ValueError):
+            pass
+
+    def _on_stream(self, source: _StreamSource):
+        if source.stopped.is_set() or not source.read_available():
+            self.remove_stream(source)
+
+    def _on_inotify(self):
+        for wd in self._inotify.read_watch_descriptors():
+            for tail in list(self._tails_by_wd.get(wd, ())):
+                self._read_tail(tail)
+
+    def _read_tail(self, tail: _FileTail):
+        if tail.stopped.is_set():
+            self.remove_file(tail)
             return
+        try:
+            tail.read_available()
+        except Exception:
+            self.remove_file(tail)
+
+    def _drain_wakeups(self):
+        try:
+            while self._wake_r.recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    def _run(self):
+        while True:
+            with self._lock:
+                calls, self._calls = self._calls, []
+            for fn in calls:
+                try:
+                    fn()
+                except Exception:
+                    pass
+            timeout = _FALLBACK_POLL_INTERVAL if self._polled_tails else None
+            for key, _events in self._selector.select(timeout):
+                try:
+                    key.data()
+                except Exception:
+                    pass
+            for tail in list(self._polled_tails):
+                self._read_tail(tail)
+
+
+_hub: Optional[_LogIOHub] = None
+_hub_lock = threading.Lock()
+
+
+def _get_hub() -> _LogIOHub:
+    global _hub
+    with _hub_lock:
+        if _hub is None:
+            _hub = _LogIOHub()
+        return _hub
+
+
+def _start_stream_thread(stream, q: queue.Queue, stopped: threading.Event):
+    # Windows cannot select() on pipes; a blocking readline() per stream is
+    # the best we can do there, but it still never spins.
+    def reader():
         while not stopped.is_set():
             try:
-                line = stdout.readline()
-                if not line:
-                    time.sleep(0.01)
-                    continue
-                q.put(line)
+                line = stream.readline()
             except Exception:
+                return
+            if not line:
+                return
+            q.put(line)
+
+    threading.Thread(target=reader, daemon=True).start()
+
+
+# Lines kept in memory per captured stream, and how long captured lines may
+# sit in memory before they are appended to the on-disk log in one write.
+_CAPTURE_MAX_LINES = 50000
+_CAPTURE_FLUSH_INTERVAL = 0.1
+
+
+class LogMatch(NamedTuple):
+    """A captured line that matched; pass `end` as `after` to search on."""
+    offset: int
+    line: str
+
+    @property
+    def end(self) -> int:
+        return self.offset + 1
+
+
+class _CaptureFlusher:
+    """Shared thread that appends buffered capture lines to their log files."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._dirty: Set['LogCapture'] = set()
+        self._wake = threading.Event()
+        threading.Thread(target=self._run, name='mcp-log-flusher', daemon=True).start()
+
+    def mark(self, capture: 'LogCapture'):
+        with self._lock:
+            self._dirty.add(capture)
+            self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            # Let lines accumulate so a burst costs one write per file
+            time.sleep(_CAPTURE_FLUSH_INTERVAL)
+            with self._lock:
+                dirty, self._dirty = self._dirty, set()
+                self._wake.clear()
+            for capture in dirty:
+                capture.flush()
+
+
+_flusher: Optional[_CaptureFlusher] = None
+_flusher_lock = threading.Lock()
+
+
+def _get_flusher() -> _CaptureFlusher:
+    global _flusher
+    with _flusher_lock:
+        if _flusher is None:
+            _flusher = _CaptureFlusher()
+        return _flusher
+
+
+class LogCapture:
+    """Bounded in-memory capture of one child process stream.
+
+    Lines are kept in a ring of `max_lines` entries, each addressed by its
+    absolute line offset, and appended to `path` in batches rather than
+    one write and flush per line. Readers never re-read the file:
+    `wait_for`/`search` scan only lines at or after `after`, `watch` runs
+    callbacks from the feeding thread, and `subscribe` streams new lines
+    (this is what `start_log_reader(capture)` uses).
+    """
+
+    def __init__(self, path: Optional[str] = None, max_lines: int = _CAPTURE_MAX_LINES):
+        self.path = path
+        self._ring: List[Optional[str]] = [None] * max_lines
+        self._end = 0
+        self._eof = False
+        self._cond = threading.Condition()
+        self._pending: List[str] = []
+        self._write_lock = threading.Lock()
+        self._file = open(path, 'a', encoding='utf-8') if path else None
+        self._watches: List[Tuple[Any, Callable[[str], None]]] = []
+        self._subscribers: List[Callable[[str], None]] = []
+
+    @property
+    def offset(self) -> int:
+        """Offset of the next line to arrive; a mark for `wait_for(after=...)`."""
+        with self._cond:
+            return self._end
+
+    @property
+    def closed(self) -> bool:
+        with self._cond:
+            return self._eof
+
+    def feed(self, line: str):
+        with self._cond:
+            self._ring[self._end % len(self._ring)] = line
+            self._end += 1
+            if self._file is not None:
+                self._pending.append(line)
+            watches, subscribers = list(self._watches), list(self._subscribers)
+            self._cond.notify_all()
+        if self._file is not None:
+            _get_flusher().mark(self)
+        for pattern, callback in watches:
+            if _line_matches(pattern, line):
+                try:
+                    callback(line)
+                except Exception:
+                    pass
+        for deliver in subscribers:
+            deliver(line)
+
+    def close(self):
+        """Mark end of stream: flush, close the file and wake every waiter."""
+        with self._cond:
+            self._eof = True
+            self._cond.notify_all()
+        self.flush()
+        with self._write_lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def flush(self):
+        with self._write_lock:
+            with self._cond:
+                batch, self._pending = self._pending, []
+            if batch and self._file is not None:
+                self._file.write(''.join(batch))
+                self._file.flush()
+
+    def _first(self) -> int:
+        return max(0, self._end - len(self._ring))
+
+    def _scan(self, pattern, start: int) -> Optional[LogMatch]:
+        for offset in range(max(start, self._first()), self._end):
+            line = self._ring[offset % len(self._ring)]
+            if _line_matches(pattern, line):
+                return LogMatch(offset, line)
+        return None
+
+    def search(self, pattern, after: int = 0) -> Optional[LogMatch]:
+        """First retained line at offset >= `after` matching `pattern`.
+
+        `pattern` is a substring or a compiled regular expression.
+        """
+        with self._cond:
+            return self._scan(pattern, after)
+
+    def wait_for(self, pattern, after: int = 0, timeout: float = 10.0) -> Optional[LogMatch]:
+        """Block until a line at offset >= `after` matches `pattern`.
+
+        Returns None on timeout or when the stream ends without a match.
+        Each line is examined once, however long the wait.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                match = self._scan(pattern, after)
+                if match is not None:
+                    return match
+                after = self._end
+                remaining = deadline - time.monotonic()
+                if self._eof or remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+    def wait_closed(self, timeout: float = 10.0) -> bool:
+        """Block until the stream hit EOF; False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._eof, timeout)
+
+    def lines(self, after: int = 0) -> List[str]:
+        """Retained lines at offset >= `after`."""
+        with self._cond:
+            return [self._ring[o % len(self._ring)] for o in range(max(after, self._first()), self._end)]
+
+    def text(self, after: int = 0) -> str:
+        return ''.join(self.lines(after))
+
+    def watch(self, pattern, callback: Callable[[str], None]) -> Callable[[], None]:
+        """Call `callback(line)` for every future line matching `pattern`.
+
+        Returns a function that removes the watch.
+        """
+        entry = (pattern, callback)
+        with self._cond:
+            self._watches.append(entry)
+
+        def remove():
+            with self._cond:
+                if entry in self._watches:
+                    self._watches.remove(entry)
+        return remove
+
+    def subscribe(self, deliver: Callable[[str], None]) -> Callable[[], None]:
+        """Pass every future line to `deliver`; returns an unsubscribe function."""
+        with self._cond:
+            self._subscribers.append(deliver)
+
+        def remove():
+            with self._cond:
+                if deliver in self._subscribers:
+                    self._subscribers.remove(deliver)
+        return remove
+
+
+def _line_matches(pattern, line: str) -> bool:
+    if isinstance(pattern, str):
+        return pattern in line
+    return pattern.search(line) is not None
+
+
+def drain_to_capture(stream, capture: LogCapture, on_eof: Optional[Callable[[], None]] = None):
+    """Feed `stream` into `capture` line by line until EOF (run on a thread).
+
+    `stream` is a binary pipe; lines are framed from its raw reads.
+    """
+    framer = LineFramer(_READ_CHUNK, keep_ends=True)
+    readinto = getattr(stream, 'readinto1', stream.readinto)
+    try:
+        while True:
+            count = readinto(framer.writable(_READ_CHUNK))
+            if not count:
                 break
+            framer.commit(count)
+            for frame in framer.frames():
+                capture.feed(str(frame, 'utf-8', 'replace'))
+        tail = framer.flush()
+        if tail is not None:
+            capture.feed(str(tail, 'utf-8', 'replace'))
+    except Exception:
+        pass
+    finally:
+        capture.close()
+        if on_eof is not None:
+            on_eof()
+
+
+def start_log_reader(proc_or_path: Union[Popen, str, LogCapture]) -> Tuple[queue.Queue, threading.Event]:
+    """Start a background reader for a process stdout stream, a log file path or a `LogCapture`.
+
+    Returns a tuple of (queue.Queue, threading.Event) where the queue will be
+    populated with new lines read from the stream/file and the Event can be
+    set to stop the reader.
+
+    All readers share a single I/O thread that blocks until data arrives
+    (selectors for pipes, inotify for files on Linux). A capture pushes its
+    lines directly, without the delay of its batched file writes.
+    """
+    q: queue.Queue = queue.Queue()
+    stopped = _ReaderStopEvent()
+    with _routers_lock:
+        _reader_stop_events[q] = stopped
+    stopped.add_callback(lambda: _forget_reader(q))
+
+    if isinstance(proc_or_path, LogCapture):
+        stopped.add_callback(proc_or_path.subscribe(q.put))
+        return q, stopped
 
-    def reader_file(path: str):
+    if isinstance(proc_or_path, str):
         try:
-            with open(path, 'r', encoding='utf-8') as f:
-                f.seek(0, 2)
-                while not stopped.is_set():
-                    line = f.readline()
-                    if not line:
-                        time.sleep(0.01)
-                        continue
-                    q.put(line)
-        except Exception:
+            tail = _FileTail(proc_or_path, q, stopped)
+        except OSError:
             # Ignore I/O errors while trying to tail the log
-            return
+            return q, stopped
+        hub = _get_hub()
+        hub.call_soon(lambda: hub.add_file(tail))
+        stopped.add_callback(lambda: hub.call_soon(lambda: hub.remove_file(tail)))
+        return q, stopped
 
-    if isinstance(proc_or_path, str):
-        t = threading.Thread(target=reader_file, args=(proc_or_path,), daemon=True)
-    else:
-        t = threading.Thread(target=reader_stream, args=(proc_or_path,), daemon=True)
-    t.start()
+    stdout = getattr(proc_or_path, 'stdout', None)
+    if stdout is None:
+        return q, stopped
+    if os.name == 'nt':
+        _start_stream_thread(stdout, q, stopped)
+        return q, stopped
+    source = _StreamSource(stdout, q, stopped)
+    hub = _get_hub()
+    hub.call_soon(lambda: hub.add_stream(source))
+    stopped.add_callback(lambda: hub.call_soon(lambda: hub.remove_stream(source)))
     return q, stopped
 
 
-def collect_jsonrpc_responses(q: queue.Queue, expected_ids, timeout=10.0):
-    import json
-    responses = {}
-    deadline = time.time() + timeout
-    while time.time() < deadline and len(responses) < len(expected_ids):
-        try:
-            line = q.get(timeout=0.5)
-        except queue.Empty:
-            continue
+# Sentinel pushed onto a reader queue when its reader is stopped, so the
+# router thread bound to that queue can exit.
+_ROUTER_STOP = object()
+
+# Both hold their queue strongly (the router reads it, the stop callback
+# closes over it), so entries are dropped when the reader stops.
+_reader_stop_events: Dict[queue.Queue, threading.Event] = {}
+_routers: Dict[queue.Queue, 'JsonRpcResponseRouter'] = {}
+_routers_lock = threading.Lock()
+
+
+def _forget_reader(q: queue.Queue):
+    with _routers_lock:
+        _reader_stop_events.pop(q, None)
+        _routers.pop(q, None)
+
+
+class _ResponseWaiter:
+    __slots__ = ('ids', 'remaining', 'results', 'future')
+
+    def __init__(self, ids: Set[Any]):
+        self.ids = ids
+        self.remaining = set(ids)
+        # Filled as responses arrive, so a response popped by another caller
+        # still reaches this waiter
+        self.results: Dict[Any, dict] = {}
+        self.future: Future = Future()
+
+
+class JsonRpcResponseRouter:
+    """Persistent JSON-RPC response index bound to a reader queue.
+
+    A daemon thread consumes the queue, parses each line once and stores
+    responses by `id`, so responses that arrive before anyone asks for them
+    are kept rather than dropped. Callers either block with `wait_for`,
+    which removes the responses it returns so a reused id waits for a fresh
+    response, or obtain a `concurrent.futures.Future` from `expect` (wrap it
+    with `asyncio.wrap_future` to await it, and `pop` the ids afterwards, or
+    cancel it to give up on them).
+
+    Once a router is bound to a queue it is the queue's only consumer.
+    """
+
+    def __init__(self, q: queue.Queue, stopped: Optional[threading.Event] = None):
+        self._q = q
+        self._lock = threading.Lock()
+        self._responses: Dict[Any, dict] = {}
+        self._waiters: Dict[Any, List[_ResponseWaiter]] = {}
+        # Ids a cancelled `expect` gave up on; their late responses are dropped
+        self._abandoned: Set[Any] = set()
+        self._thread = threading.Thread(target=self._run, name='mcp-jsonrpc-router', daemon=True)
+        self._thread.start()
+        if stopped is not None and hasattr(stopped, 'add_callback'):
+            stopped.add_callback(lambda: q.put(_ROUTER_STOP))
+
+    def _run(self):
+        while True:
+            line = self._q.get()
+            if line is _ROUTER_STOP:
+                return
+            self.feed(line)
+
+    def feed(self, line: Union[str, bytes]):
+        """Parse one line and index it if it is a JSON-RPC response."""
         line = line.strip()
         if not line:
-            continue
+            return
         try:
             payload = json.loads(line)
-            if 'jsonrpc' in payload and 'id' in payload:
-                responses[payload['id']] = payload
         except Exception:
             # ignore logs/non-json
-            continue
-    return responses
+            return
+        # A batch response holds one response per element
+        for item in payload if isinstance(payload, list) else (payload,):
+            if isinstance(item, dict) and 'jsonrpc' in item and 'id' in item:
+                self._store(item)
+
+    def _store(self, payload: dict):
+        msg_id = payload['id']
+        ready: List[_ResponseWaiter] = []
+        with self._lock:
+            if msg_id in self._abandoned:
+                self._abandoned.discard(msg_id)
+                return
+            self._responses[msg_id] = payload
+            for waiter in self._waiters.pop(msg_id, ()):
+                waiter.remaining.discard(msg_id)
+                waiter.results[msg_id] = payload
+                if not waiter.remaining:
+                    ready.append(waiter)
+        for waiter in ready:
+            if not waiter.future.done():
+                waiter.future.set_result(dict(waiter.results))
+
+    def _add_waiter(self, ids: Iterable[Any]) -> _ResponseWaiter:
+        waiter = _ResponseWaiter(set(ids))
+        with self._lock:
+            # A reused id waits for its new response
+            self._abandoned.difference_update(waiter.ids)
+            waiter.results = {i: self._responses[i] for i in waiter.ids if i in self._responses}
+            waiter.remaining.difference_update(waiter.results)
+            if not waiter.remaining:
+                waiter.future.set_result(dict(waiter.results))
+                return waiter
+            for msg_id in waiter.remaining:
+                self._waiters.setdefault(msg_id, []).append(waiter)
+        return waiter
+
+    def _remove_waiter(self, waiter: _ResponseWaiter):
+        # Caller holds self._lock
+        for msg_id in waiter.remaining:
+            waiters = self._waiters.get(msg_id, [])
+            if waiter in waiters:
+                waiters.remove(waiter)
+            if not waiters:
+                self._waiters.pop(msg_id, None)
+
+    def _abandon(self, waiter: _ResponseWaiter):
+        with self._lock:
+            self._remove_waiter(waiter)
+            for msg_id in waiter.results:
+                self._responses.pop(msg_id, None)
+            self._abandoned.update(i for i in waiter.remaining if i not in self._waiters)
+
+    def expect(self, ids: Iterable[Any]) -> Future:
+        """Return a Future resolved with `{id: response}` once every id arrived.
+
+        Cancelling the Future stops waiting: responses that arrived for its
+        ids are removed, and ones that arrive later are dropped.
+        """
+        waiter = self._add_waiter(ids)
+
+        def _on_done(future: Future):
+            if future.cancelled():
+                self._abandon(waiter)
+
+        waiter.future.add_done_callback(_on_done)
+        return waiter.future
+
+    def get(self, msg_id: Any) -> Optional[dict]:
+        with self._lock:
+            return self._responses.get(msg_id)
+
+    def pop(self, msg_id: Any) -> Optional[dict]:
+        """Remove and return a response so long-running callers stay bounded."""
+        with self._lock:
+            return self._responses.pop(msg_id, None)
+
+    def wait_for(self, ids: Iterable[Any], timeout: float = 10.0) -> Dict[Any, dict]:
+        """Block until all `ids` have responses or `timeout` expires.
+
+        On timeout the responses that did arrive are returned, matching the
+        historical behaviour of `collect_jsonrpc_responses`. Returned
+        responses are removed from the index.
+        """
+        waiter = self._add_waiter(ids)
+        try:
+            waiter.future.result(timeout=timeout)
+        except FutureTimeoutError:
+            pass
+        with self._lock:
+            self._remove_waiter(waiter)
+            result = dict(waiter.results)
+            for msg_id in result:
+                self._responses.pop(msg_id, None)
+        return result
+
+
+def router_for(q: queue.Queue) -> JsonRpcResponseRouter:
+    """Return the router bound to `q`, creating it on first use."""
+    with _routers_lock:
+        router = _routers.get(q)
+        if router is None:
+            router = JsonRpcResponseRouter(q, _reader_stop_events.get(q))
+            _routers[q] = router
+        return router
+
+
+def collect_jsonrpc_responses(q: queue.Queue, expected_ids, timeout=10.0):
+    """Wait for JSON-RPC responses with `expected_ids` on a reader queue.
+
+    Responses are indexed by a persistent router bound to the queue, so
+    consecutive calls never lose responses that arrived early.
+    """
+    return router_for(q).wait_for(expected_ids, timeout=timeout)
+
+
+def pipelined_client_for(gateway_process, window: int = 32, first_id: int = 1000, tracer=None):
+    """Attach a `PipelinedJsonRpcClient` to a `gateway_process` fixture.
+
+    Requests are written to the gateway's stdin and responses are awaited
+    through the router bound to the gateway's stdout capture. Returns
+    `(client, stopped)`; set `stopped` when done to detach the router.
+    `tracer` (a `scripts.mcp_gateway.tracing.Tracer`) traces each request.
+    """
+    from scripts.mcp_gateway.stdio_client import PipelinedJsonRpcClient
+
+    q, stopped = start_log_reader(gateway_process.capture['stdout'])
+    router = router_for(q)
+    stdin = gateway_process.stdin
+
+    async def write_line(line: str):
+        stdin.write((line + "\n").encode("utf-8"))
+        stdin.flush()
+
+    def expect(msg_id) -> Future:
+        single: Future = Future()
+        routed = router.expect([msg_id])
+
+        def _resolve(batch: Future):
+            if batch.cancelled():
+                return
+            router.pop(msg_id)
+            try:
+                single.set_result(batch.result()[msg_id])
+            except InvalidStateError:
+                # Cancelled (the request timed out) as the response arrived
+                pass
+
+        def _cancel(future: Future):
+            # A timed-out request stops waiting on the router too
+            if future.cancelled():
+                routed.cancel()
+
+        routed.add_done_callback(_resolve)
+        single.add_done_callback(_cancel)
+        return single
+
+    return PipelinedJsonRpcClient(write_line, window=window, expect=expect, first_id=first_id, tracer=tracer), stopped
 
 
 def create_gateway_mapping(proc: Popen) -> dict:
@@ -83,4 +835,3 @@ def create_gateway_mapping(proc: Popen) -> dict:
     # If the passed `proc` is already a wrapper with a `proc` attribute, unwrap it
     underlying = getattr(proc, 'proc', proc)
     return {'proc': underlying, 'log': getattr(underlying, 'log', getattr(proc, 'log', {}))}
-
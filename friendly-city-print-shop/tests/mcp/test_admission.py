@@ -0,0 +1,234 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("mcp")
+
+import anyio  # noqa: E402
+import mcp.types as types  # noqa: E402
+from mcp import ClientSession  # noqa: E402
+from mcp.client.sse import sse_client  # noqa: E402
+from mcp.server.lowlevel import Server  # noqa: E402
+from mcp.shared.message import SessionMessage  # noqa: E402
+
+from scripts.mcp_gateway.admission import (  # noqa: E402
+    OVERLOADED, REQUEST_TIMEOUT, AdmissionController, install_upstream_cancellation,
+)
+from scripts.mcp_gateway.mock_upstream import SSE_PATH, MockUpstream  # noqa: E402
+
+
+def _message(payload):
+    return SessionMessage(types.JSONRPCMessage.model_validate(payload))
+
+
+def _call(msg_id, name="slow"):
+    return _message({"jsonrpc": "2.0", "id": msg_id, "method": "tools/call", "params": {"name": name, "arguments": {}}})
+
+
+def _list(msg_id):
+    return _message({"jsonrpc": "2.0", "id": msg_id, "method": "prompts/list"})
+
+
+def _cancel(msg_id):
+    return _message({"jsonrpc": "2.0", "method": "notifications/cancelled", "params": {"requestId": msg_id}})
+
+
+async def _serve(controller, scenario):
+    """Run a server with a `slow` tool (finished by setting `release`) behind `controller`.
+
+    `order` records the handlers in the order they start."""
+    server = Server("admission-test")
+    release = anyio.Event()
+    order = []
+
+    # Not tools/list: call_tool would list tools to validate them
+    @server.list_prompts()
+    async def list_prompts():
+        order.append("prompts/list")
+        return []
+
+    @server.call_tool()
+    async def call_tool(name, arguments):
+        order.append(name)
+        if name == "slow":
+            await release.wait()
+        return [types.TextContent(type="text", text=name)]
+
+    client_write, read_stream = anyio.create_memory_object_stream(100)
+    write_stream, client_read = anyio.create_memory_object_stream(100)
+    responses = {}
+
+    async def recv(msg_id, timeout=5):
+        with anyio.fail_after(timeout):
+            while msg_id not in responses:
+                root = (await client_read.receive()).message.root
+                if hasattr(root, "id"):
+                    responses[root.id] = root
+        return responses[msg_id]
+
+    async with anyio.create_task_group() as tg:
+        async def run():
+            async with controller.filter(read_stream, write_stream) as (session_read, session_write):
+                await server.run(session_read, session_write, server.create_initialization_options(),
+                                 raise_exceptions=True)
+
+        tg.start_soon(run)
+        await client_write.send(_message({"jsonrpc": "2.0", "id": 0, "method": "initialize", "params": {
+            "protocolVersion": "2024-11-05", "capabilities": {}, "clientInfo": {"name": "t", "version": "1"}}}))
+        await recv(0)
+        await client_write.send(_message({"jsonrpc": "2.0", "method": "notifications/initialized"}))
+        await scenario(client_write, recv, release, order)
+        tg.cancel_scope.cancel()
+
+
+def test_requests_beyond_the_queue_are_rejected_and_queued_ones_run_in_order():
+    controller = AdmissionController(max_in_flight=1, max_queued=1, queue_timeout=None)
+
+    async def scenario(send, recv, release, order):
+        await send.send(_call(1))
+        await send.send(_call(2, name="fast"))
+        await send.send(_call(3))
+        rejected = await recv(3)
+        assert rejected.error.code == OVERLOADED
+        assert controller.stats()["in_flight"] == 1 and controller.stats()["queued"] == 1
+        release.set()
+        assert (await recv(1)).result["content"][0]["text"] == "slow"
+        assert (await recv(2)).result["content"][0]["text"] == "fast"
+
+    anyio.run(_serve, controller, scenario)
+    stats = controller.stats()
+    tool_calls = stats["admitted"] - stats["admitted_control"]
+    assert (tool_calls, stats["queued_total"], stats["rejected"], stats["in_flight"]) == (2, 1, 1, 0)
+
+
+def test_cancelled_queued_request_is_dropped_without_a_response():
+    controller = AdmissionController(max_in_flight=1, max_queued=4, queue_timeout=None)
+
+    async def scenario(send, recv, release, order):
+        await send.send(_call(1))
+        await send.send(_call(2, name="fast"))
+        await send.send(_call(3, name="fast"))
+        await send.send(_cancel(2))
+        release.set()
+        await recv(3)
+
+    anyio.run(_serve, controller, scenario)
+    assert controller.stats()["cancelled_queued"] == 1
+    assert controller.stats()["admitted"] - controller.stats()["admitted_control"] == 2
+
+
+def test_queue_and_request_timeouts_answer_with_request_timeout():
+    controller = AdmissionController(max_in_flight=1, max_queued=4, queue_timeout=0.1, request_timeout=0.3)
+
+    async def scenario(send, recv, release, order):
+        await send.send(_call(1))
+        await send.send(_call(2, name="fast"))
+        expired = await recv(2)
+        assert expired.error.code == REQUEST_TIMEOUT and "slot" in expired.error.message
+        # The running request is cancelled at its deadline and its slot is freed
+        timed_out = await recv(1)
+        assert timed_out.error.code == REQUEST_TIMEOUT
+        await send.send(_call(3, name="fast"))
+        assert (await recv(3)).result["content"][0]["text"] == "fast"
+
+    anyio.run(_serve, controller, scenario)
+    stats = controller.stats()
+    assert (stats["expired"], stats["timed_out"], stats["in_flight"]) == (1, 1, 0)
+
+
+def test_control_requests_do_not_wait_behind_slow_tool_calls():
+    controller = AdmissionController(max_in_flight=1, max_queued=8, queue_timeout=None, control_slots=1)
+
+    async def scenario(send, recv, release, order):
+        await send.send(_call(1))
+        await send.send(_call(2, name="fast"))
+        await send.send(_list(3))
+        assert (await recv(3)).result == {"prompts": []}
+        # The tool call queued before it is still waiting for the slow one
+        assert controller.stats()["queued_tools"] == 1
+        release.set()
+        await recv(2)
+
+    anyio.run(_serve, controller, scenario)
+
+
+def test_tool_limit_does_not_block_other_tools():
+    controller = AdmissionController(max_in_flight=4, queue_timeout=None, tool_limits={"slow": 1})
+
+    async def scenario(send, recv, release, order):
+        await send.send(_call(1))
+        await send.send(_call(2))
+        await send.send(_call(3, name="fast"))
+        await recv(3)
+        assert controller.stats()["limited_tools_in_flight"] == {"slow": 1}
+        assert controller.stats()["queued"] == 1
+        release.set()
+        await recv(1)
+        await recv(2)
+
+    anyio.run(_serve, controller, scenario)
+    assert controller.stats()["limited_tools_in_flight"] == {"slow": 0}
+
+
+def test_lanes_share_slots_by_weight_without_starving_tool_calls():
+    # One slot shared by both lanes, so every admission is a scheduling decision
+    controller = AdmissionController(
+        max_in_flight=1, max_queued=500, queue_timeout=None, control_slots=0, control_weight=4)
+    calls, lists = 100, 200
+    started = []
+
+    async def scenario(send, recv, release, order):
+        await send.send(_call(0))
+        for i in range(1, calls + 1):
+            await send.send(_call(i, name="fast"))
+        for i in range(calls + 1, calls + lists + 1):
+            await send.send(_list(i))
+        with anyio.fail_after(5):
+            while controller.stats()["queued"] < calls + lists:
+                await anyio.sleep(0.01)
+        release.set()
+        for i in range(calls + lists + 1):
+            await recv(i, timeout=30)
+        started.extend(order)
+
+    anyio.run(_serve, controller, scenario)
+    admitted = started[1:]
+    assert len(admitted) == calls + lists
+    # While both lanes wait, every five admissions are four control requests and one tool call
+    for start in range(0, 5 * (lists // 4), 5):
+        assert admitted[start:start + 5].count("fast") == 1
+    assert admitted[5 * (lists // 4):] == ["fast"] * (calls - lists // 4)
+
+
+def test_cancelled_upstream_call_is_cancelled_upstream(monkeypatch):
+    monkeypatch.setattr(ClientSession, "send_request", ClientSession.send_request)
+    monkeypatch.setattr(ClientSession, "__init__", ClientSession.__init__)
+    controller = AdmissionController()
+    install_upstream_cancellation(controller)
+    upstream = MockUpstream({"tools": {"slow": {"latency_ms": {"dist": "fixed", "value": 5000}}}})
+
+    async def scenario():
+        http = await upstream.serve("127.0.0.1", 0)
+        url = f"http://127.0.0.1:{http.sockets[0].getsockname()[1]}{SSE_PATH}"
+        try:
+            async with sse_client(url) as (read, write), ClientSession(read, write) as session:
+                await session.initialize()
+                call = asyncio.ensure_future(session.send_request(
+                    types.ClientRequest(types.CallToolRequest(
+                        method="tools/call", params=types.CallToolRequestParams(name="slow", arguments={}))),
+                    types.CallToolResult))
+                await asyncio.sleep(0.2)
+                call.cancel()
+                with pytest.raises(asyncio.CancelledError):
+                    await call
+                for _ in range(100):
+                    if upstream.cancelled:
+                        break
+                    await asyncio.sleep(0.02)
+        finally:
+            http.close()
+            await http.wait_closed()
+
+    asyncio.run(asyncio.wait_for(scenario(), 30))
+    assert upstream.cancelled == 1
+    assert controller.stats()["upstream_cancelled"] == 1
@@ -0,0 +1,168 @@
+import asyncio
+import hashlib
+import inspect
+import json
+from importlib.metadata import version
+
+import pytest
+
+pytest.importorskip("mcp")
+pytest.importorskip("pieces")
+
+import mcp.types as types  # noqa: E402
+from mcp import ClientSession  # noqa: E402
+from mcp.client.sse import sse_client  # noqa: E402
+from mcp.server.lowlevel import Server  # noqa: E402
+
+from scripts.mcp_gateway import batching  # noqa: E402
+from scripts.mcp_gateway.admission import AdmissionController  # noqa: E402
+from scripts.mcp_gateway.batching import BatchingSseClient  # noqa: E402
+from scripts.mcp_gateway.mock_upstream import SSE_PATH, MockUpstream  # noqa: E402
+from scripts.mcp_gateway.stdio_transport import stdio_server_factory  # noqa: E402
+
+
+def _call(msg_id, text):
+    return {"jsonrpc": "2.0", "id": msg_id, "method": "tools/call", "params": {"name": "echo", "arguments": {"text": text}}}
+
+
+def test_stdio_batches_are_answered_as_one_line():
+    server = Server("batching-test")
+
+    @server.call_tool()
+    async def call_tool(name, arguments):
+        # The second call finishes first; the batch still waits for both
+        await asyncio.sleep(0.05 if arguments["text"] == "a" else 0)
+        return [types.TextContent(type="text", text=arguments["text"])]
+
+    lines = [
+        {"jsonrpc": "2.0", "id": 1, "method": "initialize", "params": {
+            "protocolVersion": "2024-11-05", "capabilities": {}, "clientInfo": {"name": "t", "version": "1"}}},
+        {"jsonrpc": "2.0", "method": "notifications/initialized"},
+        [],
+        [_call(2, "a"), {"jsonrpc": "2.0", "method": "notifications/progress", "params": {
+            "progressToken": 1, "progress": 1}}, {"bogus": True}, _call(3, "b")],
+        _call(4, "c"),
+    ]
+    written = []
+    done = asyncio.Event()
+
+    async def stdin():
+        for line in lines:
+            yield json.dumps(line) + "\n"
+        await done.wait()
+
+    class Stdout:
+        async def write(self, line):
+            written.append(json.loads(line))
+
+        async def flush(self):
+            if len(written) == 4:
+                done.set()
+
+    async def scenario():
+        async with stdio_server_factory()(stdin(), Stdout()) as (read_stream, write_stream):
+            serving = asyncio.ensure_future(server.run(read_stream, write_stream, server.create_initialization_options()))
+            await asyncio.wait_for(done.wait(), 10)
+            serving.cancel()
+
+    asyncio.run(scenario())
+    empty, single, batch = written[1], written[2], written[3]
+    assert empty["id"] is None and empty["error"]["code"] == -32600
+    assert single["id"] == 4
+    # Responses in completion order, the invalid element's error first
+    assert [(r["id"], "error" in r) for r in batch] == [(None, True), (3, False), (2, False)]
+    assert batch[2]["result"]["content"][0]["text"] == "a"
+
+
+def test_batch_is_written_when_a_member_is_cancelled_unanswered():
+    server = Server("batching-cancel-test")
+    controller = AdmissionController(max_in_flight=1)
+    release = asyncio.Event()
+
+    @server.call_tool()
+    async def call_tool(name, arguments):
+        await release.wait()
+        return [types.TextContent(type="text", text=arguments["text"])]
+
+    lines = [
+        {"jsonrpc": "2.0", "id": 1, "method": "initialize", "params": {
+            "protocolVersion": "2024-11-05", "capabilities": {}, "clientInfo": {"name": "t", "version": "1"}}},
+        {"jsonrpc": "2.0", "method": "notifications/initialized"},
+        # Id 3 waits for id 2's slot; id 4 keeps its id despite the invalid method
+        [_call(2, "a"), _call(3, "b"), {"jsonrpc": "2.0", "id": 4, "method": 7}],
+        {"jsonrpc": "2.0", "method": "notifications/cancelled", "params": {"requestId": 3}},
+    ]
+    written = []
+    done = asyncio.Event()
+
+    async def stdin():
+        for line in lines:
+            yield json.dumps(line) + "\n"
+            await asyncio.sleep(0.05)
+        # Admission dropped the queued id 3 without a response
+        release.set()
+        await done.wait()
+
+    class Stdout:
+        async def write(self, line):
+            written.append(json.loads(line))
+
+        async def flush(self):
+            if len(written) == 2:
+                done.set()
+
+    async def scenario():
+        async with stdio_server_factory()(stdin(), Stdout()) as (read_stream, write_stream):
+            async with controller.filter(read_stream, write_stream) as (session_read, session_write):
+                serving = asyncio.ensure_future(
+                    server.run(session_read, session_write, server.create_initialization_options()))
+                await asyncio.wait_for(done.wait(), 10)
+                serving.cancel()
+
+    asyncio.run(asyncio.wait_for(scenario(), 20))
+    batch = written[1]
+    assert [(r["id"], "error" in r) for r in batch] == [(4, True), (2, False)]
+    assert controller.stats()["cancelled_queued"] == 1 and controller.stats()["in_flight"] == 0
+
+
+class _NoBatchUpstream(MockUpstream):
+    async def _post_message(self, body, session_id):
+        if body.lstrip().startswith(b"["):
+            return "400 Bad Request", {"error": "batches not supported"}
+        return await super()._post_message(body, session_id)
+
+
+@pytest.mark.parametrize("upstream_cls", [MockUpstream, _NoBatchUpstream])
+def test_concurrent_upstream_calls_share_posts(upstream_cls):
+    upstream = upstream_cls()
+    connect = BatchingSseClient()
+
+    async def scenario():
+        http = await upstream.serve("127.0.0.1", 0)
+        url = f"http://127.0.0.1:{http.sockets[0].getsockname()[1]}{SSE_PATH}"
+        try:
+            async with connect(url) as (read, write), ClientSession(read, write) as session:
+                await session.initialize()
+                results = await asyncio.gather(*(session.call_tool("echo", {"text": str(i)}) for i in range(20)))
+                return [r.content[0].text for r in results]
+        finally:
+            http.close()
+            await http.wait_closed()
+
+    assert asyncio.run(asyncio.wait_for(scenario(), 30)) == [str(i) for i in range(20)]
+    stats = connect.stats()
+    if upstream_cls is MockUpstream:
+        # The calls queued behind the first POST went out together
+        assert upstream.batches >= 1 and stats["batches"] == upstream.batches
+        assert stats["posts"] < 20
+    else:
+        assert (stats["rejected_batches"], stats["unbatched_upstreams"], stats["batches"]) == (1, 1, 0)
+
+
+def test_batching_client_matches_the_pinned_sdk_sse_client():
+    # BatchingSseClient copies sse_client; an SDK bump must re-sync it
+    if version("mcp") != batching.SDK_VERSION:
+        pytest.skip(f"mcp {version('mcp')} installed; BatchingSseClient was checked against {batching.SDK_VERSION}")
+    source = hashlib.sha256(inspect.getsource(sse_client).encode()).hexdigest()
+    assert source == batching.SDK_SSE_CLIENT_SHA256, (
+        "mcp.client.sse.sse_client changed: re-sync BatchingSseClient.__call__ and update its SDK pins")
@@ -0,0 +1,36 @@
+import io
+import json
+
+import pytest
+
+from scripts.mcp_gateway.framing import LineFramer
+
+
+def test_lines_are_framed_across_reads_and_the_buffer_grows():
+    payload = json.dumps({"jsonrpc": "2.0", "id": 1, "result": {"text": "x" * 5000}})
+    stream = io.BytesIO(b'{"id": 0}\r\n' + payload.encode() + b"\n\ntail")
+    framer = LineFramer(16)
+    lines = []
+    while True:
+        count = stream.readinto(framer.writable(7))
+        if not count:
+            break
+        framer.commit(count)
+        lines += [bytes(frame) for frame in framer.frames()]
+    tail = framer.flush()
+
+    assert lines == [b'{"id": 0}', payload.encode(), b""]
+    assert bytes(tail) == b"tail" and framer.buffered == 0
+    assert json.loads(lines[1])["result"]["text"] == "x" * 5000
+
+
+def test_frames_are_released_before_the_buffer_is_reused():
+    framer = LineFramer(4, keep_ends=True)
+    framer.feed("ab\ncd")
+    (frame,) = framer.frames()
+    assert bytes(frame) == b"ab\n"
+    # Growing the buffer must not fail on a frame the caller still holds
+    framer.feed(b"e" * 64 + b"\n")
+    with pytest.raises(ValueError):
+        bytes(frame)
+    assert [bytes(f) for f in framer.frames()] == [b"cd" + b"e" * 64 + b"\n"]
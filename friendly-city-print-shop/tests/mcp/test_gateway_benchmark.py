@@ -0,0 +1,234 @@
+"""Throughput and latency benchmarks for the stdio MCP gateway.
+
+Opt-in: set MCP_BENCHMARK=1. Tunables (environment variables):
+  MCP_BENCH_REQUESTS     requests per scenario and concurrency level (default 200)
+  MCP_BENCH_CONCURRENCY  comma-separated in-flight windows (default 1,4,16)
+  MCP_BENCH_OUTPUT       JSON results path (default bench-results/gateway-<commit>.json,
+                         with a -<worker> suffix under pytest-xdist)
+  MCP_BENCH_TRACE_DIR    trace every request (client and gateway spans, OTLP JSON
+                         lines) into this directory and add a per-phase breakdown
+                         (`scripts/mcp_gateway/trace_report.py`) to the results
+
+Compare runs by diffing the JSON files written for two commits.
+"""
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import pytest
+
+from scripts.mcp_gateway import trace_report
+from scripts.mcp_gateway.tracing import Tracer
+from tests.mcp.conftest import _GatewayStartSkipped, _launch_gateway, worker_id
+from tests.mcp.log_utils import pipelined_client_for
+
+pytestmark = [
+    pytest.mark.benchmark,
+    pytest.mark.skipif(os.environ.get('MCP_BENCHMARK') != '1', reason='set MCP_BENCHMARK=1 to run gateway benchmarks'),
+]
+
+BENCH_REQUESTS = int(os.environ.get('MCP_BENCH_REQUESTS', '200'))
+BENCH_CONCURRENCY = [int(c) for c in os.environ.get('MCP_BENCH_CONCURRENCY', '1,4,16').split(',') if c.strip()]
+TRACE_DIR = Path(os.environ['MCP_BENCH_TRACE_DIR']) if os.environ.get('MCP_BENCH_TRACE_DIR') else None
+
+SCENARIOS = {
+    'initialize': ('initialize', {
+        'protocolVersion': '2024-11-05',
+        'capabilities': {},
+        'clientInfo': {'name': 'bench-client', 'version': '1.0.0'},
+    }),
+    'tools/list': ('tools/list', {}),
+    'tools/call:echo': ('tools/call', {'name': 'echo', 'arguments': {'text': 'Hello'}}),
+    'tools/call:ask_pieces_ltm': ('tools/call', {'name': 'ask_pieces_ltm', 'arguments': {'question': 'What is 2+2?'}}),
+}
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    # Nearest-rank percentile; inputs are already sorted.
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100.0 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def _process_stats(pid: int) -> Dict[str, Optional[float]]:
+    """Return RSS bytes and cumulative CPU seconds for `pid`."""
+    try:
+        import psutil  # optional; used where /proc is unavailable
+        proc = psutil.Process(pid)
+        cpu = proc.cpu_times()
+        return {'rss_bytes': proc.memory_info().rss, 'cpu_seconds': cpu.user + cpu.system}
+    except ImportError:
+        pass
+    except Exception:
+        return {'rss_bytes': None, 'cpu_seconds': None}
+    stats: Dict[str, Optional[float]] = {'rss_bytes': None, 'cpu_seconds': None}
+    try:
+        for line in Path(f'/proc/{pid}/status').read_text().splitlines():
+            if line.startswith('VmRSS:'):
+                stats['rss_bytes'] = int(line.split()[1]) * 1024
+        # utime and stime are fields 14 and 15; skip past the parenthesised comm
+        fields = Path(f'/proc/{pid}/stat').read_text().rsplit(')', 1)[1].split()
+        stats['cpu_seconds'] = (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    except Exception:
+        pass
+    return stats
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True, stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return 'unknown'
+
+
+def _trace_file(kind: str) -> Optional[str]:
+    if TRACE_DIR is None:
+        return None
+    TRACE_DIR.mkdir(parents=True, exist_ok=True)
+    return str(TRACE_DIR / f'{kind}-{worker_id()}.otlp.jsonl')
+
+
+@pytest.fixture(scope='module')
+def bench_tracer():
+    """Client-side `Tracer` when MCP_BENCH_TRACE_DIR is set, else None."""
+    path = _trace_file('client')
+    if path is not None:
+        # Tracers append; start this run's files afresh
+        for stale in (path, _trace_file('gateway')):
+            Path(stale).unlink(missing_ok=True)
+    tracer = Tracer(path, service_name='mcp-bench-client') if path else None
+    yield tracer
+    if tracer is not None:
+        tracer.close()
+
+
+@pytest.fixture
+def bench_gateway(request, tmp_path_factory):
+    """`gateway_process`, or with tracing a gateway started with `--trace-file`."""
+    path = _trace_file('gateway')
+    if path is None:
+        yield request.getfixturevalue('gateway_process')
+        return
+    try:
+        wrapper = _launch_gateway(request.getfixturevalue('mock_mcp_server'), tmp_path_factory, extra_args=['--trace-file', path])
+    except _GatewayStartSkipped as e:
+        pytest.skip(str(e))
+    yield wrapper
+    # Closing stdin lets the gateway exit and write its remaining spans
+    wrapper.stdin.close()
+    try:
+        wrapper.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        wrapper.kill()
+
+
+@pytest.fixture(scope='module')
+def bench_report(bench_tracer):
+    results: List[dict] = []
+    yield results
+    commit = _git_commit()
+    # Each xdist worker reports the scenarios it ran
+    suffix = '' if worker_id() == 'main' else f'-{worker_id()}'
+    output = Path(os.environ.get('MCP_BENCH_OUTPUT') or Path('bench-results') / f'gateway-{commit}{suffix}.json')
+    output.parent.mkdir(parents=True, exist_ok=True)
+    phases = None
+    if bench_tracer is not None:
+        bench_tracer.close()
+        phases = trace_report.summarize(trace_report.load_spans([_trace_file('client'), _trace_file('gateway')]))
+    output.write_text(json.dumps({
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'requests_per_level': BENCH_REQUESTS,
+        'results': results,
+        'phases': phases,
+    }, indent=2))
+    print(f'\nGateway benchmark results written to {output}', file=sys.stderr)
+    if phases:
+        print(trace_report.format_summary(phases), file=sys.stderr)
+    for r in results:
+        print(
+            f"{r['scenario']:<28} c={r['concurrency']:<3} rps={r['requests_per_second']:>9.1f} "
+            f"p50={r['p50_ms']:>8.2f}ms p95={r['p95_ms']:>8.2f}ms p99={r['p99_ms']:>8.2f}ms errors={r['errors']}",
+            file=sys.stderr,
+        )
+
+
+async def _run_level(client, method: str, params: dict, total: int, concurrency: int) -> dict:
+    latencies: List[float] = []
+    errors = 0
+    remaining = total
+
+    # `concurrency` closed-loop workers; latency excludes time spent waiting
+    # for a free slot, so it reflects the gateway rather than the harness.
+    async def worker():
+        nonlocal errors, remaining
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, params, timeout=30.0)
+                if 'error' in response:
+                    errors += 1
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'requests': total,
+        'errors': errors,
+        'seconds': elapsed,
+        'requests_per_second': total / elapsed if elapsed else 0.0,
+        'p50_ms': _percentile(latencies, 50) * 1000,
+        'p95_ms': _percentile(latencies, 95) * 1000,
+        'p99_ms': _percentile(latencies, 99) * 1000,
+        'mean_ms': sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+    }
+
+
+@pytest.mark.integration
+@pytest.mark.parametrize('scenario', list(SCENARIOS))
+def test_gateway_throughput(bench_gateway, scenario, bench_report, bench_tracer):
+    method, params = SCENARIOS[scenario]
+    pid = bench_gateway.proc.pid
+
+    async def run():
+        client, stopped = pipelined_client_for(bench_gateway, window=max(BENCH_CONCURRENCY), tracer=bench_tracer)
+        try:
+            # The first request also absorbs any remaining gateway startup time.
+            init = await client.request('initialize', SCENARIOS['initialize'][1], timeout=60.0)
+            assert 'result' in init
+            await client.notify('notifications/initialized', {})
+            for concurrency in BENCH_CONCURRENCY:
+                client.resize(concurrency)
+                before = _process_stats(pid)
+                level = await _run_level(client, method, params, BENCH_REQUESTS, concurrency)
+                after = _process_stats(pid)
+                cpu = None
+                if before['cpu_seconds'] is not None and after['cpu_seconds'] is not None:
+                    cpu = after['cpu_seconds'] - before['cpu_seconds']
+                bench_report.append({
+                    'scenario': scenario,
+                    'concurrency': concurrency,
+                    **level,
+                    'gateway_rss_bytes': after['rss_bytes'],
+                    'gateway_rss_delta_bytes': (after['rss_bytes'] - before['rss_bytes']) if before['rss_bytes'] and after['rss_bytes'] else None,
+                    'gateway_cpu_seconds': cpu,
+                    'gateway_cpu_percent': (cpu / level['seconds'] * 100) if cpu is not None and level['seconds'] else None,
+                })
+        finally:
+            stopped.set()
+
+    asyncio.run(run())
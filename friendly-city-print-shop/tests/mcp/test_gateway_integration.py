@@ -1,9 +1,8 @@
 import json
-import time
 import queue
+import re
 import threading
 from tests.mcp.log_utils import start_log_reader, collect_jsonrpc_responses
-from pathlib import Path
 
 import pytest
 
@@ -17,7 +16,7 @@ def _collect_responses(q, expected_ids, timeout=10.0):
 
 def _send_requests(proc, requests):
     for r in requests:
-        proc.stdin.write(r + "\n")
+        proc.stdin.write((r + "\n").encode("utf-8"))
         proc.stdin.flush()
 
 
@@ -25,7 +24,7 @@ def _send_requests(proc, requests):
 def test_initialize_list_call_flow(gateway_process):
     # Start a reader for gateway stdout
     # gateway_process yields the raw `subprocess.Popen` with a `log` attribute
-    q, stopped = start_log_reader(gateway_process.log['stdout'])
+    q, stopped = start_log_reader(gateway_process.capture['stdout'])
 
     try:
         # Initialize, notifications and list_tools
@@ -56,7 +55,7 @@ def test_initialize_list_call_flow(gateway_process):
 
 @pytest.mark.integration
 def test_tool_call_echo_and_ask_ltm(gateway_process):
-    q, stopped = start_log_reader(gateway_process.log['stdout'])
+    q, stopped = start_log_reader(gateway_process.capture['stdout'])
     try:
         # Initialize + tools/list
         init = json.dumps({
@@ -120,16 +119,9 @@ def test_sse_client_persistent_connection(mock_mcp_server):
     resp = requests.post(post_url, json={"jsonrpc": "2.0", "id": 7, "method": "tools/list", "params": {}})
     assert resp.status_code == 200
     # Wait for the server to log the broadcast
-    stdout_log = Path(mock_mcp_server['log']['stdout'])
-    deadline = time.time() + 5
-    while time.time() < deadline:
-        try:
-            logs = stdout_log.read_text(errors='ignore')
-        except Exception:
-            logs = ''
-        if 'Broadcasting response' in logs:
-            assert 'tools' in logs or 'Echo Tool' in logs
-            break
-        time.sleep(0.05)
-    else:
+    stdout = mock_mcp_server['capture']['stdout']
+    match = stdout.wait_for('Broadcasting response', timeout=5)
+    if match is None:
         pytest.fail('Server did not broadcast message')
+    # The Node mock logs the payload over several lines
+    assert stdout.wait_for(re.compile(r'tools|Echo Tool'), after=match.offset, timeout=5) is not None
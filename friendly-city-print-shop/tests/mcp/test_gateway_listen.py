@@ -0,0 +1,67 @@
+import asyncio
+import queue
+import subprocess
+import sys
+import time
+
+import pytest
+
+from tests.mcp.conftest import _find_gateway_script
+from tests.mcp.log_utils import start_log_reader
+
+pytest.importorskip("uvicorn")
+
+
+def _wait_for_listening(q, timeout=30.0):
+    deadline = time.time() + timeout
+    url = None
+    while time.time() < deadline:
+        try:
+            line = q.get(timeout=0.5)
+        except queue.Empty:
+            continue
+        if line.startswith("GATEWAY_LISTENING"):
+            url = line.split()[1]
+        elif line.startswith("GATEWAY_READY") and url:
+            return url
+    pytest.fail("gateway did not start listening")
+
+
+@pytest.mark.integration
+@pytest.mark.parametrize("transport", ["sse", "streamable-http"])
+def test_listen_mode_serves_isolated_clients(mock_mcp_server, transport):
+    from mcp import ClientSession
+    from mcp.client.sse import sse_client
+    from mcp.client.streamable_http import streamablehttp_client
+
+    script, cwd = _find_gateway_script()
+    upstream = mock_mcp_server["url"] + "/model_context_protocol/2024-11-05/sse"
+    proc = subprocess.Popen(
+        [sys.executable, script, "--upstream-url", upstream, "--listen", "127.0.0.1:0", "--transport", transport],
+        cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+    )
+    q, stopped = start_log_reader(proc)
+    try:
+        url = _wait_for_listening(q)
+
+        def connect():
+            return sse_client(url) if transport == "sse" else streamablehttp_client(url)
+
+        async def scenario():
+            async with connect() as b_streams, ClientSession(b_streams[0], b_streams[1]) as b:
+                async with connect() as a_streams, ClientSession(a_streams[0], a_streams[1]) as a:
+                    init_a, init_b = await asyncio.gather(a.initialize(), b.initialize())
+                    tools_a, tools_b = await asyncio.gather(a.list_tools(), b.list_tools())
+                    assert init_a.serverInfo.name == init_b.serverInfo.name
+                    assert [t.name for t in tools_a.tools] == [t.name for t in tools_b.tools]
+                # One client going away leaves the other one working
+                assert (await b.list_tools()).tools
+
+        asyncio.run(asyncio.wait_for(scenario(), 60))
+    finally:
+        stopped.set()
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
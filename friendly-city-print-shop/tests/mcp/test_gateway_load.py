@@ -0,0 +1,194 @@
+"""Load test: a flood of slow tool calls must not starve the control lane.
+
+Opt-in: set MCP_LOAD=1. Tunables (environment variables):
+  MCP_LOAD_SECONDS             how long the flood runs (default 10)
+  MCP_LOAD_TOOL_LATENCY_MS     fixed upstream latency of the flooded tool (default 200)
+  MCP_LOAD_MAX_IN_FLIGHT       the gateway's --max-in-flight (default 32)
+  MCP_LOAD_FLOOD               slow tools/call requests kept in flight (default 4 x max in flight)
+  MCP_LOAD_MAX_CONTROL_P95_MS  allowed p95 latency of tools/list and ping under the flood (default 100)
+  MCP_LOAD_MIN_TOOL_SHARE      minimum tool throughput, as a share of max in flight / latency (default 0.7)
+  MCP_LOAD_OUTPUT              JSON report path (default bench-results/load-<commit>.json)
+
+A Python mock upstream (`scripts/mcp_gateway/mock_upstream.py`) answers
+the `slow` tool after a fixed latency. The flood keeps the tool lane full
+and its queue long, while one probe at a time sends tools/list and ping.
+Those belong to the control lane (see `admission.py`), so they must not
+wait behind the queued tool calls, and the tool calls must still use
+every slot.
+
+The gateway checks PiecesOS before every tool call and answers the call
+itself when that check fails, so the flood only reaches the upstream
+while PiecesOS is running. Otherwise the test is skipped.
+"""
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from pathlib import Path
+from typing import List
+
+import pytest
+
+from tests.mcp.conftest import (
+    _GatewayStartSkipped, _find_gateway_script, _launch_gateway, _stop_gateway, reserve_listen_socket,
+)
+from tests.mcp.log_utils import LogCapture, drain_to_capture, pipelined_client_for
+from tests.mcp.test_gateway_benchmark import _git_commit, _percentile
+
+pytestmark = [
+    pytest.mark.load,
+    pytest.mark.skipif(os.environ.get('MCP_LOAD') != '1', reason='set MCP_LOAD=1 to run gateway load tests'),
+]
+
+LOAD_SECONDS = float(os.environ.get('MCP_LOAD_SECONDS', '10'))
+TOOL_LATENCY_MS = float(os.environ.get('MCP_LOAD_TOOL_LATENCY_MS', '200'))
+MAX_IN_FLIGHT = int(os.environ.get('MCP_LOAD_MAX_IN_FLIGHT', '32'))
+FLOOD = int(os.environ.get('MCP_LOAD_FLOOD', str(4 * MAX_IN_FLIGHT)))
+MAX_CONTROL_P95_MS = float(os.environ.get('MCP_LOAD_MAX_CONTROL_P95_MS', '100'))
+MIN_TOOL_SHARE = float(os.environ.get('MCP_LOAD_MIN_TOOL_SHARE', '0.7'))
+# Probes start once the tool queue has filled up
+WARMUP_SECONDS = min(1.0, LOAD_SECONDS / 4)
+# The mock echoes `text`, so a response carrying it came from the upstream
+SLOW_CALL = {'name': 'slow', 'arguments': {'text': 'load'}}
+
+
+@pytest.fixture(scope='module')
+def slow_upstream(tmp_path_factory):
+    """The Python mock upstream with a `slow` tool of fixed latency."""
+    _, cwd = _find_gateway_script()
+    sock = reserve_listen_socket()
+    port = sock.getsockname()[1]
+    config = {'tools': {'slow': {'latency_ms': {'dist': 'fixed', 'value': TOOL_LATENCY_MS}}}}
+    env = {**os.environ, 'MCP_MOCK_CONFIG': json.dumps(config)}
+    script = os.path.join(cwd, 'scripts', 'mcp_gateway', 'mock_upstream.py')
+    try:
+        proc = subprocess.Popen([sys.executable, script, '--fd', str(sock.fileno())], env=env, cwd=cwd,
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=0, pass_fds=(sock.fileno(),))
+    finally:
+        sock.close()
+    log_dir = tmp_path_factory.mktemp('mcp-load-upstream')
+    capture = {name: LogCapture(str(log_dir / f'{name}.log')) for name in ('stdout', 'stderr')}
+    for name in ('stdout', 'stderr'):
+        threading.Thread(target=drain_to_capture, args=(getattr(proc, name), capture[name]), daemon=True).start()
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.time() + 10
+    while True:
+        try:
+            with urllib.request.urlopen(url + '/', timeout=0.5):
+                break
+        except OSError:
+            if time.time() > deadline or proc.poll() is not None:
+                proc.kill()
+                pytest.skip(f"slow mock upstream failed to start:\n{capture['stderr'].text()[-2000:]}")
+            time.sleep(0.1)
+    yield {'url': url, 'proc': proc}
+    proc.terminate()
+    try:
+        proc.wait(timeout=5)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+@pytest.fixture
+def load_gateway(slow_upstream, tmp_path_factory):
+    """A production-mode gateway whose queue holds the whole flood."""
+    try:
+        wrapper = _launch_gateway(slow_upstream, tmp_path_factory, ready_timeout=60.0, extra_args=[
+            '--mode', 'production',
+            '--max-in-flight', str(MAX_IN_FLIGHT),
+            '--max-queued', str(FLOOD),
+            '--queue-timeout', str(LOAD_SECONDS + 60),
+        ])
+    except _GatewayStartSkipped as e:
+        pytest.skip(str(e))
+    yield wrapper
+    _stop_gateway(wrapper)
+
+
+@pytest.mark.integration
+def test_control_lane_stays_fast_under_a_slow_tool_flood(load_gateway):
+    control_ms: List[float] = []
+    counts = {'tool_calls': 0, 'tool_errors': 0, 'control_errors': 0}
+
+    async def run() -> float:
+        client, stopped = pipelined_client_for(load_gateway, window=FLOOD + 1)
+        try:
+            init = await client.request('initialize', {
+                'protocolVersion': '2024-11-05',
+                'capabilities': {},
+                'clientInfo': {'name': 'load-client', 'version': '1.0.0'},
+            }, timeout=60.0)
+            assert 'result' in init
+            await client.notify('notifications/initialized', {})
+            probe_call = await client.request('tools/call', SLOW_CALL, timeout=60.0)
+            if probe_call.get('result', {}).get('content', [{}])[0].get('text') != 'load':
+                pytest.skip(f'tool calls do not reach the upstream (is PiecesOS running?): {probe_call}')
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            measure_from = started + WARMUP_SECONDS
+            stop_at = started + LOAD_SECONDS
+            measured_calls = 0
+
+            async def flood():
+                nonlocal measured_calls
+                while loop.time() < stop_at:
+                    try:
+                        response = await client.request('tools/call', SLOW_CALL, timeout=LOAD_SECONDS + 60)
+                        counts['tool_errors'] += 'error' in response or response['result'].get('isError', False)
+                    except Exception:
+                        counts['tool_errors'] += 1
+                    counts['tool_calls'] += 1
+                    if measure_from <= loop.time() <= stop_at:
+                        measured_calls += 1
+
+            async def probe():
+                await asyncio.sleep(WARMUP_SECONDS)
+                methods = ('tools/list', 'ping')
+                while loop.time() < stop_at:
+                    sent = time.perf_counter()
+                    try:
+                        response = await client.request(methods[len(control_ms) % 2], {}, timeout=30.0)
+                        counts['control_errors'] += 'error' in response
+                    except Exception:
+                        counts['control_errors'] += 1
+                    control_ms.append((time.perf_counter() - sent) * 1000)
+                    await asyncio.sleep(0.02)
+
+            await asyncio.gather(probe(), *(flood() for _ in range(FLOOD)))
+            return measured_calls / (stop_at - measure_from)
+        finally:
+            stopped.set()
+
+    tool_rps = asyncio.run(run())
+    ideal_rps = MAX_IN_FLIGHT / (TOOL_LATENCY_MS / 1000)
+    control_ms.sort()
+    control_p95 = _percentile(control_ms, 95)
+
+    output = Path(os.environ.get('MCP_LOAD_OUTPUT') or Path('bench-results') / f'load-{_git_commit()}.json')
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({
+        'seconds': LOAD_SECONDS,
+        'tool_latency_ms': TOOL_LATENCY_MS,
+        'max_in_flight': MAX_IN_FLIGHT,
+        'flood': FLOOD,
+        **counts,
+        'tool_requests_per_second': tool_rps,
+        'ideal_tool_requests_per_second': ideal_rps,
+        'control_requests': len(control_ms),
+        'control_p50_ms': _percentile(control_ms, 50),
+        'control_p95_ms': control_p95,
+        'control_max_ms': control_ms[-1] if control_ms else None,
+    }, indent=2))
+    print(f'\nGateway load results written to {output}: tool rps={tool_rps:.1f} (ideal {ideal_rps:.1f}), '
+          f'control p95={control_p95:.1f}ms over {len(control_ms)} requests', file=sys.stderr)
+
+    assert control_ms, 'no control requests were sent'
+    assert counts['tool_errors'] == 0 and counts['control_errors'] == 0, f'requests failed: {counts}'
+    assert control_p95 <= MAX_CONTROL_P95_MS, (
+        f'control lane p95 {control_p95:.1f}ms over {MAX_CONTROL_P95_MS:g}ms under the flood (report: {output})')
+    assert tool_rps >= MIN_TOOL_SHARE * ideal_rps, (
+        f'tool throughput {tool_rps:.1f}/s under {MIN_TOOL_SHARE:g} x {ideal_rps:.1f}/s (report: {output})')
@@ -0,0 +1,232 @@
+"""Soak test: drive a long mixed workload and fail on resource growth.
+
+Opt-in: set MCP_SOAK=1. Tunables (environment variables):
+  MCP_SOAK_REQUESTS        total requests (default 1000000)
+  MCP_SOAK_CONCURRENCY     requests kept in flight (default 16)
+  MCP_SOAK_SAMPLES         resource samples taken over the run (default 20)
+  MCP_SOAK_WARMUP_SAMPLES  leading samples left out of the slope fit (default 2)
+  MCP_SOAK_MAX_RSS_SLOPE   allowed memory growth, bytes per 10k requests (default 65536);
+                           applies to the traced heap while tracemalloc is on
+  MCP_SOAK_MAX_FD_SLOPE    allowed open-FD growth per 10k requests (default 0.5)
+  MCP_SOAK_MAX_TASK_SLOPE  allowed asyncio task growth per 10k requests (default 0.5)
+  MCP_SOAK_MAX_ERROR_RATE  allowed share of requests that fail or time out (default 0.001)
+  MCP_SOAK_DEADLINE        seconds after which no more requests are sent and the
+                           run fails (default 7200)
+  MCP_SOAK_MIX             request mix as name=weight pairs, where a name is a
+                           tool (called via tools/call) or a method
+                           (default echo=6,ask_pieces_ltm=2,tools/list=1,ping=1)
+  MCP_SOAK_TRACEMALLOC     tracemalloc frames in the gateway, 0 disables (default 1)
+  MCP_SOAK_OUTPUT          JSON report path (default bench-results/soak-<commit>.json)
+
+Samples come from the gateway's own metrics endpoint (`--metrics-port`):
+RSS, open file descriptors, asyncio tasks, and with tracemalloc the traced
+heap and the top allocation sites. A line is least-squares fitted to each
+series after the warm-up. The report keeps every sample, so a failure
+shows which allocator grew. The default slopes are meant for long runs.
+Over a few thousand requests, allocator noise alone can exceed them.
+"""
+import asyncio
+import json
+import os
+import re
+import time
+import urllib.request
+from pathlib import Path
+from typing import Dict, List
+
+import pytest
+
+from tests.mcp.conftest import _GatewayStartSkipped, _launch_gateway, _stop_gateway
+from tests.mcp.log_utils import pipelined_client_for
+from tests.mcp.test_gateway_benchmark import _git_commit
+
+pytestmark = [
+    pytest.mark.soak,
+    pytest.mark.skipif(os.environ.get('MCP_SOAK') != '1', reason='set MCP_SOAK=1 to run gateway soak tests'),
+]
+
+SOAK_REQUESTS = int(os.environ.get('MCP_SOAK_REQUESTS', '1000000'))
+SOAK_CONCURRENCY = int(os.environ.get('MCP_SOAK_CONCURRENCY', '16'))
+SOAK_SAMPLES = max(3, int(os.environ.get('MCP_SOAK_SAMPLES', '20')))
+WARMUP_SAMPLES = int(os.environ.get('MCP_SOAK_WARMUP_SAMPLES', '2'))
+TRACEMALLOC_FRAMES = int(os.environ.get('MCP_SOAK_TRACEMALLOC', '1'))
+# Allowed growth per 10k requests, keyed by metric name. tracemalloc's own
+# bookkeeping grows RSS, so with it on the traced Python heap is judged.
+MEMORY_METRIC = 'python_tracemalloc_traced_bytes' if TRACEMALLOC_FRAMES > 0 else 'process_resident_memory_bytes'
+MAX_SLOPES = {
+    MEMORY_METRIC: float(os.environ.get('MCP_SOAK_MAX_RSS_SLOPE', str(64 * 1024))),
+    'process_open_fds': float(os.environ.get('MCP_SOAK_MAX_FD_SLOPE', '0.5')),
+    'mcp_gateway_asyncio_tasks': float(os.environ.get('MCP_SOAK_MAX_TASK_SLOPE', '0.5')),
+}
+MAX_ERROR_RATE = float(os.environ.get('MCP_SOAK_MAX_ERROR_RATE', '0.001'))
+SOAK_DEADLINE = float(os.environ.get('MCP_SOAK_DEADLINE', '7200'))
+REQUEST_TIMEOUT = 60.0
+
+SOAK_MIX = os.environ.get('MCP_SOAK_MIX', 'echo=6,ask_pieces_ltm=2,tools/list=1,ping=1')
+TOOL_ARGUMENTS = {'echo': {'text': 'Hello'}, 'ask_pieces_ltm': {'question': 'What is 2+2?'}}
+
+
+def _workload(mix: str) -> List[tuple]:
+    """Expand `name=weight,...` into a repeating (method, params) schedule."""
+    schedule = []
+    for item in mix.split(','):
+        name, _, weight = item.strip().partition('=')
+        if '/' in name or name == 'ping':
+            request = (name, {})
+        else:
+            request = ('tools/call', {'name': name, 'arguments': TOOL_ARGUMENTS.get(name, {})})
+        schedule.extend([request] * int(weight or 1))
+    return schedule
+
+
+def _fit_slope(xs: List[float], ys: List[float]) -> float:
+    n = len(xs)
+    mean_x, mean_y = sum(xs) / n, sum(ys) / n
+    var_x = sum((x - mean_x) ** 2 for x in xs)
+    if not var_x:
+        return 0.0
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / var_x
+
+
+def _scrape(url: str) -> Dict[str, float]:
+    values = {}
+    with urllib.request.urlopen(url, timeout=30) as resp:
+        for line in resp.read().decode().splitlines():
+            match = re.match(r'^([a-zA-Z_:][\w:]*) (\S+)$', line)
+            if match:
+                values[match.group(1)] = float(match.group(2))
+    return values
+
+
+def _tracemalloc_top(metrics_url: str, limit: int = 10) -> List[str]:
+    url = metrics_url.rsplit('/', 1)[0] + f'/debug/tracemalloc?limit={limit}'
+    try:
+        with urllib.request.urlopen(url, timeout=120) as resp:
+            return resp.read().decode().splitlines()
+    except OSError:
+        return []
+
+
+def _metrics_url(stderr, timeout: float = 10.0) -> str:
+    match = stderr.wait_for('GATEWAY_METRICS ', timeout=timeout)
+    if match is None:
+        pytest.fail('gateway did not announce its metrics endpoint')
+    return match.line.split()[1]
+
+
+@pytest.fixture
+def soak_gateway(mock_mcp_server, tmp_path_factory):
+    """A `gateway_process`-style gateway with metrics (and tracemalloc) enabled."""
+    env = {'PYTHONTRACEMALLOC': str(TRACEMALLOC_FRAMES)} if TRACEMALLOC_FRAMES > 0 else None
+    try:
+        wrapper = _launch_gateway(
+            mock_mcp_server, tmp_path_factory, ready_timeout=60.0,
+            extra_args=['--mode', 'production', '--metrics-port', '0'], env=env,
+        )
+    except _GatewayStartSkipped as e:
+        pytest.skip(str(e))
+    yield wrapper
+    _stop_gateway(wrapper)
+
+
+@pytest.mark.integration
+def test_gateway_soak_has_no_resource_growth(soak_gateway):
+    metrics_url = _metrics_url(soak_gateway.capture['stderr'])
+    schedule = _workload(SOAK_MIX)
+    sample_every = max(1, SOAK_REQUESTS // SOAK_SAMPLES)
+    samples: List[dict] = []
+    counts = {'sent': 0, 'done': 0, 'errors': 0}
+    hit_deadline = False
+
+    async def take_sample(with_top: bool = False):
+        values = await asyncio.to_thread(_scrape, metrics_url)
+        sample = {'requests': counts['done'], 'time': time.time(), **{
+            name: values.get(name) for name in (
+                'process_resident_memory_bytes', 'python_tracemalloc_traced_bytes', *MAX_SLOPES,
+            )
+        }}
+        # A snapshot of the whole heap is slow, so allocation sites are taken
+        # once the warm-up is over and at the end, for comparison.
+        if with_top and TRACEMALLOC_FRAMES > 0:
+            sample['tracemalloc_top'] = await asyncio.to_thread(_tracemalloc_top, metrics_url)
+        samples.append(sample)
+
+    async def run():
+        nonlocal hit_deadline
+        client, stopped = pipelined_client_for(soak_gateway, window=SOAK_CONCURRENCY)
+        try:
+            init = await client.request('initialize', {
+                'protocolVersion': '2024-11-05',
+                'capabilities': {},
+                'clientInfo': {'name': 'soak-client', 'version': '1.0.0'},
+            }, timeout=REQUEST_TIMEOUT)
+            assert 'result' in init
+            await client.notify('notifications/initialized', {})
+            loop = asyncio.get_running_loop()
+            # Requests in flight at the deadline still get REQUEST_TIMEOUT to finish
+            deadline = loop.time() + SOAK_DEADLINE
+
+            async def worker():
+                nonlocal hit_deadline
+                while counts['sent'] < SOAK_REQUESTS:
+                    if loop.time() >= deadline:
+                        hit_deadline = True
+                        return
+                    method, params = schedule[counts['sent'] % len(schedule)]
+                    counts['sent'] += 1
+                    try:
+                        response = await client.request(method, params, timeout=REQUEST_TIMEOUT)
+                        counts['errors'] += 'error' in response
+                    except Exception:
+                        counts['errors'] += 1
+                    counts['done'] += 1
+
+            async def sampler():
+                next_at = 0
+                while not workers.done():
+                    if counts['done'] >= next_at:
+                        await take_sample(with_top=len(samples) == WARMUP_SAMPLES)
+                        next_at += sample_every
+                    await asyncio.sleep(0.05)
+
+            workers = asyncio.gather(*(worker() for _ in range(SOAK_CONCURRENCY)))
+            await asyncio.gather(sampler(), workers)
+            await take_sample(with_top=True)
+        finally:
+            stopped.set()
+
+    started = time.time()
+    asyncio.run(run())
+
+    fitted = [s for s in samples[WARMUP_SAMPLES:] if all(s[name] is not None for name in MAX_SLOPES)]
+    slopes = {}
+    if len(fitted) >= 3:
+        xs = [s['requests'] for s in fitted]
+        slopes = {name: _fit_slope(xs, [s[name] for s in fitted]) * 10000 for name in MAX_SLOPES}
+
+    output = Path(os.environ.get('MCP_SOAK_OUTPUT') or Path('bench-results') / f'soak-{_git_commit()}.json')
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({
+        'requests': SOAK_REQUESTS,
+        'concurrency': SOAK_CONCURRENCY,
+        'seconds': time.time() - started,
+        'completed': counts['done'],
+        'errors': counts['errors'],
+        'max_error_rate': MAX_ERROR_RATE,
+        'deadline_seconds': SOAK_DEADLINE,
+        'hit_deadline': hit_deadline,
+        'slopes_per_10k_requests': slopes,
+        'max_slopes_per_10k_requests': MAX_SLOPES,
+        'samples': samples,
+    }, indent=2))
+
+    assert not hit_deadline, (
+        f"run hit MCP_SOAK_DEADLINE ({SOAK_DEADLINE:g}s) after {counts['done']} of {SOAK_REQUESTS} requests "
+        f"(report: {output})")
+    error_rate = counts['errors'] / max(1, counts['done'])
+    assert error_rate <= MAX_ERROR_RATE, (
+        f"{counts['errors']} of {counts['done']} requests failed, over MCP_SOAK_MAX_ERROR_RATE={MAX_ERROR_RATE:g} "
+        f"(report: {output})")
+    assert len(fitted) >= 3, f'not enough samples with process metrics (see {output})'
+    over = {name: slope for name, slope in slopes.items() if slope > MAX_SLOPES[name]}
+    assert not over, f'resource growth over the allowed slope per 10k requests: {over} (report: {output})'
@@ -0,0 +1,100 @@
+import json
+import queue
+import re
+import threading
+
+from tests.mcp import log_utils
+from tests.mcp.log_utils import JsonRpcResponseRouter, LogCapture, collect_jsonrpc_responses, start_log_reader
+
+
+def test_router_keeps_responses_that_arrive_early():
+    q: queue.Queue = queue.Queue()
+    # Responses for a later call arrive before the earlier call is collected
+    for msg_id in (3, 1, 2):
+        q.put(json.dumps({"jsonrpc": "2.0", "id": msg_id, "result": {}}) + "\n")
+    q.put("GATEWAY_RECEIVED_REQUEST: CallToolRequest\n")
+
+    assert list(collect_jsonrpc_responses(q, [1], timeout=5.0)) == [1]
+    # The response for id 3 was parsed during the first call but not dropped
+    assert set(collect_jsonrpc_responses(q, [2, 3], timeout=5.0)) == {2, 3}
+
+
+def test_router_future_and_partial_timeout():
+    q: queue.Queue = queue.Queue()
+    router = JsonRpcResponseRouter(q)
+    future = router.expect([7, 8])
+    q.put(json.dumps({"jsonrpc": "2.0", "id": 8, "result": {}}) + "\n")
+    assert router.wait_for([7, 8], timeout=0.2) == {8: {"jsonrpc": "2.0", "id": 8, "result": {}}}
+    assert not future.done()
+    q.put(json.dumps({"jsonrpc": "2.0", "id": 7, "error": {"code": -32000, "message": "x"}}) + "\n")
+    assert set(future.result(timeout=5.0)) == {7, 8}
+
+
+def test_cancelled_expect_forgets_its_ids():
+    q: queue.Queue = queue.Queue()
+    router = JsonRpcResponseRouter(q)
+    future = router.expect([5, 6])
+    router.feed(json.dumps({"jsonrpc": "2.0", "id": 5, "result": {}}))
+    assert future.cancel()
+    assert router._waiters == {} and router.get(5) is None
+    # A response that comes after giving up is not kept
+    router.feed(json.dumps({"jsonrpc": "2.0", "id": 6, "result": {}}))
+    assert router.get(6) is None
+    # ...but a later request that reuses the id gets its response
+    reused = router.expect([6])
+    router.feed(json.dumps({"jsonrpc": "2.0", "id": 6, "result": {"n": 2}}))
+    assert reused.result(timeout=5.0)[6]["result"] == {"n": 2}
+
+
+def test_collected_responses_are_consumed_and_readers_forgotten():
+    capture = LogCapture()
+    q, stopped = start_log_reader(capture)
+    capture.feed(json.dumps({"jsonrpc": "2.0", "id": 1, "result": {"n": 1}}) + "\n")
+    assert collect_jsonrpc_responses(q, [1], timeout=5.0)[1]["result"] == {"n": 1}
+    # A reused id waits for its new response rather than returning the old one
+    assert collect_jsonrpc_responses(q, [1], timeout=0.1) == {}
+    capture.feed(json.dumps({"jsonrpc": "2.0", "id": 1, "result": {"n": 2}}) + "\n")
+    assert collect_jsonrpc_responses(q, [1], timeout=5.0)[1]["result"] == {"n": 2}
+    assert q in log_utils._routers
+    stopped.set()
+    assert q not in log_utils._routers and q not in log_utils._reader_stop_events
+
+
+def test_file_reader_sees_lines_written_after_start(tmp_path):
+    log = tmp_path / "stdout.log"
+    log.write_text("before\n")
+    q, stopped = start_log_reader(str(log))
+    try:
+        with open(log, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"jsonrpc": "2.0", "id": 1, "result": {}}) + "\n")
+        assert 1 in collect_jsonrpc_responses(q, [1], timeout=5.0)
+    finally:
+        stopped.set()
+
+
+def test_capture_is_bounded_searchable_and_batches_to_disk(tmp_path):
+    log = tmp_path / "stdout.log"
+    capture = LogCapture(str(log), max_lines=4)
+    q, stopped = start_log_reader(capture)
+    try:
+        for i in range(6):
+            capture.feed(f"line {i}\n")
+        # Only the newest lines are kept, addressed by absolute offset
+        assert capture.offset == 6
+        assert capture.lines() == [f"line {i}\n" for i in range(2, 6)]
+        assert capture.search("line 0") is None
+        assert capture.search("line", after=4) == (4, "line 4\n")
+
+        mark = capture.offset
+        threading.Timer(0.05, capture.feed, args=("GATEWAY_READY\n",)).start()
+        match = capture.wait_for(re.compile(r"^GATEWAY_\w+"), after=mark, timeout=5.0)
+        assert match == (6, "GATEWAY_READY\n") and match.end == 7
+        assert capture.wait_for("never", after=match.end, timeout=0.05) is None
+        assert [q.get(timeout=1) for _ in range(7)][-1] == "GATEWAY_READY\n"
+    finally:
+        stopped.set()
+    capture.close()
+    # The file still gets every line, the ones evicted from memory included
+    assert log.read_text().splitlines()[0] == "line 0"
+    assert len(log.read_text().splitlines()) == 7
+    assert capture.wait_for("never", timeout=5.0) is None and capture.closed
@@ -0,0 +1,32 @@
+import io
+import json
+import logging
+
+from scripts.mcp_gateway.logging_pipeline import LoggingPipeline
+
+
+def test_pipeline_writes_json_lines_and_counts_drops():
+    logger = logging.getLogger("tests.mcp.logging_pipeline")
+    logger.setLevel(logging.DEBUG)
+    inline = logging.NullHandler()
+    logger.addHandler(inline)
+    out = io.StringIO()
+    pipeline = LoggingPipeline([logger], out, level=logging.INFO, capacity=2, keep_inline=[inline])
+    try:
+        # The listener is not running yet, so only the first two records fit
+        logger.info("first %s", 1, extra={"event": "custom"})
+        logger.debug("second")
+        logger.info("third")
+        assert pipeline.dropped == 1
+        pipeline.start()
+    finally:
+        pipeline.stop()
+    assert logger.handlers == [inline]
+    assert logger.propagate is True
+    logger.removeHandler(inline)
+
+    records = [json.loads(line) for line in out.getvalue().splitlines()]
+    # DEBUG is below the writer level; the drop count is reported once
+    assert [r["msg"] for r in records] == ["first 1", "Dropped 1 log records (queue full)"]
+    assert records[0]["event"] == "custom"
+    assert records[1]["event"] == "log_records_dropped"
@@ -0,0 +1,62 @@
+import asyncio
+import types as pytypes
+
+import pytest
+
+pytest.importorskip("mcp")
+
+import mcp.types as types  # noqa: E402
+from mcp.server.lowlevel import Server  # noqa: E402
+
+from scripts.mcp_gateway.metrics import GatewayMetrics, install_request_metrics, stats_collector  # noqa: E402
+
+
+def test_histogram_renders_cumulative_buckets():
+    metrics = GatewayMetrics()
+    for value in (0.0005, 0.02, 30.0):
+        metrics.latency.observe("tools/list", "", value=value)
+    text = metrics.render()
+    labels = 'method="tools/list",tool=""'
+    assert f'mcp_gateway_request_duration_seconds_bucket{{{labels},le="0.001"}} 1' in text
+    assert f'mcp_gateway_request_duration_seconds_bucket{{{labels},le="0.025"}} 2' in text
+    assert f'mcp_gateway_request_duration_seconds_bucket{{{labels},le="10"}} 2' in text
+    assert f'mcp_gateway_request_duration_seconds_bucket{{{labels},le="+Inf"}} 3' in text
+    assert f"mcp_gateway_request_duration_seconds_count{{{labels}}} 3" in text
+
+
+def test_request_handlers_are_counted_per_tool(monkeypatch):
+    import mcp.server.session as session_mod
+
+    # install_request_metrics patches ServerSession; restore it afterwards
+    monkeypatch.setattr(session_mod.ServerSession, "_received_request", session_mod.ServerSession._received_request)
+    server = Server("metrics-test")
+
+    @server.call_tool()
+    async def call_tool(name, arguments):
+        if name == "broken":
+            raise RuntimeError("boom")
+        return [types.TextContent(type="text", text="ok")]
+
+    metrics = GatewayMetrics()
+    metrics.registry.add_collector(stats_collector("demo_cache", lambda: {"hits": 3, "ttl_seconds": 1.5}, counters=("hits",)))
+    listed = [types.Tool(name=name, inputSchema={"type": "object"}) for name in ("echo", "broken")]
+    upstream = pytypes.SimpleNamespace(discovered_tools=listed)
+    install_request_metrics(pytypes.SimpleNamespace(server=server, upstream=upstream), metrics)
+    handler = server.request_handlers[types.CallToolRequest]
+
+    async def scenario():
+        # Names the upstream does not list share one series
+        for name in ("echo", "echo", "broken", "made-up-1", "made-up-2"):
+            await handler(types.CallToolRequest(method="tools/call", params=types.CallToolRequestParams(name=name)))
+
+    asyncio.run(scenario())
+
+    assert metrics.requests.value("tools/call", "echo") == 2
+    assert metrics.errors.value("tools/call", "echo") == 0
+    assert metrics.errors.value("tools/call", "broken") == 1
+    assert metrics.requests.value("tools/call", "other") == 2
+    assert "made-up" not in metrics.render()
+    assert metrics.in_flight.value("tools/call") == 0
+    text = metrics.render()
+    assert "# TYPE demo_cache_hits_total counter\ndemo_cache_hits_total 3" in text
+    assert "demo_cache_ttl_seconds 1.5" in text
@@ -0,0 +1,69 @@
+import asyncio
+import random
+import time
+
+import pytest
+
+pytest.importorskip("mcp")
+
+from mcp import ClientSession  # noqa: E402
+from mcp.client.sse import sse_client  # noqa: E402
+
+from scripts.mcp_gateway.mock_upstream import SSE_PATH, MockUpstream, sample_latency_ms  # noqa: E402
+
+
+def test_latency_distributions_are_non_negative_and_seeded():
+    specs = [
+        {"dist": "fixed", "value": 5},
+        {"dist": "uniform", "min": 1, "max": 2},
+        {"dist": "exponential", "mean": 10},
+        {"dist": "lognormal", "median": 20, "sigma": 1.0},
+        {"dist": "pareto", "scale": 3, "alpha": 1.5},
+    ]
+    for spec in specs:
+        a = [sample_latency_ms(spec, random.Random(7)) for _ in range(5)]
+        b = [sample_latency_ms(spec, random.Random(7)) for _ in range(5)]
+        assert a == b and all(v >= 0 for v in a)
+    assert sample_latency_ms({"dist": "fixed", "value": 5}, random.Random()) == 5
+    with pytest.raises(ValueError):
+        sample_latency_ms({"dist": "bogus"}, random.Random())
+
+
+def test_sessions_get_only_their_own_responses():
+    upstream = MockUpstream({
+        "seed": 1,
+        "tools": {
+            "slow": {"latency_ms": {"dist": "fixed", "value": 100}, "payload_bytes": 2048},
+            "flaky": {"error_rate": 1.0},
+        },
+    })
+
+    async def scenario():
+        server = await upstream.serve("127.0.0.1", 0)
+        url = f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}{SSE_PATH}"
+        try:
+            async with sse_client(url) as (ra, wa), ClientSession(ra, wa) as a:
+                async with sse_client(url) as (rb, wb), ClientSession(rb, wb) as b:
+                    await asyncio.gather(a.initialize(), b.initialize())
+                    assert {t.name for t in (await a.list_tools()).tools} >= {"echo", "slow", "flaky"}
+                    # Both sessions use the same request ids; each gets its own answer
+                    started = time.monotonic()
+                    slow, echo = await asyncio.gather(
+                        a.call_tool("slow", {"text": "from a"}), b.call_tool("echo", {"text": "from b"})
+                    )
+                    assert slow.content[0].text.startswith("from a")
+                    assert len(slow.content[0].text) == 2048
+                    assert echo.content[0].text == "from b"
+                    assert time.monotonic() - started >= 0.1
+                    assert (await b.call_tool("flaky", {})).isError
+            # Closed SSE streams are noticed and their sessions dropped
+            for _ in range(100):
+                if not upstream.sessions:
+                    break
+                await asyncio.sleep(0.01)
+            assert upstream.sessions == {}
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    asyncio.run(asyncio.wait_for(scenario(), 30))
@@ -0,0 +1,67 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+
+pytest.importorskip("pieces.mcp.gateway")
+
+import anyio  # noqa: E402
+import mcp.types as types  # noqa: E402
+from mcp import ClientSession  # noqa: E402
+from mcp.shared.message import SessionMessage  # noqa: E402
+
+from scripts.mcp_gateway.multiplex import MultiplexedSseClient  # noqa: E402
+
+
+def _message(**fields):
+    return SessionMessage(message=types.JSONRPCMessage.model_validate({"jsonrpc": "2.0", **fields}))
+
+
+def test_sessions_share_one_stream_without_id_collisions():
+    connections = []
+    posted_ids = []
+
+    @asynccontextmanager
+    async def broadcasting_sse_client(url, *args, **kwargs):
+        """Upstream that, like scripts/mcp-server.js, echoes every post to the stream."""
+        connections.append(url)
+        to_client, client_reads = anyio.create_memory_object_stream(100)
+        client_writes, from_client = anyio.create_memory_object_stream(100)
+
+        async def serve():
+            async for posted in from_client:
+                root = posted.message.root
+                await to_client.send(posted)
+                if isinstance(root, types.JSONRPCRequest):
+                    posted_ids.append(root.id)
+                    # Another gateway's response with a colliding id
+                    await to_client.send(_message(id=0, result={}))
+                    await to_client.send(_message(id=root.id, result={}))
+
+        task = asyncio.create_task(serve())
+        try:
+            async with to_client, client_reads, client_writes, from_client:
+                yield client_reads, client_writes
+        finally:
+            task.cancel()
+
+    mux = MultiplexedSseClient(connect=broadcasting_sse_client)
+    url = "http://upstream/sse"
+
+    async def scenario():
+        async with mux(url) as (read_a, write_a), ClientSession(read_a, write_a) as a:
+            async with mux(url) as (read_b, write_b), ClientSession(read_b, write_b) as b:
+                for _ in range(3):
+                    await asyncio.wait_for(asyncio.gather(a.send_ping(), b.send_ping()), 5)
+                assert mux.stats()[url]["sessions"] == 2
+
+    asyncio.run(scenario())
+
+    assert connections == [url]
+    assert len(set(posted_ids)) == 6
+    assert all(str(i).startswith("gw-") for i in posted_ids)
+    stats = mux.stats()[url]
+    assert stats["remapped"] == stats["routed"] == 6
+    # Six echoed requests plus six foreign responses
+    assert stats["dropped"] == 12
+    assert stats["in_flight"] == 0 and stats["sessions"] == 0
@@ -0,0 +1,90 @@
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+
+from scripts.mcp_gateway.stdio_client import PipelinedJsonRpcClient, StdioGatewayClient
+
+
+def test_pipelined_client_matches_out_of_order_responses_and_honors_window():
+    async def scenario():
+        written = []
+        client = None
+
+        async def write_line(line):
+            written.append(json.loads(line))
+            if len(written) == 3:
+                # Answer the first window in reverse order
+                for msg in reversed(written):
+                    client.dispatch({"jsonrpc": "2.0", "id": msg["id"], "result": {"echo": msg["params"]["n"]}})
+                written.clear()
+
+        client = PipelinedJsonRpcClient(write_line, window=3)
+        max_in_flight = 0
+
+        async def call(n):
+            nonlocal max_in_flight
+            task = asyncio.ensure_future(client.request("tools/call", {"n": n}, timeout=5.0))
+            await asyncio.sleep(0)
+            max_in_flight = max(max_in_flight, client.in_flight)
+            return await task
+
+        results = await asyncio.gather(*(call(n) for n in range(6)))
+        assert [r["result"]["echo"] for r in results] == list(range(6))
+        assert max_in_flight <= 3
+        assert client.in_flight == 0
+
+    asyncio.run(scenario())
+
+
+def test_request_batch_sends_one_line_and_splits_the_batch_response():
+    async def scenario():
+        lines = []
+        client = None
+
+        async def write_line(line):
+            lines.append(line)
+            batch = json.loads(line)
+            # Answered out of order, as one array
+            client.dispatch_line(json.dumps(
+                [{"jsonrpc": "2.0", "id": m["id"], "result": {"n": m["params"]["n"]}} for m in reversed(batch)]))
+
+        client = PipelinedJsonRpcClient(write_line, window=1)
+        results = await client.request_batch([("tools/call", {"n": n}) for n in range(4)], timeout=5.0)
+        assert [r["result"]["n"] for r in results] == [0, 1, 2, 3]
+        assert len(lines) == 1 and client.in_flight == 0
+
+    asyncio.run(scenario())
+
+
+# Stands in for a production gateway: readiness goes to --ready-fd only, never stdout
+_READY_FD_GATEWAY = """
+import os, sys
+fd = int(sys.argv[sys.argv.index('--ready-fd') + 1])
+if 'exit' not in sys.argv:
+    os.write(fd, b'GATEWAY_READY\\n')
+os.close(fd)
+sys.stdin.read()
+"""
+
+
+@pytest.mark.skipif(os.name != "posix", reason="the ready pipe is POSIX-only")
+def test_spawned_client_waits_on_the_ready_pipe():
+    async def scenario():
+        client = await StdioGatewayClient.spawn([sys.executable, "-c", _READY_FD_GATEWAY])
+        try:
+            await client.wait_ready(timeout=10.0)
+            assert client.unparsed_lines == []
+        finally:
+            await client.close()
+
+        client = await StdioGatewayClient.spawn([sys.executable, "-c", _READY_FD_GATEWAY, "exit"])
+        try:
+            with pytest.raises(ConnectionError, match="exited before it was ready"):
+                await client.wait_ready(timeout=10.0)
+        finally:
+            await client.close()
+
+    asyncio.run(scenario())
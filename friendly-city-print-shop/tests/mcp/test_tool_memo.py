@@ -0,0 +1,46 @@
+import mcp.types as types
+import pytest
+
+from scripts.mcp_gateway.tool_memo import ToolResultCache, parse_memoize_specs
+
+
+def _result(text, is_error=False):
+    return types.CallToolResult(content=[types.TextContent(type="text", text=text)], isError=is_error)
+
+
+def test_memo_keys_on_canonical_arguments_and_skips_errors():
+    now = [0.0]
+    cache = ToolResultCache({"echo": 10.0}, clock=lambda: now[0])
+
+    assert cache.put("echo", {"text": "hi", "n": 1}, _result("hi"))
+    assert cache.get("echo", {"n": 1, "text": "hi"}).content[0].text == "hi"
+    # Unlisted tools and error results are never stored
+    assert not cache.put("ask_pieces_ltm", {"question": "q"}, _result("answer"))
+    assert not cache.put("echo", {"text": "boom"}, _result("boom", is_error=True))
+    assert cache.get("echo", {"text": "boom"}) is None
+
+    now[0] = 11.0
+    assert cache.get("echo", {"text": "hi", "n": 1}) is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["entries"] == 0
+
+
+def test_memo_evicts_least_recently_used_by_bytes():
+    size = len(_result("a" * 100).model_dump_json(by_alias=True, exclude_none=True))
+    cache = ToolResultCache({"echo": 60.0}, max_bytes=2 * size)
+    for key in ("a", "b"):
+        cache.put("echo", {"k": key}, _result(key * 100))
+    cache.get("echo", {"k": "a"})
+    cache.put("echo", {"k": "c"}, _result("c" * 100))
+
+    assert cache.get("echo", {"k": "b"}) is None
+    assert cache.get("echo", {"k": "a"}) is not None
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["bytes_held"] <= 2 * size
+
+
+def test_parse_memoize_specs():
+    assert parse_memoize_specs(["echo=60", "other=0.5"]) == {"echo": 60.0, "other": 0.5}
+    for spec in ("echo", "echo=0", "echo=-5", "echo=nan", "echo=inf"):
+        with pytest.raises(ValueError):
+            parse_memoize_specs([spec])
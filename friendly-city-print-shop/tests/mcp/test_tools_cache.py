@@ -0,0 +1,76 @@
+import asyncio
+from types import SimpleNamespace
+
+import mcp.types as types
+
+from scripts.mcp_gateway.tools_cache import install_tools_list_cache
+
+
+def test_tools_list_cache_serves_hits_until_ttl_or_refresh():
+    fills = []
+
+    async def uncached_list_tools(req):
+        fills.append(req)
+        await asyncio.sleep(0.01)
+        return f"catalog-{len(fills)}"
+
+    async def update_tools(session, send_notification=True):
+        return None
+
+    gateway = SimpleNamespace(
+        server=SimpleNamespace(request_handlers={types.ListToolsRequest: uncached_list_tools}),
+        upstream=SimpleNamespace(update_tools=update_tools),
+    )
+    cache = install_tools_list_cache(gateway, ttl=60.0)
+    now = [0.0]
+    cache._clock = lambda: now[0]
+    handler = gateway.server.request_handlers[types.ListToolsRequest]
+
+    async def scenario():
+        # Concurrent misses share one fill
+        first = await asyncio.gather(*(handler(n) for n in range(5)))
+        assert first == ["catalog-1"] * 5
+        assert await handler(5) == "catalog-1"
+        # An upstream tool refresh drops the entry
+        await gateway.upstream.update_tools(None)
+        assert await handler(6) == "catalog-2"
+        now[0] = 61.0
+        assert await handler(7) == "catalog-3"
+
+    asyncio.run(scenario())
+    assert len(fills) == 3
+    assert (cache.hits, cache.misses, cache.invalidations) == (5, 3, 1)
+    assert install_tools_list_cache(gateway, ttl=0) is None
+
+
+def test_fill_in_flight_during_a_refresh_is_not_cached():
+    fills = []
+    filling = asyncio.Event()
+
+    async def uncached_list_tools(req):
+        fills.append(req)
+        filling.set()
+        await asyncio.sleep(0.01)
+        return f"catalog-{len(fills)}"
+
+    async def update_tools(session, send_notification=True):
+        return None
+
+    gateway = SimpleNamespace(
+        server=SimpleNamespace(request_handlers={types.ListToolsRequest: uncached_list_tools}),
+        upstream=SimpleNamespace(update_tools=update_tools),
+    )
+    install_tools_list_cache(gateway, ttl=60.0)
+    handler = gateway.server.request_handlers[types.ListToolsRequest]
+
+    async def scenario():
+        stale = asyncio.ensure_future(handler(0))
+        await filling.wait()
+        # The catalog changes while the first fill is still fetching
+        await gateway.upstream.update_tools(None)
+        assert await stale == "catalog-1"
+        assert await handler(1) == "catalog-2"
+        assert await handler(2) == "catalog-2"
+
+    asyncio.run(scenario())
+    assert len(fills) == 2
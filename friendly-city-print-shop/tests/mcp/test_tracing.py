@@ -0,0 +1,110 @@
+import asyncio
+import json
+import types as pytypes
+
+import pytest
+
+pytest.importorskip("mcp")
+pytest.importorskip("pieces")
+
+from mcp import ClientSession  # noqa: E402
+from mcp.server.lowlevel import Server  # noqa: E402
+
+from scripts.mcp_gateway import trace_report  # noqa: E402
+from scripts.mcp_gateway.mock_upstream import SSE_PATH, MockUpstream  # noqa: E402
+from scripts.mcp_gateway.tracing import Tracer, install_request_tracing, parse_traceparent  # noqa: E402
+
+CLIENT_TRACEPARENT = "00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01"
+
+
+def test_traceparent_round_trip():
+    context = parse_traceparent(CLIENT_TRACEPARENT)
+    assert context == ("0af7651916cd43dd8448eb211c80319c", "b7ad6b7169203331")
+    assert context.traceparent == CLIENT_TRACEPARENT
+    assert parse_traceparent("01-zz") is None and parse_traceparent(None) is None
+
+
+def test_stdio_request_is_traced_through_the_upstream(tmp_path, monkeypatch):
+    import mcp.server.stdio as stdio_mod
+    from pieces.mcp import gateway as pieces_gateway
+
+    # install_request_tracing patches these; restore them afterwards
+    monkeypatch.setattr(stdio_mod, "stdio_server", stdio_mod.stdio_server)
+    monkeypatch.setattr(pieces_gateway, "sse_client", pieces_gateway.sse_client)
+    monkeypatch.setattr(ClientSession, "send_request", ClientSession.send_request)
+
+    upstream = MockUpstream({"tools": {"slow": {"latency_ms": {"dist": "fixed", "value": 30}}}})
+    server = Server("tracing-test")
+    upstream_session = {}
+
+    @server.call_tool()
+    async def call_tool(name, arguments):
+        result = await upstream_session["session"].call_tool(name, arguments)
+        return result.content
+
+    path = tmp_path / "gateway.otlp.jsonl"
+    tracer = Tracer(str(path), flush_interval=0.05)
+    install_request_tracing(pytypes.SimpleNamespace(server=server), tracer)
+
+    requests = [
+        {"jsonrpc": "2.0", "id": 1, "method": "initialize", "params": {
+            "protocolVersion": "2024-11-05", "capabilities": {}, "clientInfo": {"name": "t", "version": "1"}}},
+        {"jsonrpc": "2.0", "method": "notifications/initialized"},
+        {"jsonrpc": "2.0", "id": 2, "method": "tools/call", "params": {
+            "name": "slow", "arguments": {"text": "hi"}, "_meta": {"traceparent": CLIENT_TRACEPARENT}}},
+    ]
+    written = []
+    done = asyncio.Event()
+
+    async def stdin():
+        for request in requests:
+            yield json.dumps(request) + "\n"
+        await done.wait()
+
+    class Stdout:
+        async def write(self, line):
+            written.append(json.loads(line))
+
+        async def flush(self):
+            if len(written) == 2:
+                done.set()
+
+    async def scenario():
+        http = await upstream.serve("127.0.0.1", 0)
+        url = f"http://127.0.0.1:{http.sockets[0].getsockname()[1]}{SSE_PATH}"
+        try:
+            async with pieces_gateway.sse_client(url) as (read, write), ClientSession(read, write) as session:
+                await session.initialize()
+                upstream_session["session"] = session
+                async with stdio_mod.stdio_server(stdin(), Stdout()) as (read_stream, write_stream):
+                    serving = asyncio.ensure_future(
+                        server.run(read_stream, write_stream, server.create_initialization_options()))
+                    await asyncio.wait_for(done.wait(), 10)
+                    serving.cancel()
+        finally:
+            http.close()
+            await http.wait_closed()
+
+    asyncio.run(asyncio.wait_for(scenario(), 30))
+    tracer.close()
+
+    assert written[1]["result"]["content"][0]["text"] == "hi"
+    spans = trace_report.load_spans([str(path)])
+    call = [s for s in spans if s["trace"] == "0af7651916cd43dd8448eb211c80319c"]
+    by_name = {s["name"]: s for s in call}
+    # ClientSession.call_tool may also list tools to validate the result
+    upstream_call = next(
+        s for s in call if s["name"] == "upstream.request" and s["attributes"]["rpc.method"] == "tools/call")
+    upstream_children = {s["name"]: s for s in call if s["parent"] == upstream_call["id"]}
+    # The client's context is the parent; every hop joined its trace
+    assert by_name["gateway.request"]["parent"] == "b7ad6b7169203331"
+    assert upstream_call["parent"] == by_name["gateway.handler"]["id"]
+    assert set(upstream_children) == {"upstream.post", "upstream.sse_wait"}
+    # The mock's 30ms latency starts while the POST is still being answered
+    assert upstream_children["upstream.post"]["seconds"] + upstream_children["upstream.sse_wait"]["seconds"] >= 0.03
+
+    summary = trace_report.summarize(spans)
+    phases = summary["tools/call:slow"]["phases"]
+    assert {"gateway.stdio.parse", "gateway.dispatch", "gateway.handler.local", "upstream.post",
+            "upstream.sse_wait", "gateway.stdio.write"} <= set(phases)
+    assert "slow" in trace_report.format_summary(summary)
@@ -0,0 +1,100 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+
+pytest.importorskip("pieces.mcp.gateway")
+
+from scripts.mcp_gateway import upstream  # noqa: E402
+
+
+def test_backoff_delay_grows_and_is_capped():
+    assert upstream.backoff_delay(0, 0.5, 30.0, rng=lambda: 0.0) == 0.25
+    assert upstream.backoff_delay(3, 0.5, 30.0, rng=lambda: 1.0) == 4.0
+    assert upstream.backoff_delay(20, 0.5, 30.0, rng=lambda: 1.0) == 30.0
+
+
+def test_connect_fails_fast_while_backing_off(monkeypatch):
+    attempts = []
+
+    @asynccontextmanager
+    async def refusing_sse_client(url, *args, **kwargs):
+        attempts.append(url)
+        raise ConnectionRefusedError("upstream down")
+        yield  # pragma: no cover
+
+    monkeypatch.setattr(upstream.pieces_gateway, "sse_client", refusing_sse_client)
+
+    async def scenario():
+        async def tools_changed():
+            pass
+
+        conn = upstream.ManagedPosMcpConnection(
+            "http://upstream.invalid/sse", tools_changed, pool_size=2, backoff_initial=60.0
+        )
+        try:
+            # The first call waits for the in-flight attempts to fail...
+            with pytest.raises(ConnectionError):
+                await conn.connect()
+            # ...later calls do not wait for the next attempt
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            with pytest.raises(ConnectionError, match="next reconnect attempt"):
+                await conn.connect()
+            assert loop.time() - started < 1.0
+            assert len(attempts) == 2
+        finally:
+            await conn.cleanup()
+
+    asyncio.run(scenario())
+
+
+def test_round_robin_across_upstreams_and_ejection(monkeypatch):
+    import anyio
+
+    down = set()
+
+    @asynccontextmanager
+    async def memory_sse_client(url, *args, **kwargs):
+        if url in down:
+            raise ConnectionRefusedError(url)
+        to_client, client_reads = anyio.create_memory_object_stream(10)
+        client_writes, from_client = anyio.create_memory_object_stream(10)
+        async with to_client, client_reads, client_writes, from_client:
+            yield client_reads, client_writes
+
+    monkeypatch.setattr(upstream.pieces_gateway, "sse_client", memory_sse_client)
+
+    async def scenario():
+        async def tools_changed():
+            pass
+
+        async def no_tool_discovery(session):
+            pass
+
+        connected = []
+        conn = upstream.ManagedPosMcpConnection(
+            "http://a/sse", tools_changed, upstream_urls=["http://a/sse", "http://b/sse"],
+            balance="round-robin", backoff_initial=60.0, on_connected=lambda: connected.append(True),
+        )
+        conn._prepare_primary = no_tool_discovery
+        try:
+            await conn.connect()
+            while not all(slot.session for slot in conn._slots):
+                await asyncio.sleep(0.01)
+            assert connected == [True]
+            picks = [conn._pick_slot().url for _ in range(4)]
+            assert picks[0] != picks[1] and picks[:2] == picks[2:]
+
+            down.add("http://b/sse")
+            conn._slots[1].mark_failed()
+            while conn._slots[1].session is not None:
+                await asyncio.sleep(0.01)
+            assert {conn._pick_slot().url for _ in range(4)} == {"http://a/sse"}
+            stats = conn.upstream_stats()
+            assert stats["http://b/sse"]["ejections"] == 1
+            assert stats["http://b/sse"]["live"] == 0
+        finally:
+            await conn.cleanup()
+
+    asyncio.run(scenario())